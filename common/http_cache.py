@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from flask import Response, current_app, request
+import hashlib
+import threading
+import gzip
+import uuid
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+class HttpCache:
+    """
+    A static class that builds conditional and compressed JSON (and HTML) responses.
+
+    Every cached payload is identified by a key (e.g. "stations") and a version
+    (e.g. the version of the table it was read from). The version is turned into
+    a strong ETag, so a client sending it back in If-None-Match gets a 304, and
+    the encoded bodies (identity, gzip, br) are kept in memory until the version
+    changes.
+    """
+
+    # Makes ETags from a previous run of the process invalid
+    __boot_id = uuid.uuid4().hex
+    __entries = OrderedDict()
+    __max_entries = 256
+    __min_compress_size = 1024
+    __lock = threading.Lock()
+
+    @classmethod
+    def json_response(cls, key: str, version, producer) -> Response:
+        """Builds a JSON response for a versioned payload
+
+        Args:
+            key (str): Name of the payload, unique per route and arguments
+            version: Version of the data behind the payload, None disables the ETag
+            producer (callable): Returns the object to serialize (or already serialised
+                                 JSON bytes), only called on a cache miss
+
+        Returns:
+            Response: 304 if the client already has this version, otherwise the
+                      (possibly compressed) JSON body
+        """
+        return cls.__cached_response(key, version, producer, "application/json")
+
+    @classmethod
+    def html_response(cls, key: str, version, producer) -> Response:
+        """Builds an HTML response for a versioned page, see json_response
+
+        Args:
+            key (str): Name of the page
+            version: Version of the data rendered in the page, None disables the ETag
+            producer (callable): Returns the rendered page, only called on a cache miss
+        """
+        return cls.__cached_response(key, version, lambda: producer().encode("utf-8"), "text/html")
+
+    @classmethod
+    def __cached_response(cls, key: str, version, producer, mimetype: str) -> Response:
+        """Builds a conditional, compressed and cached response of the given type"""
+        encoding = cls.__negotiate_encoding()
+
+        if version is None:
+            raw = cls.__serialize(producer())
+            return cls.__build_response(*cls.__encode(raw, encoding), None, mimetype)
+
+        etag = cls.__make_etag(key, version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.headers["Vary"] = "Accept-Encoding"
+            return response
+
+        with cls.__lock:
+            entry = cls.__entries.get(key)
+            if entry and entry["etag"] == etag:
+                cls.__entries.move_to_end(key)
+                encoded = entry["bodies"].get(encoding)
+                if encoded is not None:
+                    return cls.__build_response(*encoded, etag, mimetype)
+                raw = entry["bodies"]["identity"][0]
+            else:
+                raw = None
+
+        cacheable = True
+        if raw is None:
+            data = producer()
+            raw = cls.__serialize(data)
+            # Empty payloads are also what Database returns on errors, never keep them
+            cacheable = bool(data) and raw != b"[]"
+
+        encoded = cls.__encode(raw, encoding)
+        if not cacheable:
+            return cls.__build_response(*encoded, None, mimetype)
+
+        with cls.__lock:
+            entry = cls.__entries.get(key)
+            if not entry or entry["etag"] != etag:
+                entry = {"etag": etag, "bodies": {"identity": (raw, "identity")}}
+                cls.__entries[key] = entry
+            entry["bodies"][encoding] = encoded
+            cls.__entries.move_to_end(key)
+            while len(cls.__entries) > cls.__max_entries:
+                cls.__entries.popitem(last=False)
+
+        return cls.__build_response(*encoded, etag, mimetype)
+
+    @classmethod
+    def __serialize(cls, data) -> bytes:
+        """Encodes the payload as JSON bytes, pre-serialised payloads are kept as-is"""
+        if isinstance(data, bytes):
+            return data
+        return current_app.json.dumps_bytes(data)
+
+    @classmethod
+    def __make_etag(cls, key: str, version) -> str:
+        """Derives an opaque strong ETag from the key and version"""
+        digest = hashlib.blake2b(
+            f"{cls.__boot_id}:{key}:{version}".encode("utf-8"), digest_size=16
+        )
+        return digest.hexdigest()
+
+    @classmethod
+    def __negotiate_encoding(cls) -> str:
+        """Chooses the best content encoding accepted by the client"""
+        accepted = request.accept_encodings
+        if brotli is not None and accepted.quality("br") > 0:
+            return "br"
+        if accepted.quality("gzip") > 0:
+            return "gzip"
+        return "identity"
+
+    @classmethod
+    def __encode(cls, raw: bytes, encoding: str) -> tuple:
+        """Compresses the raw body, returning the body and the encoding actually used"""
+        # Small bodies are sent as-is, compressing them is rarely worth it
+        if len(raw) < cls.__min_compress_size:
+            return raw, "identity"
+        if encoding == "br":
+            return brotli.compress(raw, quality=6), "br"
+        if encoding == "gzip":
+            return gzip.compress(raw, compresslevel=6), "gzip"
+        return raw, "identity"
+
+    @classmethod
+    def __build_response(cls, body: bytes, encoding: str, etag, mimetype: str) -> Response:
+        """Wraps an encoded body in a Flask response"""
+        response = Response(body, mimetype=mimetype)
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Vary"] = "Accept-Encoding"
+        if etag:
+            response.set_etag(etag)
+        return response
@@ -0,0 +1,147 @@
+from flask.json.provider import DefaultJSONProvider
+from flask import Response, current_app
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the standard json module is always available
+    orjson = None
+
+
+# Shared by the processor, ML and dashboard services: each image copies common/ (see docker-compose.yml)
+
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+ORJSON_OPTIONS = (
+    (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    if orjson
+    else 0
+)
+
+
+def http_date(value: datetime.date) -> str:
+    """Formats a date or datetime as an HTTP date, naive datetimes being in UTC
+
+    The same as werkzeug.http.http_date, which Flask uses, several times faster.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc)
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour = minute = second = 0
+    return (
+        f"{WEEKDAYS[value.weekday()]}, {value.day:02d} {MONTHS[value.month - 1]} {value.year:04d} "
+        f"{hour:02d}:{minute:02d}:{second:02d} GMT"
+    )
+
+
+def default(value):
+    """Converts the values JSON has no type for, like Flask does
+
+    Dates become HTTP dates, decimals and UUIDs strings, dataclasses objects and
+    NumPy arrays and scalars lists and numbers.
+    """
+    if isinstance(value, datetime.date):
+        return http_date(value)
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    # NumPy arrays orjson does not take directly (not contiguous, object dtype...)
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value, sort_keys: bool = True, indent: bool = False) -> bytes:
+    """Serialises a value to UTF-8 JSON bytes
+
+    NaN and infinities become null with orjson, which is valid JSON.
+
+    Args:
+        value: The value, which can hold dates, decimals, UUIDs, dataclasses and NumPy values
+        sort_keys (bool): Sort the keys of the objects, like Flask does
+        indent (bool): Indent with two spaces instead of the compact form
+    """
+    if orjson is None:
+        return json.dumps(
+            value,
+            default=default,
+            sort_keys=sort_keys,
+            ensure_ascii=False,
+            indent=2 if indent else None,
+            separators=None if indent else (",", ":"),
+        ).encode("utf-8")
+    options = ORJSON_OPTIONS
+    if sort_keys:
+        options |= orjson.OPT_SORT_KEYS
+    if indent:
+        options |= orjson.OPT_INDENT_2
+    return orjson.dumps(value, default=default, option=options)
+
+
+def loads(data):
+    """Parses JSON text or bytes
+
+    Documents orjson rejects are parsed again by the json module, which also
+    takes the NaN and Infinity that Python's json (e.g. in requests) writes.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    A Flask JSON provider that serialises with orjson: jsonify, request.get_json
+    and HttpCache all go through it once it is set as app.json. The output is the
+    same as Flask's (sorted keys, HTTP dates, compact unless in debug mode), but
+    NumPy values need no conversion and non-ASCII characters are not escaped.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def dumps_bytes(self, obj) -> bytes:
+        """Serialises a value to JSON bytes, without going through str"""
+        return dumps(obj, self.sort_keys, self.__indent())
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+    def __indent(self) -> bool:
+        return self.compact is False or (self.compact is None and self._app.debug)
+
+
+def passthrough_response(body: bytes, status: int = 200) -> Response:
+    """Forwards a JSON body received from another service as-is, without parsing it
+
+    Args:
+        body (bytes): The JSON body, e.g. the content of a requests response
+        status (int, optional): Status of the response, 200 by default
+
+    Returns:
+        Response: The body, as application/json
+    """
+    return current_app.response_class(body, status=status, mimetype="application/json")
@@ -0,0 +1,139 @@
+from flask import request
+import contextlib
+import threading
+import logging
+import time
+
+# Shared by the processor and ML services: each image copies common/ (see docker-compose.yml)
+
+# Retry delay of a failed startup, doubled up to the maximum
+RETRY_SECONDS = 1
+MAX_RETRY_SECONDS = 30
+
+# Routes of the probes, left out of the first-request latencies
+PROBE_ENDPOINTS = ("healthz", "readyz")
+
+
+class Startup:
+    """
+    Runs the startup of a service in the background and reports how long it
+    took: the service answers /healthz as soon as it is imported, and /readyz
+    once the startup has finished. The time to ready, the time of each phase
+    and the latency of the first request of each route are logged and exposed
+    by status().
+    """
+
+    __logger = logging.getLogger("startup")
+    __logger.setLevel(logging.INFO)
+
+    __started_at = time.monotonic()
+    __ready = threading.Event()
+    __lock = threading.Lock()
+    __thread = None
+    __time_to_ready = None
+    __phases = {}
+    __attempts = 0
+    __error = None
+    __first_requests = {}
+
+    @classmethod
+    @contextlib.contextmanager
+    def phase(cls, name: str):
+        """Times a step of the startup, e.g. `with Startup.phase("init_db"): ...`
+
+        Args:
+            name (str): Name of the step, a step run again keeps its last time
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with cls.__lock:
+                cls.__phases[name] = round(time.monotonic() - start, 4)
+
+    @classmethod
+    def start(cls, target):
+        """Runs the startup in a daemon thread, retrying it until it succeeds
+
+        Args:
+            target: Function running the startup, which raises if it failed
+        """
+        if cls.__thread is not None:
+            return
+        cls.__thread = threading.Thread(target=cls.__run, args=(target,), name="startup", daemon=True)
+        cls.__thread.start()
+
+    @classmethod
+    def __run(cls, target):
+        delay = RETRY_SECONDS
+        while True:
+            cls.__attempts += 1
+            try:
+                target()
+                break
+            except Exception as e:
+                cls.__error = str(e)
+                cls.__logger.error(f"Startup failed, retrying in {delay}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_SECONDS)
+        cls.__error = None
+        cls.__time_to_ready = round(time.monotonic() - cls.__started_at, 4)
+        cls.__ready.set()
+        phases = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in cls.__phases.items())
+        cls.__logger.info(f"Ready in {cls.__time_to_ready:.3f}s ({phases})")
+
+    @classmethod
+    def is_ready(cls) -> bool:
+        """Returns True once the startup has finished"""
+        return cls.__ready.is_set()
+
+    @classmethod
+    def wait(cls, timeout=None) -> bool:
+        """Waits for the startup to finish
+
+        Returns:
+            bool: True if the service is ready
+        """
+        return cls.__ready.wait(timeout)
+
+    @classmethod
+    def status(cls) -> dict:
+        """Returns the state of the startup, as reported by /readyz"""
+        with cls.__lock:
+            return {
+                "ready": cls.__ready.is_set(),
+                "uptime_s": round(time.monotonic() - cls.__started_at, 4),
+                "time_to_ready_s": cls.__time_to_ready,
+                "attempts": cls.__attempts,
+                "error": cls.__error,
+                "phases": dict(cls.__phases),
+                "first_request_ms": dict(cls.__first_requests),
+            }
+
+    @classmethod
+    def instrument(cls, app):
+        """Records the latency of the first request of each route of a Flask app"""
+
+        @app.before_request
+        def start_timer():
+            request.environ["startup.start"] = time.perf_counter()
+
+        @app.after_request
+        def record_first_request(response):
+            endpoint = request.endpoint
+            start = request.environ.get("startup.start")
+            # Requests turned away while starting are not the first served
+            if endpoint is None or endpoint in PROBE_ENDPOINTS or start is None or response.status_code == 503:
+                return response
+            if endpoint in cls.__first_requests:
+                return response
+            elapsed = round((time.perf_counter() - start) * 1000, 3)
+            with cls.__lock:
+                if endpoint in cls.__first_requests:
+                    return response
+                cls.__first_requests[endpoint] = elapsed
+            cls.__logger.info(
+                f"First request to {endpoint}: {elapsed:.3f} ms, "
+                f"{time.monotonic() - cls.__started_at:.3f}s after start"
+            )
+            return response
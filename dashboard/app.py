@@ -1,5 +1,8 @@
-from processor_requester import ProcessorRequester
+from processor_requester import ProcessorRequester, time_range_query
+from http_cache import HttpCache
+from json_provider import FastJSONProvider, passthrough_response
 from flask import Flask, render_template, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import signal
 import sys
@@ -13,6 +16,7 @@ def handle_exit(signum, frame):
 
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Create logger
 __app_logger = logging.getLogger("dashboard-server")
@@ -22,6 +26,79 @@ __app_logger.setLevel(logging.INFO)
 signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
+# Runs the Processor requests of a page load concurrently, so the first render waits
+# for the slowest of them instead of their sum
+processor_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="processor-request")
+
+
+def all_stations_view(stations: list) -> list:
+    """Returns the stations as shown on the map when no user is selected"""
+    return [
+        {
+            "station_id": station.get("station_id"),
+            "latitude": station.get("latitude"),
+            "longitude": station.get("longitude"),
+            "visited": False,
+        }
+        for station in stations
+    ]
+
+
+def gather_bootstrap() -> tuple:
+    """Fetches everything the first render of the dashboard needs from the Processor
+
+    The headers, users, sessions of all users (the table, stats and charts are built
+    from them) and the stations of the map are requested concurrently.
+
+    Returns:
+        tuple: The payload, its version (the Processor ETags of its parts, None if
+               one of them has no ETag) and the raw Processor bodies of the parts
+               that are forwarded unchanged
+    """
+    # Path of each part and its value when the request fails
+    requests_by_part = {
+        "headers": ("/get_headers", None),
+        "users": ("/get_users", []),
+        "info": ("/get_all_users_info", {}),
+        "stations": ("/get_stations", None),
+    }
+    futures = {
+        part: processor_executor.submit(ProcessorRequester.get_response, path)
+        for part, (path, _) in requests_by_part.items()
+    }
+    # Each part keeps the body and ETag of the response it was decoded from, so the
+    # version always matches the data even if another request refreshes the route
+    responses = {
+        part: future.result() or (requests_by_part[part][1], None, None)
+        for part, future in futures.items()
+    }
+
+    payload = {part: data for part, (data, _, _) in responses.items()}
+    if payload["stations"]:
+        payload["stations"] = all_stations_view(payload["stations"])
+
+    versions = [etag for _, _, etag in responses.values()]
+    version = ":".join(versions) if all(versions) else None
+    bodies = {part: body for part, (_, body, _) in responses.items() if part != "stations"}
+    return payload, version, bodies
+
+
+def bootstrap_json(payload: dict, bodies: dict) -> bytes:
+    """Serialises the bootstrap payload, splicing in the Processor bodies as they were received
+
+    Args:
+        payload (dict): The decoded parts
+        bodies (dict): Raw JSON bodies of the parts forwarded unchanged, None if unknown
+
+    Returns:
+        bytes: The JSON object, with its keys sorted like any other response
+    """
+    members = [
+        app.json.dumps_bytes(part) + b":" + (bodies.get(part) or app.json.dumps_bytes(payload[part]))
+        for part in sorted(payload)
+    ]
+    return b"{" + b",".join(members) + b"}"
+
 
 # ===========
 #  Routes
@@ -31,12 +108,29 @@ def index() -> str:
     """Main dashboard page
 
     Returns:
-        str: html page (index.html)
+        Response: html page (index.html), with the bootstrap payload embedded so the
+                  first render needs no further requests
     """
-    headers = ProcessorRequester.get_headers()
-    # Get list of users for the filter
-    users = ProcessorRequester.get_all_users()
-    return render_template("index.html", headers=headers, users=users)
+    payload, version, _ = gather_bootstrap()
+    return HttpCache.html_response(
+        "index",
+        version,
+        lambda: render_template(
+            "index.html", headers=payload["headers"], users=payload["users"], bootstrap=payload
+        ),
+    )
+
+
+@app.route("/bootstrap", methods=["GET"])
+def bootstrap():
+    """Route that gives everything the first render needs in one response
+
+    Returns:
+        Response: JSON with the headers, users, sessions of all users (info) and
+                  the stations of the map
+    """
+    payload, version, bodies = gather_bootstrap()
+    return HttpCache.json_response("bootstrap", version, lambda: bootstrap_json(payload, bodies))
 
 
 @app.route("/get_info", methods=["GET"])
@@ -47,14 +141,23 @@ def info():
         Response: all info given by processor api for the specified user or all users
     """
     username = request.args.get("username")
+    # Optional time range, checked by the processor
+    start = request.args.get("from")
+    end = request.args.get("to")
+    query = time_range_query(start, end)
     if not username or username == "ALL_USERS":
         # If no username provided, return data for all users
-        data = ProcessorRequester.get_all_users_info()
-        return jsonify(data)
+        path = f"/get_all_users_info{query}"
+        data = ProcessorRequester.get_all_users_info(start, end)
+        key = f"all_users_info{query}"
     else:
         # Get data for specific user
-        data = ProcessorRequester.get_user_info(username)
-        return jsonify(data)
+        path = f"/get_user_info/{username}{query}"
+        data = ProcessorRequester.get_user_info(username, start, end)
+        key = f"user_info:{username}{query}"
+    # The Processor body is forwarded as received, without serialising it again
+    body = ProcessorRequester.get_body(path)
+    return HttpCache.json_response(key, ProcessorRequester.get_version(path), lambda: body or data)
 
 
 @app.route("/get_stations", methods=["GET"])
@@ -68,19 +171,15 @@ def get_stations():
     if not username or username == "ALL_USERS":
         data = ProcessorRequester.get_stations()
         if data:
-            stations = [
-                {
-                    "station_id": station.get("station_id"),
-                    "latitude": station.get("latitude"),
-                    "longitude": station.get("longitude"),
-                    "visited": False,
-                }
-                for station in data
-            ]
-            return jsonify(stations)
+            version = ProcessorRequester.get_version("/get_stations")
+            return HttpCache.json_response("stations", version, lambda: all_stations_view(data))
     else:
         data = ProcessorRequester.get_stations_for_user(username)
-        return jsonify(data)
+        path = f"/get_stations_for_user/{username}"
+        body = ProcessorRequester.get_body(path)
+        return HttpCache.json_response(
+            f"stations_for_user:{username}", ProcessorRequester.get_version(path), lambda: body or data
+        )
 
 
 @app.route("/get_users", methods=["GET"])
@@ -91,7 +190,8 @@ def get_users():
         Response: JSON response containing all users
     """
     users = ProcessorRequester.get_all_users()
-    return jsonify({"users": users})
+    version = ProcessorRequester.get_version("/get_users")
+    return HttpCache.json_response("users", version, lambda: {"users": users})
 
 
 @app.route("/classify", methods=['POST'])
@@ -106,10 +206,16 @@ def classify():
     if not feat1 or not feat2:
         return jsonify({"error": "Missing feat1 or feat2 in JSON body"}), 400
 
-    data = ProcessorRequester.classify(feat1, feat2)
+    options = {
+        option: json_data[option]
+        for option in ("mode", "max_points", "grid_size", "from", "to")
+        if option in json_data
+    }
+    data = ProcessorRequester.classify(feat1, feat2, options)
 
     if data:
-        return jsonify(data)
+        # Forwarded as received from the processor
+        return passthrough_response(data)
     else:
         return jsonify({"error": "Failed to get classification from processor"}), 500
 
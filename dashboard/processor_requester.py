@@ -1,25 +1,51 @@
+from collections import OrderedDict
 from functools import wraps
+from urllib.parse import urlencode
+from json_provider import loads
 import requests
+import threading
 import logging
 import time
 
 
 class Cache:
-    def __init__(self, max_age_seconds: float) -> None:
+    def __init__(self, max_age_seconds: float, max_entries: int = 256) -> None:
         self.__max_age_seconds = max_age_seconds
+        self.__max_entries = max_entries
 
     def __call__(self, func):
+        # Values are kept per call arguments, so different users never share an entry.
+        # Arguments come from the clients (user ids, time ranges), so the least
+        # recently used entries are dropped past max_entries
+        cache = OrderedDict()
+        lock = threading.Lock()
+
         @wraps(func)
         def wrapper(*args, **kwargs):
-            if not hasattr(func, "__cache_value") or self.__is_expired(func):
-                func.__cache_value = func(*args, **kwargs)
-                func.__cache_timestamp = time.time()
-            return func.__cache_value
+            key = (args[1:], tuple(sorted(kwargs.items())))
+            with lock:
+                entry = cache.get(key)
+                if entry is not None and not self.__is_expired(entry[1]):
+                    cache.move_to_end(key)
+                    return entry[0]
+            value = func(*args, **kwargs)
+            with lock:
+                cache[key] = (value, time.time())
+                cache.move_to_end(key)
+                while len(cache) > self.__max_entries:
+                    cache.popitem(last=False)
+            return value
 
         return wrapper
 
-    def __is_expired(self, func) -> bool:
-        return time.time() - func.__cache_timestamp > self.__max_age_seconds
+    def __is_expired(self, timestamp: float) -> bool:
+        return time.time() - timestamp > self.__max_age_seconds
+
+
+def time_range_query(start=None, end=None) -> str:
+    """Builds the from/to query string of a time-bounded Processor route, empty if unbounded"""
+    params = {name: value for name, value in (("from", start), ("to", end)) if value}
+    return f"?{urlencode(params)}" if params else ""
 
 
 class ProcessorRequester:
@@ -27,32 +53,131 @@ class ProcessorRequester:
     __logger = logging.getLogger("processor_requester")
     __logger.setLevel(logging.INFO)
 
+    # Last ETag, decoded body and raw body received per path, used for conditional
+    # requests and to forward the body without serialising it again. Paths hold
+    # client arguments, so only the most recently used ones are kept
+    __etags = OrderedDict()
+    __max_etags = 256
+    __etags_lock = threading.Lock()
+
+    @classmethod
+    def __get_json(cls, path: str):
+        """Makes a conditional GET to the Processor and returns the decoded body, see __fetch"""
+        return cls.__fetch(path)[0]
+
+    @classmethod
+    def __fetch(cls, path: str):
+        """Makes a conditional GET to the Processor, reusing the last body on a 304
+
+        Args:
+            path (str): Path of the Processor route
+
+        Returns:
+            tuple: The decoded JSON body, the raw body (None without an ETag) and
+                   the ETag (None if the Processor sent none), all of one response
+
+        Raises:
+            requests.exceptions.RequestException: If the request fails
+        """
+        cached = cls.__get_cached(path)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        response = requests.get(f"{cls.__base_url}{path}", headers=headers)
+        if response.status_code == 304 and cached:
+            return cached[1], cached[2], cached[0]
+        response.raise_for_status()
+
+        data = loads(response.content)
+        etag = response.headers.get("ETag")
+        with cls.__etags_lock:
+            if etag:
+                cls.__etags[path] = (etag, data, response.content)
+                cls.__etags.move_to_end(path)
+                while len(cls.__etags) > cls.__max_etags:
+                    cls.__etags.popitem(last=False)
+            else:
+                cls.__etags.pop(path, None)
+        return data, (response.content if etag else None), etag
+
+    @classmethod
+    def __get_cached(cls, path: str):
+        """Returns the (ETag, data, raw body) last received from a path, None if not kept"""
+        with cls.__etags_lock:
+            cached = cls.__etags.get(path)
+            if cached:
+                cls.__etags.move_to_end(path)
+            return cached
+
+    @classmethod
+    def get_version(cls, path: str):
+        """Returns the ETag of the last body received from a Processor route
+
+        Args:
+            path (str): Path of the Processor route
+
+        Returns:
+            str: The ETag, None if the route has not been fetched or has no ETag
+        """
+        cached = cls.__get_cached(path)
+        return cached[0] if cached else None
+
+    @classmethod
+    def get_body(cls, path: str):
+        """Returns the raw JSON body of the last response of a Processor route
+
+        Args:
+            path (str): Path of the Processor route
+
+        Returns:
+            bytes: The body, None if the route has not been fetched or has no ETag
+        """
+        cached = cls.__get_cached(path)
+        return cached[2] if cached else None
+
+    @classmethod
+    @Cache(max_age_seconds=5)
+    def get_response(cls, path: str):
+        """Get the body of a Processor route together with its raw body and ETag with caching (5 sec)
+
+        The three come from the same response, unlike get_version and get_body that
+        return the last ones received, which a concurrent request may have replaced.
+
+        Args:
+            path (str): Path of the Processor route
+
+        Returns:
+            tuple: The decoded body, the raw body (None without an ETag) and the ETag
+                   (None if the Processor sent none), None if an error occurs
+        """
+        try:
+            return cls.__fetch(path)
+        except requests.exceptions.RequestException as e:
+            cls.__logger.error(f"Error fetching {path}: {e}")
+            return None
+
     @classmethod
     @Cache(max_age_seconds=30 * 60)
     def get_headers(cls):
         try:
-            response = requests.get(f"{cls.__base_url}/get_headers")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json("/get_headers")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching headers: {e}")
             return None
 
     @classmethod
     @Cache(max_age_seconds=5)
-    def get_user_info(cls, user_id: str):
+    def get_user_info(cls, user_id: str, start: str = None, end: str = None):
         """Get all information for a specific user from the Processor service with caching (5 sec)
 
         Args:
             user_id (str): The ID of the user to get information for.
+            start (str, optional): Only sessions started at or after this ISO date/datetime.
+            end (str, optional): Only sessions started before this ISO date/datetime.
 
         Returns:
             list[list]: All info from processor if successful, empty list if an error occurs
         """
         try:
-            response = requests.get(f"{cls.__base_url}/get_user_info/{user_id}")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json(f"/get_user_info/{user_id}{time_range_query(start, end)}")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching all info: {e}")
             return None
@@ -66,9 +191,7 @@ class ProcessorRequester:
             list[dict]: List of stations with their ID, latitude and longitude if successful, None if an error occurs
         """
         try:
-            response = requests.get(f"{cls.__base_url}/get_stations")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json("/get_stations")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching stations: {e}")
             return None
@@ -85,9 +208,7 @@ class ProcessorRequester:
             list[dict]: List of stations with their ID, latitude, longitude and visit status if successful, None if an error occurs
         """
         try:
-            response = requests.get(f"{cls.__base_url}/get_stations_for_user/{user_id}")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json(f"/get_stations_for_user/{user_id}")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching stations for user: {e}")
             return None
@@ -101,38 +222,48 @@ class ProcessorRequester:
             list[str]: List of all user IDs if successful, empty list if an error occurs
         """
         try:
-            response = requests.get(f"{cls.__base_url}/get_users")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json("/get_users")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching users: {e}")
             return []
 
     @classmethod
     @Cache(max_age_seconds=5)
-    def get_all_users_info(cls):
+    def get_all_users_info(cls, start: str = None, end: str = None):
         """Get all information for all users from the Processor service with caching (5 sec)
 
+        Args:
+            start (str, optional): Only sessions started at or after this ISO date/datetime.
+            end (str, optional): Only sessions started before this ISO date/datetime.
+
         Returns:
             dict: All info from processor for all users if successful, empty dict if an error occurs
         """
         try:
-            response = requests.get(f"{cls.__base_url}/get_all_users_info")
-            response.raise_for_status()
-            return response.json()
+            return cls.__get_json(f"/get_all_users_info{time_range_query(start, end)}")
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error fetching all users info: {e}")
             return {}
 
     @classmethod
-    def classify(cls, feat1, feat2):
+    def classify(cls, feat1, feat2, options=None):
         """
         Requests clustering from the processor service.
+
+        Args:
+            feat1 (str): Name of the first feature.
+            feat2 (str): Name of the second feature.
+            options (dict, optional): Response mode options (mode, max_points, grid_size)
+                                      and the from/to time range.
+
+        Returns:
+            bytes: The JSON body of the clustering, to be forwarded as-is, None if an error occurs
         """
         try:
-            response = requests.post(f"{cls.__base_url}/classify", json={"feat1": feat1, "feat2": feat2})
+            payload = {"feat1": feat1, "feat2": feat2, **(options or {})}
+            response = requests.post(f"{cls.__base_url}/classify", json=payload)
             response.raise_for_status()
-            return response.json()
+            return response.content
         except requests.exceptions.RequestException as e:
             cls.__logger.error(f"Error making classify request: {e}")
             return None
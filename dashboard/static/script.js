@@ -4,6 +4,8 @@ let sessionsChart = null;
 let allUsersData = [];
 let currentTableData = [];
 let currentHeaders = [];
+// Stations of the first map render, taken from the bootstrap payload
+let bootstrapStations = null;
 
 // Function to update statistics cards with calculated data
 function updateStats(calculatedStats) {
@@ -270,6 +272,48 @@ async function initialLoad() {
     }
 }
 
+// Reads the payload embedded in the page, falling back to the /bootstrap route
+async function loadBootstrap() {
+    const embedded = document.getElementById('bootstrap-data');
+    if (embedded) {
+        try {
+            return JSON.parse(embedded.textContent);
+        } catch (error) {
+            console.error('Error reading the embedded bootstrap data:', error);
+        }
+    }
+    const response = await fetch('/bootstrap');
+    return await response.json();
+}
+
+// First render from a single payload, parts missing from it are fetched as before
+async function bootstrapLoad() {
+    let bootstrap = null;
+    try {
+        bootstrap = await loadBootstrap();
+    } catch (error) {
+        console.error('Error fetching bootstrap data:', error);
+    }
+
+    if (bootstrap && Array.isArray(bootstrap.users)) {
+        fillUserDropdown(bootstrap.users);
+    } else {
+        await populateUserDropdown();
+    }
+
+    if (bootstrap && Array.isArray(bootstrap.stations)) {
+        bootstrapStations = bootstrap.stations;
+    }
+
+    if (bootstrap && bootstrap.info && Array.isArray(bootstrap.info.data)) {
+        allUsersData = bootstrap.info.data;
+        currentHeaders = bootstrap.info.headers;
+        updateDashboard();
+    } else {
+        await initialLoad();
+    }
+}
+
 let stationsMap = null;
 let markers = [];
 let currentUsername = null;
@@ -295,8 +339,15 @@ async function loadStationsMap() {
 
     try {
         const selectedUser = document.getElementById('user-filter').value;
-        const response = await fetch(`/get_stations?username=${encodeURIComponent(selectedUser)}`);
-        const stations = await response.json();
+        let stations;
+        if (bootstrapStations && selectedUser === 'ALL_USERS') {
+            // Only the first render uses them, later ones get the current stations
+            stations = bootstrapStations;
+            bootstrapStations = null;
+        } else {
+            const response = await fetch(`/get_stations?username=${encodeURIComponent(selectedUser)}`);
+            stations = await response.json();
+        }
 
         if (stations && stations.length > 0) {
             const locationGroups = {};
@@ -347,28 +398,31 @@ async function loadStationsMap() {
     }
 }
 
+function fillUserDropdown(users) {
+    users = [...users];
+    users.sort((a, b) => {
+        const idA = parseInt(a.replace('User_', ''), 10) || 0;
+        const idB = parseInt(b.replace('User_', ''), 10) || 0;
+        return idA - idB;
+    });
+
+    const userFilter = document.getElementById('user-filter');
+    if (userFilter) {
+        userFilter.innerHTML = '<option value="ALL_USERS" selected>All Users</option>';
+        users.forEach(user => {
+            const option = document.createElement('option');
+            option.value = user;
+            option.textContent = user;
+            userFilter.appendChild(option);
+        });
+    }
+}
+
 async function populateUserDropdown() {
     try {
         const response = await fetch('/get_users');
         const result = await response.json();
-        let users = result.users || [];
-
-        users.sort((a, b) => {
-            const idA = parseInt(a.replace('User_', ''), 10) || 0;
-            const idB = parseInt(b.replace('User_', ''), 10) || 0;
-            return idA - idB;
-        });
-
-        const userFilter = document.getElementById('user-filter');
-        if (userFilter) {
-            userFilter.innerHTML = '<option value="ALL_USERS" selected>All Users</option>';
-            users.forEach(user => {
-                const option = document.createElement('option');
-                option.value = user;
-                option.textContent = user;
-                userFilter.appendChild(option);
-            });
-        }
+        fillUserDropdown(result.users || []);
     } catch (error) {
         console.error('Error fetching users:', error);
     }
@@ -384,7 +438,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         document.getElementById('user-filter').addEventListener('change', updateDashboard);
         
-        populateUserDropdown().then(initialLoad);
+        bootstrapLoad();
     }
 
 
@@ -399,6 +453,7 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     let clusterChart = null;
+    const CLUSTER_CHART_MAX_POINTS = 2000;
 
     function drawClusterChart(data, feat1, feat2) {
         const ctx = document.getElementById('clusterChart').getContext('2d');
@@ -470,7 +525,8 @@ document.addEventListener('DOMContentLoaded', function () {
             const response = await fetch('/classify', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ feat1, feat2 })
+                // A stratified sample per cluster is enough for the scatter plot
+                body: JSON.stringify({ feat1, feat2, mode: 'sample', max_points: CLUSTER_CHART_MAX_POINTS })
             });
 
             if (!response.ok) throw new Error('Failed to get classification data');
@@ -1,8 +1,12 @@
 from flask import Flask, request, jsonify
+from json_provider import FastJSONProvider
+from startup import Startup
 import logging
 import signal
 import sys
-from ml import perform_clustering
+
+# pandas, scikit-learn and SciPy (ml, preprocessing) are imported by load_models in
+# the background, so the server is up while they load; /classify waits for them
 
 
 def handle_exit(signum, frame):
@@ -13,6 +17,7 @@ def handle_exit(signum, frame):
 
 # Initialize Flask application
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
 # Create logger for the processor server
 __app_logger = logging.getLogger("processor-server")
@@ -23,8 +28,38 @@ signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
 
+def load_models():
+    """Imports the clustering modules and runs them once on synthetic data"""
+    with Startup.phase("imports"):
+        import ml
+    with Startup.phase("warm_up"):
+        ml.warm_up()
+
+
+# Time the first request of each route, to report the cold-start latency
+Startup.instrument(app)
+Startup.start(load_models)
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness probe, answers as soon as the server is up"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness probe, 200 once the clustering modules are imported and warmed up"""
+    status = Startup.status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
 @app.route("/classify", methods=["POST"])
 def classify():
+    import pandas as pd
+    from ml import perform_clustering, RESPONSE_MODES, DEFAULT_MAX_POINTS, DEFAULT_GRID_SIZE, ENGINES
+    from preprocessing import FEATURE_KINDS
+
     payload = request.get_json()
     if not payload:
         return jsonify({"error": "Invalid JSON"}), 400
@@ -42,16 +77,33 @@ def classify():
     if len(feat1_list) != len(feat2_list):
         return jsonify({"error": "feat1_list and feat2_list must have the same length"}), 400
 
-    # Reconstruct data in the format expected by perform_clustering
-    data = []
-    for i in range(len(feat1_list)):
-        data.append({
-            feat1_name: feat1_list[i],
-            feat2_name: feat2_list[i]
-        })
+    # The full point list is only returned when explicitly requested
+    mode = payload.get("mode", "summary")
+    if mode not in RESPONSE_MODES:
+        return jsonify({"error": f"mode must be one of: {', '.join(RESPONSE_MODES)}"}), 400
+    try:
+        max_points = int(payload.get("max_points", DEFAULT_MAX_POINTS))
+        grid_size = int(payload.get("grid_size", DEFAULT_GRID_SIZE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_points and grid_size must be integers"}), 400
+    if not 1 <= max_points <= 100000 or not 2 <= grid_size <= 512:
+        return jsonify({"error": "max_points must be in [1, 100000] and grid_size in [2, 512]"}), 400
+
+    engine = payload.get("engine", "auto")
+    if engine not in ENGINES:
+        return jsonify({"error": f"engine must be one of: {', '.join(ENGINES)}"}), 400
+    validate = bool(payload.get("validate", False))
+
+    # Feature kinds, inferred from the values when not given
+    kinds = {feat1_name: payload.get("feat1_type"), feat2_name: payload.get("feat2_type")}
+    if any(kind is not None and kind not in FEATURE_KINDS for kind in kinds.values()):
+        return jsonify({"error": f"feat1_type and feat2_type must be one of: {', '.join(FEATURE_KINDS)}"}), 400
+
+    # Columns are handed to perform_clustering as-is, without rebuilding per-row dicts
+    data = pd.DataFrame({feat1_name: feat1_list, feat2_name: feat2_list})
 
     try:
-        clustering_result = perform_clustering(data)
+        clustering_result = perform_clustering(data, mode, max_points, grid_size, engine, validate, kinds)
         return jsonify(clustering_result)
 
     except Exception as e:
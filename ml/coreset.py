@@ -0,0 +1,120 @@
+from sklearn.metrics import silhouette_score
+from scipy.optimize import linear_sum_assignment
+import numpy as np
+
+# Points labeled per vectorised chunk when assigning the full data to centroids
+LABEL_CHUNK_SIZE = 262144
+# Points drawn from the coreset to estimate the silhouette score
+SILHOUETTE_SAMPLE_SIZE = 2000
+
+
+def build_coreset(X, bins=256, grid=None):
+    """
+    Compresses points into a weighted coreset using a bins x bins histogram.
+
+    Every non-empty cell becomes one point, placed at the mean of the points
+    inside it and weighted by their number, so weighted K-Means on the coreset
+    approximates K-Means on the full data.
+
+    Args:
+        X (np.ndarray): The points, shape (n, d).
+        bins (int): The number of cells per axis.
+        grid (np.ndarray, optional): The 2-D coordinates the cells are laid on,
+                                     shape (n, 2). Defaults to X, which must then
+                                     be 2-D. Encoded features with several columns
+                                     (e.g. cyclical timestamps) are binned on one
+                                     value per feature and averaged in full.
+
+    Returns:
+        tuple: (points, weights, quantization_error) where quantization_error is
+               the mean squared distance between each point and its cell mean,
+               i.e. the inertia lost by the compression.
+    """
+    grid = X if grid is None else grid
+    mins = grid.min(axis=0)
+    spans = grid.max(axis=0) - mins
+    spans[spans == 0] = 1.0
+    cells = np.minimum(((grid - mins) / spans * bins).astype(np.int64), bins - 1)
+    cell_ids = cells[:, 0] * bins + cells[:, 1]
+
+    _, inverse, weights = np.unique(cell_ids, return_inverse=True, return_counts=True)
+    sums = np.column_stack([np.bincount(inverse, weights=X[:, i]) for i in range(X.shape[1])])
+    squares = np.column_stack([np.bincount(inverse, weights=X[:, i] ** 2) for i in range(X.shape[1])])
+    points = sums / weights[:, None]
+
+    # Within-cell sum of squares: sum(x^2) - n * mean^2
+    within = np.maximum(squares - weights[:, None] * points ** 2, 0.0).sum()
+    return points, weights.astype(np.float64), float(within / len(X))
+
+
+def weighted_silhouette(points, weights, labels, seed=0):
+    """
+    Estimates the silhouette score of the full data from a weighted coreset, by
+    drawing coreset points with probability proportional to their weight.
+
+    Args:
+        points (np.ndarray): The coreset points.
+        weights (np.ndarray): The weight of each coreset point.
+        labels (np.ndarray): The cluster of each coreset point.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        float: The estimated silhouette score.
+    """
+    rng = np.random.default_rng(seed)
+    size = min(SILHOUETTE_SAMPLE_SIZE, int(weights.sum()))
+    sample = rng.choice(len(points), size=size, replace=True, p=weights / weights.sum())
+    if len(np.unique(labels[sample])) < 2:
+        return -1.0
+    return float(silhouette_score(points[sample], labels[sample]))
+
+
+def assign_labels(X, centroids):
+    """
+    Labels every point with its nearest centroid, in vectorised chunks.
+
+    Args:
+        X (np.ndarray): The points, shape (n, d).
+        centroids (np.ndarray): The centroids, shape (k, d).
+
+    Returns:
+        tuple: (labels, inertia) where inertia is the sum of squared distances
+               between each point and its centroid.
+    """
+    labels = np.empty(len(X), dtype=np.int32)
+    inertia = 0.0
+    for start in range(0, len(X), LABEL_CHUNK_SIZE):
+        chunk = X[start : start + LABEL_CHUNK_SIZE]
+        distances = ((chunk[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+        chunk_labels = distances.argmin(axis=1)
+        labels[start : start + LABEL_CHUNK_SIZE] = chunk_labels
+        inertia += float(distances[np.arange(len(chunk)), chunk_labels].sum())
+    return labels, inertia
+
+
+def compare_with_exact(X, labels, inertia, exact_kmeans):
+    """
+    Measures how far the approximate clustering is from an exact K-Means fit.
+
+    Args:
+        X (np.ndarray): The points.
+        labels (np.ndarray): The approximate labels.
+        inertia (float): The inertia of the approximate centroids on X.
+        exact_kmeans (KMeans): K-Means fitted on X with the same k.
+
+    Returns:
+        dict: The exact inertia, the relative inertia excess of the approximation
+              and the fraction of points with the same label (after matching the
+              clusters of both fits).
+    """
+    k = exact_kmeans.n_clusters
+    confusion = np.zeros((k, k), dtype=np.int64)
+    np.add.at(confusion, (labels, exact_kmeans.labels_), 1)
+    rows, cols = linear_sum_assignment(-confusion)
+
+    exact_inertia = float(exact_kmeans.inertia_)
+    return {
+        "exact_inertia": exact_inertia,
+        "relative_inertia_error": (inertia - exact_inertia) / exact_inertia if exact_inertia else 0.0,
+        "label_agreement": float(confusion[rows, cols].sum() / len(X)),
+    }
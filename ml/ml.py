@@ -1,65 +1,366 @@
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
+from model_store import ModelStore
+from coreset import build_coreset, weighted_silhouette, assign_labels, compare_with_exact
+from preprocessing import FeatureEncoder, infer_kind
 import pandas as pd
+import numpy as np
+import hashlib
+import os
 
+# Response modes of perform_clustering
+RESPONSE_MODES = ("summary", "sample", "density", "full")
+DEFAULT_MAX_POINTS = 2000
+DEFAULT_GRID_SIZE = 32
 
-def perform_clustering(data):
+# Clustering engines, 'auto' uses the coreset above CORESET_THRESHOLD points
+ENGINES = ("auto", "exact", "coreset")
+CORESET_THRESHOLD = int(os.getenv("CORESET_THRESHOLD", "20000"))
+
+
+def perform_clustering(data, mode="full", max_points=DEFAULT_MAX_POINTS, grid_size=DEFAULT_GRID_SIZE,
+                       engine="auto", validate=False, kinds=None):
     """
     Performs K-Means clustering on the given data, finding the optimal number of clusters.
-    Returns the cluster centroids and the labeled data points.
+    Returns the cluster centroids and, depending on the mode, the labeled data points.
+
+    The features are encoded by a FeatureEncoder first, so timestamps and categorical
+    features can be clustered too. Centroids, statistics, histograms and labeled points
+    are reported in display values: the number itself for numeric features, epoch seconds
+    for timestamps and the category code for categoricals (see 'encodings').
 
     Args:
-        data (list of dict): A list of dictionaries, where each dictionary represents a data point.
+        data (pd.DataFrame or list of dict): The two feature columns, or one dict per data point.
+        mode (str): What to return besides the centroids and per-cluster statistics:
+                    - 'summary': nothing else.
+                    - 'sample': a stratified sample of at most max_points labeled points.
+                    - 'density': a grid_size x grid_size 2D histogram per cluster.
+                    - 'full': every labeled point.
+        max_points (int): Point budget of the 'sample' mode.
+        grid_size (int): Number of bins per axis of the 'density' mode.
+        engine (str): 'exact' runs K-Means and the silhouette over every point, 'coreset'
+                      runs them on a weighted 2D-histogram coreset and then labels every
+                      point with its nearest centroid. 'auto' picks the coreset above
+                      CORESET_THRESHOLD points.
+        validate (bool): With the coreset engine, also fit the exact path with the chosen k
+                         and report the approximation error against it.
+        kinds (dict, optional): Kind of each feature ('numeric', 'timestamp' or
+                                'categorical'), inferred from the values when missing.
 
     Returns:
         dict: A dictionary containing:
               - 'centroids': A list of cluster centroids.
-              - 'labeled_data': The original data with an added 'cluster' key for each point.
+              - 'clusters': Count, mean, std, min and max of each cluster.
+              - 'n_points': The number of clustered points.
+              - 'encodings': The kind of each feature and, for categoricals, the categories.
+              - 'model': The chosen k, the silhouette scores and whether the stored
+                         model was reused as-is ('cached') or as init ('warm_start').
+              - 'labeled_data': The (sampled) data with an added 'cluster' key for each point,
+                                for the 'sample' and 'full' modes.
+              - 'density': The per-cluster histograms, for the 'density' mode.
     """
-    if not data or len(data) < 2:
-        return {"centroids": [], "labeled_data": []}
+    if mode not in RESPONSE_MODES:
+        raise ValueError(f"mode must be one of {', '.join(RESPONSE_MODES)}.")
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(ENGINES)}.")
 
-    feature_names = list(data[0].keys())
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    if len(df) < 2:
+        return empty_result(mode)
+
+    feature_names = list(df.columns)
     if len(feature_names) != 2:
         raise ValueError("Data should have exactly two features for 2D clustering.")
 
-    df = pd.DataFrame(data)
-    df.dropna(subset=feature_names, inplace=True)
+    stored = ModelStore.get(feature_names)
+    encoder = FeatureEncoder.for_features(df, feature_names, kinds,
+                                          stored["meta"].get("encoder") if stored else None)
+    X, display, _ = encoder.transform(df)
 
-    if df.empty:
-        return {"centroids": [], "labeled_data": []}
+    if len(X) == 0:
+        return empty_result(mode)
 
-    X = df[feature_names].values
+    version_hash = hashlib.blake2b(X.tobytes(), digest_size=16)
+    version_hash.update(encoder.version().encode("utf-8"))
+    data_version = version_hash.hexdigest()
 
-    best_k = -1
-    best_score = -1
+    if engine == "auto":
+        engine = "coreset" if len(X) > CORESET_THRESHOLD else "exact"
+
+    # The stored fit is only reused for the same data and engine, and never when
+    # the coreset has to be validated against a new exact fit
+    if (stored and stored["meta"]["data_version"] == data_version
+            and stored["meta"].get("engine") == engine and not validate):
+        # Same data as the stored fit, nothing to recompute
+        meta = stored["meta"]
+        best_k = meta["k"]
+        centroids = np.asarray(stored["centroids"][best_k])
+        labels = np.asarray(stored["labels"])
+        model_info = {"k": best_k, "silhouette_scores": meta["silhouette_scores"],
+                      "cached": True, "warm_start": False, "n_iter": 0}
+        if meta.get("approximation"):
+            model_info["approximation"] = meta["approximation"]
+    else:
+        # The encoder is only kept while the data stays similar, so a model fitted
+        # with the same encoding is a good init
+        seeds = {}
+        if stored and stored["meta"].get("encoder") == encoder.params:
+            seeds = stored["centroids"]
+
+        if engine == "coreset":
+            points, weights, quantization_error = build_coreset(X, grid=display)
+            best_k, models, scores = select_model(points, seeds, weights)
+            centroids = models[best_k].cluster_centers_
+            labels, inertia = assign_labels(X, centroids)
+            approximation = {"coreset_size": int(len(points)), "quantization_error": float(quantization_error),
+                             "inertia": float(inertia)}
+            if validate:
+                exact = KMeans(n_clusters=best_k, random_state=0, n_init=10).fit(X)
+                approximation.update(compare_with_exact(X, labels, inertia, exact))
+        else:
+            best_k, models, scores = select_model(X, seeds)
+            centroids = models[best_k].cluster_centers_
+            labels = models[best_k].labels_
+            approximation = None
+
+        model_info = {"k": best_k, "silhouette_scores": scores, "cached": False,
+                      "warm_start": bool(seeds),
+                      "n_iter": int(sum(model.n_iter_ for model in models.values()))}
+        if approximation:
+            model_info["approximation"] = approximation
+
+        ModelStore.save(
+            feature_names,
+            {"data_version": data_version, "n_points": len(X), "k": best_k, "engine": engine,
+             "silhouette_scores": scores, "encoder": encoder.params, "approximation": approximation},
+            {k: model.cluster_centers_ for k, model in models.items()},
+            labels,
+        )
+
+    result = {
+        "centroids": encoder.to_display(centroids).tolist(),
+        "clusters": cluster_stats(display, labels, best_k),
+        "n_points": len(X),
+        "encodings": encoder.describe(),
+        "model": model_info,
+    }
+
+    if mode == "full":
+        result["labeled_data"] = label_points(display, feature_names, labels)
+    elif mode == "sample":
+        indices = stratified_sample(labels, best_k, max_points)
+        result["labeled_data"] = label_points(display[indices], feature_names, labels[indices])
+        result["sampled"] = len(indices) < len(X)
+    elif mode == "density":
+        result["density"] = density_grid(display, labels, best_k, grid_size)
+
+    return result
+
+
+def select_model(X, seeds, weights=None):
+    """
+    Fits K-Means for every candidate k and picks the one with the best silhouette score.
 
+    Args:
+        X (np.ndarray): The points to cluster, shape (n, d).
+        seeds (dict of int -> np.ndarray): Centroids of a previous fit per k, used as
+                                           init so that refits on similar data converge
+                                           in a few iterations.
+        weights (np.ndarray, optional): Weight of each point, for coresets. The silhouette
+                                        is then estimated on a weighted sample.
+
+    Returns:
+        tuple: (best k, dict of k -> fitted KMeans, dict of k -> silhouette score)
+    """
+    # A coreset can have fewer points than K-Means needs clusters
     max_clusters = min(11, len(X))
+    candidates = [1] if max_clusters <= 2 else list(range(2, max_clusters))
 
-    if max_clusters <= 2:
-        best_k = 1
-    else:
-        for k in range(2, max_clusters):
+    models = {}
+    scores = {}
+    best_k = -1
+    best_score = -1
+    for k in candidates:
+        seed = seeds.get(k)
+        if seed is not None and np.shape(seed) == (k, X.shape[1]):
+            kmeans = KMeans(n_clusters=k, init=np.asarray(seed), n_init=1)
+        else:
             kmeans = KMeans(n_clusters=k, random_state=0, n_init=10)
-            kmeans.fit(X)
-            score = silhouette_score(X, kmeans.labels_)
+        kmeans.fit(X, sample_weight=weights)
+        models[k] = kmeans
+
+        if len(candidates) > 1:
+            if weights is None:
+                score = float(silhouette_score(X, kmeans.labels_))
+            else:
+                score = weighted_silhouette(X, weights, kmeans.labels_)
+            scores[str(k)] = score
             if score > best_score:
                 best_score = score
                 best_k = k
 
-    if best_k == -1:
+    if len(candidates) == 1:
+        best_k = 1
+    elif best_k == -1:
         best_k = 3
 
-    # Rerun with the best k
-    kmeans = KMeans(n_clusters=best_k, random_state=0, n_init=10)
-    kmeans.fit(X)
+    return best_k, models, scores
+
+
+def empty_result(mode):
+    """Result returned when there is not enough data to cluster"""
+    result = {"centroids": [], "clusters": [], "n_points": 0}
+    if mode in ("full", "sample"):
+        result["labeled_data"] = []
+    elif mode == "density":
+        result["density"] = None
+    return result
+
+
+def label_points(display, feature_names, labels):
+    """Converts the points to a list of dicts with an added 'cluster' key"""
+    feat1, feat2 = feature_names
+    return [
+        {feat1: x, feat2: y, "cluster": label}
+        for x, y, label in zip(display[:, 0].tolist(), display[:, 1].tolist(), labels.tolist())
+    ]
+
+
+def cluster_stats(X, labels, n_clusters):
+    """
+    Computes the size and per-feature mean, std, min and max of every cluster.
+
+    Args:
+        X (np.ndarray): The clustered points, shape (n, 2).
+        labels (np.ndarray): The cluster of each point.
+        n_clusters (int): The number of clusters.
+
+    Returns:
+        list of dict: One entry per cluster.
+    """
+    stats = []
+    for cluster in range(n_clusters):
+        members = X[labels == cluster]
+        if len(members) == 0:
+            stats.append({"cluster": cluster, "count": 0})
+            continue
+        stats.append({
+            "cluster": cluster,
+            "count": int(len(members)),
+            "mean": members.mean(axis=0).tolist(),
+            "std": members.std(axis=0).tolist(),
+            "min": members.min(axis=0).tolist(),
+            "max": members.max(axis=0).tolist(),
+        })
+    return stats
+
+
+def stratified_sample(labels, n_clusters, max_points, seed=0):
+    """
+    Picks at most max_points point indices, allocating the budget to each cluster
+    in proportion to its size (every non-empty cluster keeps at least one point).
+
+    Args:
+        labels (np.ndarray): The cluster of each point.
+        n_clusters (int): The number of clusters.
+        max_points (int): The point budget.
+        seed (int): Seed of the random generator, so repeated calls return the same sample.
+
+    Returns:
+        np.ndarray: The sorted indices of the sampled points.
+    """
+    if len(labels) <= max_points:
+        return np.arange(len(labels))
+
+    counts = np.bincount(labels, minlength=n_clusters)
+    quotas = counts * max_points / len(labels)
+    allocation = np.minimum(np.maximum(np.floor(quotas).astype(int), counts > 0), counts)
+
+    # Hand out what is left of the budget by largest remainder
+    remaining = max_points - allocation.sum()
+    for cluster in np.argsort(-(quotas - np.floor(quotas))):
+        if remaining <= 0:
+            break
+        if allocation[cluster] < counts[cluster]:
+            allocation[cluster] += 1
+            remaining -= 1
+
+    rng = np.random.default_rng(seed)
+    indices = [
+        rng.choice(np.flatnonzero(labels == cluster), size=allocation[cluster], replace=False)
+        for cluster in range(n_clusters)
+        if allocation[cluster] > 0
+    ]
+    return np.sort(np.concatenate(indices))
+
+
+def density_grid(X, labels, n_clusters, grid_size):
+    """
+    Bins the points of every cluster on a shared grid_size x grid_size grid.
+
+    Args:
+        X (np.ndarray): The clustered points, shape (n, 2).
+        labels (np.ndarray): The cluster of each point.
+        n_clusters (int): The number of clusters.
+        grid_size (int): The number of bins per axis.
+
+    Returns:
+        dict: The bin edges of both axes and, per cluster, the non-empty cells
+              as [x_bin, y_bin, count] triples.
+    """
+    _, x_edges, y_edges = np.histogram2d(X[:, 0], X[:, 1], bins=grid_size)
+
+    clusters = []
+    for cluster in range(n_clusters):
+        members = X[labels == cluster]
+        counts, _, _ = np.histogram2d(members[:, 0], members[:, 1], bins=[x_edges, y_edges])
+        x_bins, y_bins = np.nonzero(counts)
+        clusters.append({
+            "cluster": cluster,
+            "cells": np.column_stack((x_bins, y_bins, counts[x_bins, y_bins])).astype(int).tolist(),
+        })
+
+    return {"x_edges": x_edges.tolist(), "y_edges": y_edges.tolist(), "clusters": clusters}
+
+
+def warm_up(n_points=500, seed=0):
+    """
+    Runs every clustering path once on synthetic data, without touching ModelStore,
+    so the first request does not pay for the lazy imports and first-call setup
+    of scikit-learn, SciPy and the encoder.
+
+    Args:
+        n_points (int): The number of synthetic points.
+        seed (int): Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(scale=10, size=(3, 2))
+    values = centers[rng.integers(0, len(centers), n_points)] + rng.normal(size=(n_points, 2))
+    df = pd.DataFrame({
+        "warm_up_numeric": values[:, 0],
+        "warm_up_timestamp": pd.Timestamp("2024-01-01") + pd.to_timedelta(values[:, 1] * 3600, unit="s"),
+        "warm_up_categorical": rng.choice(("Morning", "Afternoon", "Evening", "Night"), n_points),
+    })
+
+    kinds = {"warm_up_numeric": "numeric", "warm_up_timestamp": "timestamp", "warm_up_categorical": "categorical"}
 
-    centroids = kmeans.cluster_centers_.tolist()
-    labels = kmeans.labels_.tolist()
+    # Every feature kind, through encoders that are not cached
+    for feature_names in (["warm_up_numeric", "warm_up_categorical"], ["warm_up_numeric", "warm_up_timestamp"]):
+        infer_kind(df[feature_names[1]])
+        encoder = FeatureEncoder.fit(df, feature_names, kinds)
+        X, display, _ = encoder.transform(df)
+        encoder.to_display(X[:1, :])
 
-    # Add cluster label to each data point
-    labeled_data = df.to_dict("records")
-    for i, point in enumerate(labeled_data):
-        point["cluster"] = labels[i]
+    # Exact and coreset engines
+    best_k, models, _ = select_model(X, {})
+    labels = models[best_k].labels_
+    points, weights, _ = build_coreset(X, grid=display)
+    coreset_k, coreset_models, _ = select_model(points, {}, weights)
+    coreset_labels, inertia = assign_labels(X, coreset_models[coreset_k].cluster_centers_)
+    if coreset_k in models:
+        compare_with_exact(X, coreset_labels, inertia, models[coreset_k])
 
-    return {"centroids": centroids, "labeled_data": labeled_data}
+    # Response modes
+    cluster_stats(display, labels, best_k)
+    stratified_sample(labels, best_k, n_points // 4)
+    density_grid(display, labels, best_k, DEFAULT_GRID_SIZE)
@@ -0,0 +1,129 @@
+import numpy as np
+import threading
+import hashlib
+import logging
+import shutil
+import json
+import uuid
+import os
+
+
+class ModelStore:
+    """
+    A static class that persists fitted clustering models on the local disk.
+
+    A model is stored per feature pair, as a generation directory holding the
+    centroids of every k tried during model selection and the labels of the
+    last fit (.npy files), plus a meta.json describing the chosen k, the
+    silhouette scores, the fitted feature encoder and the version of the data.
+    Models are only read from disk the first time their feature pair is
+    requested, and the arrays are memory-mapped instead of loaded.
+    """
+
+    __directory = os.getenv("MODEL_STORE_DIR", "models")
+    __models = {}
+    __lock = threading.Lock()
+    __save_locks = {}
+    __logger = logging.getLogger("model-store")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def get(cls, feature_names):
+        """Returns the stored model of a feature pair
+
+        Args:
+            feature_names (list of str): The clustered features, in order.
+
+        Returns:
+            dict: 'meta' (dict), 'centroids' (dict of k -> np.ndarray) and
+                  'labels' (np.ndarray), or None if there is no stored model.
+        """
+        key = cls.__key(feature_names)
+        with cls.__lock:
+            if key not in cls.__models:
+                cls.__models[key] = cls.__read(key)
+            return cls.__models[key]
+
+    @classmethod
+    def save(cls, feature_names, meta, centroids, labels):
+        """Persists the model of a feature pair, replacing the previous one
+
+        Args:
+            feature_names (list of str): The clustered features, in order.
+            meta (dict): JSON-serialisable description of the model, with
+                         at least its 'data_version'.
+            centroids (dict of int -> np.ndarray): The centroids fitted for each k.
+            labels (np.ndarray): The cluster of each point of the last fit.
+        """
+        key = cls.__key(feature_names)
+        with cls.__lock:
+            save_lock = cls.__save_locks.setdefault(key, threading.Lock())
+
+        # Saves of the same feature pair run one at a time, so a save never removes
+        # the generation another one is writing or has just published
+        with save_lock:
+            cls.__save(key, feature_names, meta, centroids, labels)
+
+    @classmethod
+    def __save(cls, key, feature_names, meta, centroids, labels):
+        """Writes a new generation of a model and publishes it in meta.json"""
+        model_dir = os.path.join(cls.__directory, key)
+        # A new directory per save, files that are memory-mapped are never overwritten
+        generation = f'{meta["data_version"][:16]}-{uuid.uuid4().hex[:8]}'
+        generation_dir = os.path.join(model_dir, generation)
+
+        try:
+            os.makedirs(generation_dir, exist_ok=True)
+            for k, k_centroids in centroids.items():
+                np.save(os.path.join(generation_dir, f"centroids_k{k}.npy"), k_centroids)
+            np.save(os.path.join(generation_dir, "labels.npy"), labels)
+
+            # meta.json is replaced last, so readers never see a half-written generation
+            meta = {**meta, "feature_names": list(feature_names), "generation": generation,
+                    "centroid_ks": sorted(int(k) for k in centroids)}
+            tmp_path = os.path.join(model_dir, f"meta.json.{generation}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, os.path.join(model_dir, "meta.json"))
+
+            for entry in os.listdir(model_dir):
+                entry_path = os.path.join(model_dir, entry)
+                if entry != generation and os.path.isdir(entry_path):
+                    shutil.rmtree(entry_path, ignore_errors=True)
+        except OSError as e:
+            cls.__logger.error(f"Could not save the model of {feature_names}: {e}")
+            return
+
+        with cls.__lock:
+            cls.__models[key] = {
+                "meta": meta,
+                "centroids": {int(k): np.asarray(v) for k, v in centroids.items()},
+                "labels": np.asarray(labels),
+            }
+
+    @classmethod
+    def __read(cls, key):
+        """Reads a stored model from disk, memory-mapping its arrays"""
+        model_dir = os.path.join(cls.__directory, key)
+        try:
+            with open(os.path.join(model_dir, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            generation_dir = os.path.join(model_dir, meta["generation"])
+            centroids = {
+                k: np.load(os.path.join(generation_dir, f"centroids_k{k}.npy"), mmap_mode="r")
+                for k in meta["centroid_ks"]
+            }
+            labels = np.load(os.path.join(generation_dir, "labels.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            cls.__logger.warning(f"Ignoring unreadable model {key}: {e}")
+            return None
+
+        cls.__logger.info(f"Loaded model of {meta.get('feature_names')} (k={meta.get('k')})")
+        return {"meta": meta, "centroids": centroids, "labels": labels}
+
+    @staticmethod
+    def __key(feature_names):
+        """Name of the directory of a feature pair"""
+        return hashlib.blake2b("\0".join(feature_names).encode("utf-8"), digest_size=12).hexdigest()
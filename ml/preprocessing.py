@@ -0,0 +1,227 @@
+import pandas as pd
+import numpy as np
+import threading
+import hashlib
+import json
+
+# Feature kinds understood by the encoder
+FEATURE_KINDS = ("numeric", "timestamp", "categorical")
+
+# Categories with a natural order are encoded in that order instead of alphabetically
+KNOWN_CATEGORY_ORDERS = (
+    ("Morning", "Afternoon", "Evening", "Night"),
+    ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"),
+)
+
+SECONDS_PER_DAY = 86400
+
+
+class FeatureEncoder:
+    """
+    Vectorised preprocessing of the two clustered features.
+
+    - numeric features are used as-is;
+    - timestamps (ISO strings or epoch seconds) become epoch seconds plus the
+      sine and cosine of the hour of day, so 23:00 and 01:00 end up close;
+    - categoricals are dictionary-encoded to integer codes.
+
+    Every encoded column is then standardised, and the columns of a feature are
+    scaled so that each feature has the same total variance. Fitted encoders are
+    cached per feature pair and reused while the data stays compatible, so the
+    stored models and their centroids keep living in the same space.
+    """
+
+    __encoders = {}
+    __lock = threading.Lock()
+
+    def __init__(self, feature_names, params):
+        self.feature_names = list(feature_names)
+        self.params = params
+
+    @classmethod
+    def for_features(cls, df, feature_names, kinds=None, stored_params=None):
+        """Returns the cached encoder of a feature pair, refitting it if the data changed
+
+        Args:
+            df (pd.DataFrame): The raw feature columns.
+            feature_names (list of str): The clustered features, in order.
+            kinds (dict, optional): Kind of each feature, inferred when missing.
+            stored_params (dict, optional): Params of a persisted encoder, used when
+                                            nothing is cached yet (e.g. after a restart).
+
+        Returns:
+            FeatureEncoder: An encoder able to transform df.
+        """
+        key = tuple(feature_names)
+        with cls.__lock:
+            encoder = cls.__encoders.get(key)
+            if encoder is None and stored_params:
+                encoder = cls(feature_names, stored_params)
+
+            kinds = {name: (kinds or {}).get(name) or infer_kind(df[name]) for name in feature_names}
+            if encoder is None or not encoder.is_compatible(df, kinds):
+                encoder = cls.fit(df, feature_names, kinds)
+            cls.__encoders[key] = encoder
+            return encoder
+
+    @classmethod
+    def fit(cls, df, feature_names, kinds):
+        """Fits a new encoder on the raw feature columns"""
+        params = {}
+        for name in feature_names:
+            kind = kinds[name]
+            feature = {"kind": kind}
+            if kind == "categorical":
+                feature["categories"] = category_order(df[name].dropna().astype(str).unique())
+            encoded = encode_feature(df[name], feature)
+            valid = encoded[~np.isnan(encoded).any(axis=1)]
+            feature["mean"] = valid.mean(axis=0).tolist() if len(valid) else [0.0] * encoded.shape[1]
+            std = valid.std(axis=0) if len(valid) else np.ones(encoded.shape[1])
+            feature["std"] = np.where(std > 0, std, 1.0).tolist()
+            params[name] = feature
+        return cls(feature_names, params)
+
+    def is_compatible(self, df, kinds):
+        """
+        Checks if the data can be encoded with the fitted params without distorting it:
+        same kinds, no unseen category and every numeric mean within half a standard
+        deviation of the fitted one (with a standard deviation at most twice as far).
+        """
+        for name in self.feature_names:
+            feature = self.params[name]
+            if feature["kind"] != kinds[name]:
+                return False
+            if feature["kind"] == "categorical":
+                values = df[name].dropna().astype(str).unique()
+                if not set(values) <= set(feature["categories"]):
+                    return False
+                continue
+
+            encoded = encode_feature(df[name], feature)[:, 0]
+            encoded = encoded[~np.isnan(encoded)]
+            if len(encoded) == 0:
+                return False
+            mean, std = encoded.mean(), encoded.std()
+            old_mean, old_std = feature["mean"][0], feature["std"][0]
+            if abs(mean - old_mean) > 0.5 * old_std or not 0.5 <= max(std, 1e-12) / old_std <= 2:
+                return False
+        return True
+
+    def transform(self, df):
+        """
+        Encodes the features.
+
+        Args:
+            df (pd.DataFrame): The raw feature columns.
+
+        Returns:
+            tuple: (X, display, valid) where X is the standardised matrix used for
+                   clustering, display holds one plottable number per feature
+                   (epoch seconds, category code or the value itself) and valid is the
+                   mask of the rows of df they were built from.
+        """
+        blocks = []
+        display = []
+        for name in self.feature_names:
+            feature = self.params[name]
+            encoded = encode_feature(df[name], feature)
+            display.append(encoded[:, 0])
+            weight = 1.0 / np.sqrt(encoded.shape[1])
+            blocks.append((encoded - feature["mean"]) / feature["std"] * weight)
+
+        X = np.hstack(blocks)
+        display = np.column_stack(display)
+        valid = ~np.isnan(X).any(axis=1)
+        return np.ascontiguousarray(X[valid]), display[valid], valid
+
+    def to_display(self, points):
+        """
+        Maps points of the clustering space (e.g. centroids) back to display values.
+
+        Args:
+            points (np.ndarray): Points shaped like the X returned by transform.
+
+        Returns:
+            np.ndarray: One display value per feature, shape (n, 2).
+        """
+        display = []
+        offset = 0
+        for name in self.feature_names:
+            feature = self.params[name]
+            dims = len(feature["mean"])
+            weight = 1.0 / np.sqrt(dims)
+            display.append(points[:, offset] / weight * feature["std"][0] + feature["mean"][0])
+            offset += dims
+        return np.column_stack(display)
+
+    def describe(self):
+        """Describes the encoding of each feature, so clients can label the axes"""
+        description = {}
+        for name in self.feature_names:
+            feature = self.params[name]
+            description[name] = {"kind": feature["kind"]}
+            if feature["kind"] == "timestamp":
+                description[name]["unit"] = "epoch_seconds"
+            elif feature["kind"] == "categorical":
+                description[name]["categories"] = feature["categories"]
+        return description
+
+    def version(self):
+        """Fingerprint of the fitted params"""
+        raw = json.dumps(self.params, sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def infer_kind(series):
+    """Infers the kind of a raw feature column"""
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    values = series.dropna()
+    if len(values) == 0:
+        return "numeric"
+    parsed = pd.to_datetime(values.astype(str), errors="coerce", format="ISO8601")
+    if parsed.notna().mean() >= 0.9:
+        return "timestamp"
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().mean() >= 0.9:
+        return "numeric"
+    return "categorical"
+
+
+def category_order(values):
+    """Orders the categories, following a known natural order when there is one"""
+    values = set(values)
+    for order in KNOWN_CATEGORY_ORDERS:
+        if values <= set(order):
+            return [value for value in order if value in values]
+    return sorted(values)
+
+
+def encode_feature(series, feature):
+    """
+    Encodes a raw column to a float matrix, NaN where the value is missing or invalid.
+
+    Args:
+        series (pd.Series): The raw values.
+        feature (dict): The kind of the feature and, for categoricals, its categories.
+
+    Returns:
+        np.ndarray: Shape (n, 1), or (n, 3) for timestamps (epoch, sin and cos of the hour).
+    """
+    kind = feature["kind"]
+    if kind == "numeric":
+        return pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64)[:, None]
+
+    if kind == "categorical":
+        codes = pd.Categorical(series.astype("string"), categories=feature["categories"]).codes
+        return np.where(codes >= 0, codes, np.nan).astype(np.float64)[:, None]
+
+    if pd.api.types.is_numeric_dtype(series):
+        epoch = series.to_numpy(dtype=np.float64)
+    else:
+        parsed = pd.to_datetime(series, errors="coerce", format="ISO8601")
+        if parsed.dt.tz is not None:
+            parsed = parsed.dt.tz_convert(None)
+        epoch = (parsed - pd.Timestamp(0)).dt.total_seconds().to_numpy(dtype=np.float64)
+    angle = 2 * np.pi * np.mod(epoch, SECONDS_PER_DAY) / SECONDS_PER_DAY
+    return np.column_stack((epoch, np.sin(angle), np.cos(angle)))
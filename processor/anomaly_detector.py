@@ -0,0 +1,282 @@
+from station_registry import StationRegistry
+from conversions import to_float
+import threading
+import datetime
+import logging
+import queue
+import json
+import math
+import os
+
+
+# Session columns tracked by the rolling statistics
+STAT_METRICS = ("energy_consumed_kwh", "charging_duration_hours", "charging_rate_kw", "charging_cost_eur")
+
+# Record columns the statistics are kept per value of
+STAT_SCOPES = {"user": "user_id", "vehicle_model": "vehicle_model", "station": "charging_station_id"}
+
+# Columns that can never be negative
+NON_NEGATIVE = ("energy_consumed_kwh", "charging_duration_hours", "charging_rate_kw", "charging_cost_eur")
+
+
+class RollingStats:
+    """
+    Mean and variance of a stream, updated in O(1): over the whole history
+    (Welford's algorithm) and over the recent values (exponentially weighted,
+    each value weighing alpha).
+    """
+
+    __slots__ = ("count", "mean", "m2", "ewma", "ewvar")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, variance: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = variance * count
+        # The recent statistics start from the long-run ones
+        self.ewma = mean
+        self.ewvar = variance
+
+    def update(self, value: float, alpha: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.count == 1:
+            self.ewma, self.ewvar = value, 0.0
+        else:
+            deviation = value - self.ewma
+            self.ewma += alpha * deviation
+            self.ewvar = (1 - alpha) * (self.ewvar + alpha * deviation * deviation)
+
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def z_scores(self, value: float) -> tuple:
+        """Returns how many standard deviations a value is from the long-run and the recent mean"""
+        std, ewstd = self.std(), math.sqrt(self.ewvar)
+        return (
+            (value - self.mean) / std if std > 0 else 0.0,
+            (value - self.ewma) / ewstd if ewstd > 0 else 0.0,
+        )
+
+
+class AnomalyDetector:
+    """
+    A static class that checks every ingested session for anomalies.
+
+    A session is anomalous if it breaks a hard rule (a negative energy, duration,
+    rate or cost, a state of charge outside 0-100% or going down while charging,
+    a state of charge gain needing more energy than was delivered, or a charging
+    rate above the station's maximum admissible power) or if one of its metrics
+    is more than ANOMALY_Z_SCORE standard deviations away from both the long-run
+    and the recent (EWMA) mean of its user, vehicle model or station, once they
+    have ANOMALY_MIN_SAMPLES sessions.
+
+    The check runs in the insert listener in O(1) and never fails the insert:
+    the anomalies are queued and a background thread writes them to the
+    ev_anomalies table and publishes them on the ANOMALY_ALERT_TOPIC MQTT topic.
+    If the queue is full the anomalies are counted and dropped.
+    """
+
+    Z_SCORE = float(os.getenv("ANOMALY_Z_SCORE", "4"))
+    MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "30"))
+    EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", "0.05"))
+    ALERT_TOPIC = os.getenv("ANOMALY_ALERT_TOPIC", "idc/ev/alerts")
+    # Relative margin of the rate and state of charge rules, for measurement noise
+    TOLERANCE = float(os.getenv("ANOMALY_TOLERANCE", "0.05"))
+    FLUSH_SECONDS = 1.0
+    QUEUE_SIZE = 10000
+
+    # (scope, value, metric) -> RollingStats
+    __stats = {}
+    __pending = queue.Queue(maxsize=QUEUE_SIZE)
+    __counts = {}
+    __dropped = 0
+    __thread = None
+    __stop_event = threading.Event()
+    __lock = threading.Lock()
+    __logger = logging.getLogger("anomaly-detector")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, rows: list):
+        """Seeds the statistics from the stored sessions
+
+        Args:
+            rows (list[tuple]): (scope, value, metric, count, mean, variance) rows
+        """
+        stats = {
+            (scope, value, metric): RollingStats(count, mean, variance)
+            for scope, value, metric, count, mean, variance in rows
+            if count and value is not None
+        }
+        with cls.__lock:
+            cls.__stats = stats
+        cls.__logger.info(f"Anomaly statistics seeded for {len(stats)} scopes and metrics")
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Insert listener, checks an ingested session and updates the statistics"""
+        anomalies = cls.check(record)
+        if not anomalies:
+            return
+        with cls.__lock:
+            for anomaly in anomalies:
+                cls.__counts[anomaly["kind"]] = cls.__counts.get(anomaly["kind"], 0) + 1
+        for anomaly in anomalies:
+            try:
+                cls.__pending.put_nowait(anomaly)
+            except queue.Full:
+                with cls.__lock:
+                    cls.__dropped += 1
+
+    @classmethod
+    def check(cls, record: dict) -> list:
+        """Returns the anomalies of a session and adds its values to the statistics
+
+        Values breaking a hard rule are not added, so they do not skew the statistics.
+        """
+        values = {metric: to_float(record.get(metric)) for metric in STAT_METRICS}
+        anomalies = cls.__check_rules(record, values)
+        broken = {anomaly["metric"] for anomaly in anomalies}
+
+        with cls.__lock:
+            for scope, column in STAT_SCOPES.items():
+                key = record.get(column)
+                if key is None:
+                    continue
+                for metric, value in values.items():
+                    if value is None or metric in broken:
+                        continue
+                    stats = cls.__stats.get((scope, key, metric))
+                    if stats is None:
+                        stats = cls.__stats[(scope, key, metric)] = RollingStats()
+                    elif stats.count >= cls.MIN_SAMPLES:
+                        z_score, ewma_z_score = stats.z_scores(value)
+                        if min(abs(z_score), abs(ewma_z_score)) > cls.Z_SCORE:
+                            anomalies.append(
+                                cls.__anomaly(record, "outlier", metric, value, stats.mean, z_score, scope)
+                            )
+                    stats.update(value, cls.EWMA_ALPHA)
+        return anomalies
+
+    @classmethod
+    def status(cls) -> dict:
+        """Returns the number of anomalies detected per kind since startup"""
+        with cls.__lock:
+            return {
+                "detected": dict(cls.__counts),
+                "dropped": cls.__dropped,
+                "pending": cls.__pending.qsize(),
+                "tracked": len(cls.__stats),
+            }
+
+    @classmethod
+    def start(cls, save, publish=None):
+        """Starts the thread that writes and publishes the detected anomalies
+
+        Args:
+            save (callable): Writes a list of anomalies, returns True on success
+            publish (callable, optional): Publishes an alert, receives the topic and
+                                          the JSON payload
+        """
+        if cls.__thread is not None:
+            return
+        cls.__thread = threading.Thread(
+            target=cls.__run, args=(save, publish), name="anomaly-writer", daemon=True
+        )
+        cls.__thread.start()
+
+    @classmethod
+    def stop(cls):
+        """Stops the writer thread after writing the queued anomalies"""
+        cls.__stop_event.set()
+        if cls.__thread is not None:
+            cls.__thread.join(timeout=5)
+
+    @classmethod
+    def __run(cls, save, publish):
+        batch = []
+        while True:
+            stopping = cls.__stop_event.wait(cls.FLUSH_SECONDS)
+            while True:
+                try:
+                    batch.append(cls.__pending.get_nowait())
+                except queue.Empty:
+                    break
+            if batch:
+                if save(batch):
+                    cls.__publish(batch, publish)
+                    batch = []
+                elif len(batch) > cls.QUEUE_SIZE:
+                    # Keep retrying the newest ones while the database is unavailable
+                    with cls.__lock:
+                        cls.__dropped += len(batch) - cls.QUEUE_SIZE
+                    batch = batch[-cls.QUEUE_SIZE :]
+            if stopping:
+                return
+
+    @classmethod
+    def __publish(cls, anomalies: list, publish):
+        if publish is None:
+            return
+        for anomaly in anomalies:
+            try:
+                publish(cls.ALERT_TOPIC, json.dumps(anomaly))
+            except Exception as e:
+                cls.__logger.error(f"Could not publish anomaly alert: {e}")
+                return
+
+    @classmethod
+    def __check_rules(cls, record: dict, values: dict) -> list:
+        """Returns the hard rules broken by a session"""
+        anomalies = []
+        for metric in NON_NEGATIVE:
+            if values[metric] is not None and values[metric] < 0:
+                anomalies.append(cls.__anomaly(record, "negative_value", metric, values[metric], 0.0))
+
+        soc_start = to_float(record.get("state_of_charge_start_percent"))
+        soc_end = to_float(record.get("state_of_charge_end_percent"))
+        for metric, value in (("state_of_charge_start_percent", soc_start), ("state_of_charge_end_percent", soc_end)):
+            if value is not None and not 0 <= value <= 100:
+                anomalies.append(
+                    cls.__anomaly(record, "state_of_charge_out_of_range", metric, value, min(max(value, 0), 100))
+                )
+        if soc_start is not None and soc_end is not None:
+            energy = values["energy_consumed_kwh"]
+            capacity = to_float(record.get("battery_capacity_kwh"))
+            if soc_end < soc_start and (energy or 0) > 0:
+                anomalies.append(
+                    cls.__anomaly(record, "state_of_charge_drop", "state_of_charge_end_percent", soc_end, soc_start)
+                )
+            elif energy is not None and energy >= 0 and capacity:
+                # Energy the battery gained, according to the state of charge
+                gained = (soc_end - soc_start) / 100 * capacity
+                if gained > energy * (1 + cls.TOLERANCE) + cls.TOLERANCE:
+                    anomalies.append(
+                        cls.__anomaly(record, "state_of_charge_jump", "energy_consumed_kwh", energy, gained)
+                    )
+
+        rate = values["charging_rate_kw"]
+        max_power = StationRegistry.max_power_of(record.get("charging_station_id"))
+        if rate is not None and max_power is not None and rate > max_power * (1 + cls.TOLERANCE):
+            anomalies.append(
+                cls.__anomaly(record, "rate_above_station_limit", "charging_rate_kw", rate, max_power)
+            )
+        return anomalies
+
+    @staticmethod
+    def __anomaly(record, kind, metric, value, expected, score=None, scope=None) -> dict:
+        start_time = record.get("charging_start_time")
+        return {
+            "detected_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "user_id": record.get("user_id"),
+            "charging_station_id": record.get("charging_station_id"),
+            "charging_start_time": str(start_time) if start_time is not None else None,
+            "kind": kind,
+            "scope": scope,
+            "metric": metric,
+            "value": value,
+            "expected": expected,
+            "score": score,
+        }
@@ -1,6 +1,19 @@
 from flask import Flask, jsonify, request
 import requests
 from database import Database
+from http_cache import HttpCache
+from json_provider import FastJSONProvider, passthrough_response
+from station_registry import StationRegistry
+from spatial_index import SpatialIndex
+from visited_stations import VisitedStations
+from feature_store import FeatureStore
+from streaming_stats import StreamingStats, REGION_LEVELS as SKETCH_REGION_LEVELS
+from anomaly_detector import AnomalyDetector
+from regions import RegionStats, REGION_LEVELS
+from timeseries import TimeSeries, SERIES_METRICS, DOWNSAMPLING_METHODS
+from spool import Spool
+from query_profiler import QueryProfiler
+from startup import Startup, PROBE_ENDPOINTS
 import datetime
 import logging
 import signal
@@ -10,11 +23,31 @@ import sys
 def handle_exit(signum, frame):
     """Called when receive a exit signal"""
     __app_logger.info(f"Shutting down...")
+    Spool.stop()
+    FeatureStore.flush()
+    StreamingStats.stop(Database.save_sketches)
+    AnomalyDetector.stop()
+    TimeSeries.stop(Database.add_hourly_usage)
     sys.exit(0)
 
 
 # Initialize Flask application
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+# Limits of the spatial search routes
+MAX_QUERY_POINTS = 1000
+MAX_NEAREST_K = 100
+MAX_RADIUS_KM = 500
+
+# Limits of the sketch routes
+MAX_QUANTILES = 20
+MAX_TOP_STATIONS = 100
+MAX_ANOMALIES = 1000
+
+# Limits of the time series route, the range is up to 20 years
+MAX_SERIES_POINTS = 5000
+MAX_SERIES_HOURS = 24 * 366 * 20
 
 # Create logger for the processor server
 __app_logger = logging.getLogger("processor-server")
@@ -24,25 +57,104 @@ __app_logger.info("All routes are created")
 signal.signal(signal.SIGINT, handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
 
+# Time the first request of each route, to report the cold-start latency
+Startup.instrument(app)
+
+
+@app.before_request
+def require_ready():
+    """Turns requests away until the tables and in-memory indexes are loaded"""
+    if request.endpoint in PROBE_ENDPOINTS or Startup.is_ready():
+        return None
+    response = jsonify({"error": "The processor is starting"})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness probe, answers as soon as the server is up"""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness probe, 200 once the startup finished and the database answers"""
+    status = Startup.status()
+    status["database"] = Database.ping()
+    return jsonify(status), 200 if status["ready"] and status["database"] else 503
+
+
+def station_registry_ready() -> bool:
+    """Loads the station registry if the startup load did not succeed
+
+    Returns:
+        bool: True if station queries can be answered from the registry
+    """
+    if not StationRegistry.is_loaded():
+        Database.load_station_registry()
+    return StationRegistry.is_loaded()
+
 
 @app.route("/get_headers", methods=["GET"])
 def get_headers():
-    headers = Database.get_headers()
-    return jsonify(headers)
+    return HttpCache.json_response(
+        "headers", Database.get_table_version("ev_with_stations"), Database.get_headers
+    )
+
+
+def parse_time_range(source) -> tuple:
+    """Reads the optional from/to bounds of a charging_start_time range
+
+    Args:
+        source (dict): The query parameters or the JSON body
+
+    Returns:
+        tuple: (start, end) datetimes, None for a missing bound. start is
+               inclusive and end exclusive
+
+    Raises:
+        ValueError: If a bound is not an ISO 8601 date or datetime, or from is after to
+    """
+    bounds = []
+    for name in ("from", "to"):
+        value = source.get(name)
+        if value in (None, ""):
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(datetime.datetime.fromisoformat(str(value)))
+        except ValueError:
+            raise ValueError(f"{name} must be an ISO 8601 date or datetime")
+    start, end = bounds
+    if start and end and start > end:
+        raise ValueError("from must not be after to")
+    return start, end
 
 
 @app.route("/get_user_info/<user_id>", methods=["GET"])
 def get_user_info(user_id):
     """Route that provides all information for a specific user from the database
 
+    Query parameters:
+        from, to (optional): Only the sessions started in [from, to), as ISO 8601 dates or datetimes
+
     Args:
         user_id: The ID of the user to retrieve information for
 
     Returns:
         Response: JSON response containing all info for the specified user from the database
     """
-    data = Database.get_info_by_username(user_id)
-    return jsonify(data)
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return HttpCache.json_response(
+        f"user_info:{user_id}:{start}:{end}",
+        Database.get_table_version("ev_with_stations"),
+        lambda: Database.get_info_by_username(user_id, start, end),
+    )
 
 
 @app.route("/get_stations", methods=["GET"])
@@ -52,8 +164,13 @@ def get_stations():
     Returns:
         Response: JSON response containing all charging stations
     """
-    stations = Database.get_stations()
-    return jsonify(stations)
+    if not station_registry_ready():
+        return HttpCache.json_response(
+            "stations", Database.get_table_version("stations"), Database.get_stations
+        )
+    return HttpCache.json_response(
+        "stations", Database.get_table_version("stations"), StationRegistry.stations_json
+    )
 
 
 @app.route("/get_stations_for_user/<user_id>", methods=["GET"])
@@ -66,8 +183,189 @@ def get_stations_for_user(user_id):
     Returns:
         Response: JSON response containing all stations and visit status
     """
-    stations = Database.get_stations_for_user(user_id)
-    return jsonify(stations)
+    version = (
+        f'{Database.get_table_version("stations")}.'
+        f'{Database.get_table_version("ev_with_stations")}'
+    )
+    if not station_registry_ready():
+        return HttpCache.json_response(
+            f"stations_for_user:{user_id}",
+            version,
+            lambda: Database.get_stations_for_user(user_id),
+        )
+    return HttpCache.json_response(
+        f"stations_for_user:{user_id}",
+        version,
+        lambda: StationRegistry.stations_for_user_json(get_visited_station_ids(user_id)),
+    )
+
+
+def get_visited_station_ids(user_id) -> list:
+    """Returns the stations visited by a user, from memory when available"""
+    if VisitedStations.is_loaded():
+        return VisitedStations.visited_ids(user_id)
+    return Database.get_visited_station_ids(user_id)
+
+
+def parse_users_param():
+    """Reads the comma-separated users query parameter
+
+    Returns:
+        list[str]: The requested users, None if the parameter is missing
+    """
+    users = request.args.get("users")
+    if users is None:
+        return None
+    return [user.strip() for user in users.split(",") if user.strip()]
+
+
+@app.route("/stations/visited", methods=["GET"])
+def stations_visited():
+    """Route that provides the stations visited by any (or all) of the given users
+
+    Query parameters:
+        users: Comma-separated user IDs
+        mode: "any" (default) or "all"
+
+    Returns:
+        Response: JSON list of station IDs
+    """
+    users = parse_users_param()
+    if not users:
+        return jsonify({"error": "Missing users query parameter"}), 400
+
+    mode = request.args.get("mode", "any")
+    if mode not in ("any", "all"):
+        return jsonify({"error": "mode must be 'any' or 'all'"}), 400
+    if not VisitedStations.is_loaded():
+        return jsonify({"error": "Visited stations are not available"}), 503
+
+    if mode == "all":
+        return jsonify(VisitedStations.visited_by_all(users))
+    return jsonify(VisitedStations.visited_by_any(users))
+
+
+@app.route("/stations/most_shared", methods=["GET"])
+def stations_most_shared():
+    """Route that provides the stations visited by the largest number of users
+
+    Query parameters:
+        top: Number of stations to return (default 10)
+        users: Optional comma-separated user IDs to restrict the count to
+
+    Returns:
+        Response: JSON list of {"station_id", "users"} ordered by number of users
+    """
+    try:
+        top = int(request.args.get("top", 10))
+    except ValueError:
+        return jsonify({"error": "top must be an integer"}), 400
+    if top < 1:
+        return jsonify({"error": "top must be positive"}), 400
+    if not VisitedStations.is_loaded():
+        return jsonify({"error": "Visited stations are not available"}), 503
+
+    return jsonify(VisitedStations.most_shared(top, parse_users_param()))
+
+
+def parse_query_points():
+    """Reads the query points of a spatial search request
+
+    Points come from the lat/lon query parameters (GET) or from a JSON body
+    with a "points" list of {"lat", "lon"} objects (POST, batch queries).
+
+    Returns:
+        tuple: (latitudes, longitudes, options, error) where options holds the
+               remaining request parameters and error is None if valid
+    """
+    if request.method == "POST":
+        json_data = request.get_json(silent=True)
+        if not json_data or not isinstance(json_data.get("points"), list):
+            return None, None, None, "Missing points list in JSON body"
+        raw_points = json_data["points"]
+        options = json_data
+    else:
+        raw_points = [{"lat": request.args.get("lat"), "lon": request.args.get("lon")}]
+        options = request.args
+
+    if not raw_points:
+        return None, None, None, "At least one point is required"
+    if len(raw_points) > MAX_QUERY_POINTS:
+        return None, None, None, f"At most {MAX_QUERY_POINTS} points per request"
+
+    latitudes, longitudes = [], []
+    for point in raw_points:
+        try:
+            latitude = float(point.get("lat"))
+            longitude = float(point.get("lon"))
+        except (AttributeError, TypeError, ValueError):
+            return None, None, None, "Each point needs numeric lat and lon"
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            return None, None, None, "lat must be in [-90, 90] and lon in [-180, 180]"
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+
+    return latitudes, longitudes, options, None
+
+
+@app.route("/stations/nearest", methods=["GET", "POST"])
+def stations_nearest():
+    """Route that provides the k nearest charging stations to one or more points
+
+    Returns:
+        Response: JSON list of stations ordered by distance (GET), or
+                  {"results": [...]} with one list per point (POST)
+    """
+    latitudes, longitudes, options, error = parse_query_points()
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        k = int(options.get("k", 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be an integer"}), 400
+    if not 1 <= k <= MAX_NEAREST_K:
+        return jsonify({"error": f"k must be between 1 and {MAX_NEAREST_K}"}), 400
+
+    if not station_registry_ready():
+        return jsonify({"error": "Stations are not available"}), 503
+
+    results = SpatialIndex.nearest(latitudes, longitudes, k)
+    if request.method == "POST":
+        return jsonify({"results": results})
+    return jsonify(results[0])
+
+
+@app.route("/stations/within", methods=["GET", "POST"])
+def stations_within():
+    """Route that provides the charging stations within a radius of one or more points
+
+    Returns:
+        Response: JSON list of stations ordered by distance (GET), or
+                  {"results": [...]} with one list per point (POST)
+    """
+    latitudes, longitudes, options, error = parse_query_points()
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        radius_km = float(options.get("radius_km"))
+        limit = options.get("limit")
+        limit = int(limit) if limit is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "radius_km must be a number and limit an integer"}), 400
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        return jsonify({"error": f"radius_km must be in ]0, {MAX_RADIUS_KM}]"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    if not station_registry_ready():
+        return jsonify({"error": "Stations are not available"}), 503
+
+    results = SpatialIndex.within(latitudes, longitudes, radius_km, limit)
+    if request.method == "POST":
+        return jsonify({"results": results})
+    return jsonify(results[0])
 
 
 @app.route("/get_users", methods=["GET"])
@@ -77,19 +375,31 @@ def get_users():
     Returns:
         Response: JSON response containing all users
     """
-    users = Database.get_all_users()
-    return jsonify(users)
+    return HttpCache.json_response(
+        "users", Database.get_table_version("ev_with_stations"), Database.get_all_users
+    )
 
 
 @app.route("/get_all_users_info", methods=["GET"])
 def get_all_users_info():
     """Route that provides information for all users combined
 
+    Query parameters:
+        from, to (optional): Only the sessions started in [from, to), as ISO 8601 dates or datetimes
+
     Returns:
         Response: JSON response containing all information for all users
     """
-    data = Database.get_all_users_info()
-    return jsonify(data)
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return HttpCache.json_response(
+        f"all_users_info:{start}:{end}",
+        Database.get_table_version("ev_with_stations"),
+        lambda: Database.get_all_users_info(start, end),
+    )
 
 
 @app.route("/classify", methods=["POST"])
@@ -108,38 +418,342 @@ def classify():
     if not feat1 or not feat2:
         return jsonify({"error": "Missing feat1 or feat2 in JSON body"}), 400
 
-    # Get data from the database
-    db_data = Database.get_values_for_features(feat1, feat2)
-    if "error" in db_data:
-        return jsonify(db_data), 400
-
-    data = db_data.get("data")
-    if not data:
-        return jsonify({"error": "No data found for the given features"}), 404
-
-    # Prepare data for the ML service
-    feat1_list = [d[feat1] for d in data]
-    feat2_list = [d[feat2] for d in data]
-
-    # Convert datetime objects to strings
-    feat1_list = [val.isoformat() if isinstance(val, datetime.datetime) else val for val in feat1_list]
-    feat2_list = [val.isoformat() if isinstance(val, datetime.datetime) else val for val in feat2_list]
+    try:
+        start, end = parse_time_range(json_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The feature store has no start times, time-bounded requests are answered by
+    # the database, which only scans the partitions of the range
+    if start is None and end is None and FeatureStore.has_columns(feat1, feat2):
+        # Numeric features are sliced from the in-memory columns, without a table scan.
+        # The arrays are serialised as-is, NaN becoming null
+        feat1_list, feat2_list = FeatureStore.get_columns(feat1, feat2)
+        if len(feat1_list) == 0:
+            return jsonify({"error": "No data found for the given features"}), 404
+
+        kinds = {feat1: "numeric", feat2: "numeric"}
+    else:
+        # Get data from the database
+        db_data = Database.get_values_for_features(feat1, feat2, start, end)
+        if "error" in db_data:
+            return jsonify(db_data), 400
+
+        # Prepare data for the ML service, timestamps already come as epoch seconds
+        feat1_list, feat2_list = db_data["columns"]
+        if not feat1_list:
+            return jsonify({"error": "No data found for the given features"}), 404
+        kinds = db_data["kinds"]
 
     ml_payload = {
         "feat1_name": feat1,
         "feat2_name": feat2,
         "feat1_list": feat1_list,
-        "feat2_list": feat2_list
+        "feat2_list": feat2_list,
+        "feat1_type": kinds[feat1],
+        "feat2_type": kinds[feat2],
     }
+    # Response mode (summary, sample, density or full), its budget and the clustering
+    # engine, checked by the ML service
+    for option in ("mode", "max_points", "grid_size", "engine", "validate"):
+        if option in json_data:
+            ml_payload[option] = json_data[option]
 
     try:
         ml_url = "http://ml:5000/classify"
-        response = requests.post(ml_url, json=ml_payload)
+        response = requests.post(
+            ml_url, data=app.json.dumps_bytes(ml_payload), headers={"Content-Type": "application/json"}
+        )
+        if response.status_code == 400:
+            # Invalid options are reported back as-is
+            return passthrough_response(response.content, 400)
         response.raise_for_status()
-        return jsonify(response.json())
+        # The clustering is forwarded without being parsed and serialised again
+        return passthrough_response(response.content)
     except requests.exceptions.RequestException as e:
         __app_logger.error(f"Could not connect to ml service: {e}")
         return jsonify({"error": "Could not connect to ml service"}), 500
 
+def parse_quantiles_param():
+    """Reads the q query parameter, comma-separated fractions between 0 and 1
+
+    Returns:
+        list[float]: The fractions, the median, p90 and p99 by default
+
+    Raises:
+        ValueError: If a fraction is not a number between 0 and 1
+    """
+    values = request.args.get("q")
+    if not values:
+        return [0.5, 0.9, 0.99]
+    fractions = [float(value) for value in values.split(",") if value.strip()]
+    if not fractions or len(fractions) > MAX_QUANTILES or not all(0 <= f <= 1 for f in fractions):
+        raise ValueError(f"q must be 1 to {MAX_QUANTILES} comma-separated numbers between 0 and 1")
+    return fractions
+
+
+@app.route("/sketches/summary", methods=["GET"])
+def sketches_summary():
+    """Route that provides approximate analytics over every session
+
+    Query parameters:
+        q (optional): Comma-separated quantile fractions (default 0.5,0.9,0.99)
+
+    Returns:
+        Response: JSON with sessions, energy_kwh, distinct_users and the duration,
+                  energy and cost quantiles
+    """
+    try:
+        fractions = parse_quantiles_param()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not StreamingStats.is_loaded():
+        return jsonify({"error": "Sketches are not available"}), 503
+    return jsonify(StreamingStats.overall(fractions))
+
+
+@app.route("/sketches/stations/<station_id>", methods=["GET"])
+def sketches_station(station_id):
+    """Route that provides approximate analytics of a station
+
+    Query parameters:
+        q (optional): Comma-separated quantile fractions (default 0.5,0.9,0.99)
+
+    Returns:
+        Response: Same JSON as /sketches/summary, restricted to the station
+    """
+    try:
+        fractions = parse_quantiles_param()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not StreamingStats.is_loaded():
+        return jsonify({"error": "Sketches are not available"}), 503
+
+    stats = StreamingStats.station(station_id, fractions)
+    if stats is None:
+        return jsonify({"error": f"No sessions for station {station_id}"}), 404
+    return jsonify({"station_id": station_id, **stats})
+
+
+@app.route("/sketches/regions/<level>/<int:code>", methods=["GET"])
+def sketches_region(level, code):
+    """Route that provides the sessions, energy and distinct users of a region
+
+    Args:
+        level: "district" or "municipality"
+        code: District code, or district and municipality code (e.g. 1106)
+
+    Returns:
+        Response: JSON with sessions, energy_kwh and distinct_users
+    """
+    if level not in SKETCH_REGION_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(SKETCH_REGION_LEVELS)}"}), 400
+    if not StreamingStats.is_loaded():
+        return jsonify({"error": "Sketches are not available"}), 503
+
+    stats = StreamingStats.region(level, code)
+    if stats is None:
+        return jsonify({"error": f"No sessions for {level} {code}"}), 404
+    return jsonify({"level": level, "code": code, **stats})
+
+
+@app.route("/sketches/top_stations", methods=["GET"])
+def sketches_top_stations():
+    """Route that provides the stations with the most energy or sessions
+
+    Query parameters:
+        by (optional): "energy" (default) or "sessions"
+        top (optional): Number of stations to return (default 10)
+
+    Returns:
+        Response: JSON list of {"station_id", <by>, "error"}, heaviest first, where
+                  error bounds how much the value may be overestimated
+    """
+    by = request.args.get("by", "energy")
+    if by not in ("energy", "sessions"):
+        return jsonify({"error": "by must be energy or sessions"}), 400
+    try:
+        top = int(request.args.get("top", 10))
+    except ValueError:
+        return jsonify({"error": "top must be an integer"}), 400
+    if not 1 <= top <= MAX_TOP_STATIONS:
+        return jsonify({"error": f"top must be between 1 and {MAX_TOP_STATIONS}"}), 400
+    if not StreamingStats.is_loaded():
+        return jsonify({"error": "Sketches are not available"}), 503
+
+    return jsonify(StreamingStats.top_stations(by, top))
+
+
+@app.route("/sketches/users/<user_id>", methods=["GET"])
+def sketches_user(user_id):
+    """Route that provides the approximate sessions and energy of a user
+
+    Returns:
+        Response: JSON with sessions and energy_kwh, which are never underestimated
+    """
+    if not StreamingStats.is_loaded():
+        return jsonify({"error": "Sketches are not available"}), 503
+    return jsonify({"user_id": user_id, **StreamingStats.user(user_id)})
+
+
+@app.route("/regions/stats", methods=["GET"])
+def regions_stats():
+    """Route that provides the sessions, energy, cost and distinct users of every region
+
+    Query parameters:
+        level (optional): "district" (default), "municipality" or "parish"
+        parent (optional): Only the municipalities of this district, or the
+                           parishes of this municipality
+
+    Returns:
+        Response: JSON with the level and its regions, ordered by code, including
+                  the regions without sessions
+    """
+    level = request.args.get("level", "district")
+    if level not in REGION_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(REGION_LEVELS)}"}), 400
+    parent = request.args.get("parent")
+    if parent is not None:
+        if level == "district":
+            return jsonify({"error": "parent is only valid for municipalities and parishes"}), 400
+        try:
+            parent = int(parent)
+        except ValueError:
+            return jsonify({"error": "parent must be an integer"}), 400
+    if not RegionStats.is_loaded():
+        return jsonify({"error": "Region statistics are not available"}), 503
+
+    return HttpCache.json_response(
+        f"regions:{level}:{parent}",
+        RegionStats.get_version(),
+        lambda: {"level": level, "regions": RegionStats.stats(level, parent)},
+    )
+
+
+@app.route("/timeseries", methods=["GET"])
+def timeseries():
+    """Route that provides the hourly series of a station, region or user, downsampled
+
+    Query parameters:
+        station_id, region or user_id (optional): The series to read, at most one,
+                                                  every session by default
+        level (optional): Level of region, "district" (default), "municipality" or "parish"
+        metric (optional): "occupancy" (default, average sessions charging during
+                           the hour), "energy_kwh" or "sessions" (started)
+        from, to (optional): ISO 8601 range, the first to the last session by default
+        points (optional): Maximum number of points, 500 by default
+        downsampling (optional): "lttb" (default) or "minmax"
+
+    Returns:
+        Response: JSON with the series, its range and number of hours, and the
+                  timestamps and values of the kept hours
+    """
+    selectors = [name for name in ("station_id", "region", "user_id") if request.args.get(name)]
+    if len(selectors) > 1:
+        return jsonify({"error": "Only one of station_id, region and user_id can be given"}), 400
+    if not selectors:
+        scope, key = "all", ""
+    elif selectors[0] == "region":
+        scope = request.args.get("level", "district")
+        if scope not in REGION_LEVELS:
+            return jsonify({"error": f"level must be one of {', '.join(REGION_LEVELS)}"}), 400
+        key = request.args["region"].strip()
+        if scope != "parish":
+            try:
+                key = str(int(key))
+            except ValueError:
+                return jsonify({"error": "region must be an integer"}), 400
+    else:
+        scope, key = selectors[0].removesuffix("_id"), request.args[selectors[0]]
+
+    metric = request.args.get("metric", "occupancy")
+    if metric not in SERIES_METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(SERIES_METRICS)}"}), 400
+    method = request.args.get("downsampling", "lttb")
+    if method not in DOWNSAMPLING_METHODS:
+        return jsonify({"error": f"downsampling must be one of {', '.join(DOWNSAMPLING_METHODS)}"}), 400
+    try:
+        points = int(request.args.get("points", 500))
+    except ValueError:
+        return jsonify({"error": "points must be an integer"}), 400
+    if not 3 <= points <= MAX_SERIES_POINTS:
+        return jsonify({"error": f"points must be between 3 and {MAX_SERIES_POINTS}"}), 400
+    try:
+        start, end = parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not TimeSeries.is_loaded():
+        return jsonify({"error": "Time series are not available"}), 503
+
+    bounds = TimeSeries.bounds(scope, key, start, end)
+    if bounds is None:
+        return jsonify({"error": f"No sessions for {scope} {key}".rstrip()}), 404
+    first, last, version = bounds
+    if last - first + 1 > MAX_SERIES_HOURS:
+        return jsonify({"error": f"The range can not be longer than {MAX_SERIES_HOURS} hours"}), 400
+    return HttpCache.json_response(
+        f"timeseries:{scope}:{key}:{metric}:{first}:{last}:{points}:{method}",
+        version,
+        lambda: {
+            "scope": scope,
+            "key": key or None,
+            "metric": metric,
+            **TimeSeries.query(scope, key, metric, first, last, points, method),
+        },
+    )
+
+
+@app.route("/anomalies", methods=["GET"])
+def anomalies():
+    """Route that provides the latest anomalies found in the ingested sessions
+
+    Query parameters:
+        limit (optional): Number of anomalies to return, 100 by default
+        kind (optional): Only anomalies of this kind (e.g. rate_above_station_limit)
+        station (optional): Only anomalies of this station
+        user (optional): Only anomalies of this user
+
+    Returns:
+        Response: JSON with the anomalies, newest first, and the detector counters
+    """
+    try:
+        limit = int(request.args.get("limit", 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_ANOMALIES:
+        return jsonify({"error": f"limit must be between 1 and {MAX_ANOMALIES}"}), 400
+
+    rows = Database.get_anomalies(
+        limit, request.args.get("kind"), request.args.get("station"), request.args.get("user")
+    )
+    return jsonify({"anomalies": rows, "detector": AnomalyDetector.status()})
+
+
+@app.route("/debug/queries", methods=["GET", "DELETE"])
+def debug_queries():
+    """Route that shows where the database time goes
+
+    GET returns the Database methods and statements with the most total time and
+    the plans captured for the last slow statements, DELETE resets them.
+
+    Query parameters:
+        limit (optional): Number of entries of each list, 20 by default
+
+    Returns:
+        Response: JSON response with the query profile
+    """
+    if request.method == "DELETE":
+        QueryProfiler.reset()
+        return jsonify({"reset": True})
+
+    try:
+        limit = int(request.args.get("limit", 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit <= 0:
+        return jsonify({"error": "limit must be positive"}), 400
+    return jsonify(QueryProfiler.report(limit))
+
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,15 @@
+import math
+
+
+# Every subsystem fed by the insert listeners converts the record values with
+# this helper, so a session is counted or skipped the same way by all of them
+
+
+def to_float(value):
+    """Converts a record value to float, None if it is missing, not a number,
+    NaN or infinite"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
@@ -1,7 +1,26 @@
 import os
 import io
+import gzip
+import datetime
+import itertools
+import time
+import threading
 import psycopg2
 from psycopg2 import pool
+from station_registry import StationRegistry
+from visited_stations import VisitedStations
+from feature_store import FeatureStore
+from streaming_stats import StreamingStats, QUANTILE_METRICS
+from anomaly_detector import AnomalyDetector, STAT_METRICS, STAT_SCOPES
+from regions import RegionStats, REGION_COLUMNS, REGION_COLUMN_TYPES
+from timeseries import TimeSeries, SERIES_SCOPES, MAX_SESSION_HOURS
+from dedup import session_key, RecentKeys
+from prepared import PreparedConnection
+from replicas import ReplicaSet, parse_lsn
+from query_profiler import ProfilingCursor, QueryProfiler
+from startup import Startup
+import compact_schema
+import partitioning
 import logging
 
 
@@ -12,37 +31,115 @@ class Database:
     """
 
     __db_pool = None
+    # The startup thread and the readiness probe can both create the pool
+    __pool_lock = threading.Lock()
     __logger = logging.getLogger("database")
     __logger.setLevel(logging.INFO)
 
+    # Versions are bumped every time a table changes, used to build ETags
+    __version_counter = itertools.count(1)
+    __table_versions = {"ev_with_stations": 0, "stations": 0}
+    # WAL position of the primary at the last version bump: cached payloads are
+    # keyed by version, so they are only read from replicas that replayed it
+    __versioned_lsn = 0
+
+    # Callables notified with every record inserted by the ingestion path
+    __insert_listeners = []
+
+    # 'wide' keeps ev_with_stations as a plain table, 'compact' stores the sessions
+    # dictionary-encoded behind an ev_with_stations view (see compact_schema)
+    __schema_mode = os.getenv("EV_SCHEMA_MODE", "wide")
+    # Physical table holding the sessions, partitioned by month of charging_start_time
+    __sessions_table = "ev_sessions" if __schema_mode == "compact" else "ev_with_stations"
+    # First day of every month known to have its own partition
+    __partition_months = set()
+
+    # Columns of ev_with_stations returned by the read routes, without the region codes
+    __public_columns = ()
+
+    # Steps of init_db, in order, with the version of the one-time ones (None for
+    # the steps run on every start). Bump the version of a step when it changes,
+    # so the databases where it was applied run it again
+    __INIT_STEPS = (
+        ("init_ev_with_stations_table", 1),
+        ("init_partitions", None),
+        ("init_summary_table", 2),
+        ("init_ingested_keys_table", 2),
+        ("init_sketches_table", 1),
+        ("init_anomalies_table", 1),
+        ("init_stations_table", 1),
+        ("init_session_regions", 1),
+        ("init_timeseries_table", 1),
+    )
+    # In-memory indexes loaded by init_db once the tables are ready
+    __LOAD_STEPS = (
+        "load_station_registry",
+        "load_visited_stations",
+        "load_feature_store",
+        "load_streaming_stats",
+        "load_anomaly_stats",
+        "load_region_stats",
+        "load_timeseries",
+    )
+
+    # Columns of ev_with_stations with their types, in table order
+    __COLUMN_TYPES_SQL = """
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_name = 'ev_with_stations'
+        ORDER BY ordinal_position
+    """
+
     @classmethod
     def __get_db_pool(cls):
         """
-        Initializes and returns the connection pool
+        Initializes and returns the connection pool of the primary (writer)
         This method is private to the class
         """
-        if cls.__db_pool is None:
-            try:
-                cls.__db_pool = pool.ThreadedConnectionPool(
-                    1,  # minconn
-                    10,  # maxconn
-                    user=os.getenv("DB_USER"),
-                    password=os.getenv("DB_PASSWORD"),
-                    host="db",
-                    port="5432",
-                    database=os.getenv("DB_NAME"),
-                )
-                cls.__logger.info("Database connection pool created successfully")
-            except psycopg2.OperationalError as e:
-                cls.__logger.error(f"Error creating database connection pool: {e}")
-                raise
+        if cls.__db_pool is not None:
+            return cls.__db_pool
+        with cls.__pool_lock:
+            if cls.__db_pool is None:
+                connect_kwargs = {
+                    "user": os.getenv("DB_USER"),
+                    "password": os.getenv("DB_PASSWORD"),
+                    "database": os.getenv("DB_NAME"),
+                    # Every query is timed and attributed to the Database method running it
+                    "cursor_factory": ProfilingCursor,
+                }
+                try:
+                    cls.__db_pool = pool.ThreadedConnectionPool(
+                        1,  # minconn
+                        int(os.getenv("DB_POOL_MAX", "10")),  # maxconn
+                        host="db",
+                        port="5432",
+                        # Hot queries are prepared once per pooled connection
+                        connection_factory=PreparedConnection,
+                        **connect_kwargs,
+                    )
+                    cls.__logger.info("Database connection pool created successfully")
+                except psycopg2.OperationalError as e:
+                    cls.__logger.error(f"Error creating database connection pool: {e}")
+                    raise
+                QueryProfiler.configure(__file__, cls.__get_db_connection, cls.__release_db_connection)
+                # Read endpoints get their own pools, so scans never take the writer's connections
+                ReplicaSet.configure(os.getenv("DB_READ_HOSTS", ""), connect_kwargs, cls.__primary_lsn)
         return cls.__db_pool
 
     @classmethod
-    def __get_db_connection(cls):
-        """Gets a connection from the pool"""
+    def __get_db_connection(cls, read_only=False):
+        """Gets a connection from the pool
+
+        Args:
+            read_only (bool): The connection is only used for reads, so it may come
+                              from a replica that replayed the last versioned write
+                              instead of the primary
+        """
         try:
             pool = cls.__get_db_pool()
+            if read_only and ReplicaSet.enabled():
+                conn = ReplicaSet.getconn(cls.__versioned_lsn)
+                if conn:
+                    return conn
             return pool.getconn()
         except Exception as e:
             cls.__logger.error(f"Error getting connection from pool: {e}")
@@ -50,11 +147,84 @@ class Database:
 
     @classmethod
     def __release_db_connection(cls, conn):
-        """Returns a connection to the pool"""
+        """Returns a connection to the pool it was taken from"""
         if conn:
+            if getattr(conn, "replica", None) is not None:
+                ReplicaSet.putconn(conn)
+                return
             pool = cls.__get_db_pool()
             pool.putconn(conn)
 
+    @classmethod
+    def __primary_lsn(cls):
+        """Returns the current WAL position of the primary, None if it could not be read"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_current_wal_lsn()::text;")
+                return parse_lsn(cur.fetchone()[0])
+        except Exception as e:
+            cls.__logger.error(f"Error reading the WAL position of the primary: {e}")
+            return None
+        finally:
+            conn.rollback()
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def __record_write(cls):
+        """Makes the next reads of this thread wait for replicas to replay its committed writes
+
+        Returns:
+            int: The WAL position of the primary, None without replicas
+        """
+        if ReplicaSet.enabled():
+            lsn = cls.__primary_lsn()
+            ReplicaSet.record_write(lsn)
+            return lsn
+        return None
+
+    @classmethod
+    def add_insert_listener(cls, listener):
+        """Registers a callable notified with each record inserted into ev_with_stations
+
+        Args:
+            listener (callable): Receives the inserted record as a dict keyed by column name
+        """
+        cls.__insert_listeners.append(listener)
+
+    @classmethod
+    def __notify_insert(cls, record: dict):
+        """Notifies the insert listeners, a failing listener never fails the insert"""
+        for listener in cls.__insert_listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                cls.__logger.error(f"Error in insert listener {listener}: {e}", exc_info=True)
+
+    @classmethod
+    def __bump_table_version(cls, table_name, lsn=None):
+        """Marks the specified table as changed
+
+        Args:
+            table_name (str): The table
+            lsn (int, optional): WAL position of the primary after the committed change,
+                                 read here if not given and there are replicas
+        """
+        if ReplicaSet.enabled():
+            if lsn is None:
+                lsn = cls.__primary_lsn()
+            # Set before the version, so a read of the new version never goes to a
+            # replica that lacks the change. An unknown position sends reads to the primary
+            cls.__versioned_lsn = max(cls.__versioned_lsn, lsn if lsn is not None else float("inf"))
+        cls.__table_versions[table_name] = next(cls.__version_counter)
+
+    @classmethod
+    def get_table_version(cls, table_name):
+        """Returns the current version of the specified table"""
+        return cls.__table_versions.get(table_name, 0)
+
     @classmethod
     def __db_is_empty(cls, table_name):
         """Checks if the specified table exists and has data"""
@@ -67,25 +237,12 @@ class Database:
 
         try:
             with conn.cursor() as cur:
-                # Check if table exists
-                cur.execute(
-                    """
-                    SELECT EXISTS (
-                        SELECT FROM information_schema.tables
-                        WHERE table_name = %s
-                    );
-                """,
-                    (table_name,),
-                )
-                table_exists = cur.fetchone()[0]
-
-                if not table_exists:
+                # Reads one row at most, where COUNT(*) would scan the whole table
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table_name,))
+                if not cur.fetchone()[0]:
                     return True
-
-                # Check if table has any rows
-                cur.execute(f"SELECT COUNT(*) FROM {table_name};")
-                count = cur.fetchone()[0]
-                return count == 0
+                cur.execute(f"SELECT EXISTS (SELECT FROM {table_name});")
+                return not cur.fetchone()[0]
         except Exception as e:
             cls.__logger.error(
                 f"Error checking if database table {table_name} is empty: {e}"
@@ -96,17 +253,143 @@ class Database:
 
     @classmethod
     def init_db(cls):
-        """Initializes all database tables"""
+        """Initializes all database tables and loads the in-memory indexes
+
+        The one-time steps (see __INIT_STEPS) return True once they are done and are
+        recorded in schema_migrations, so later starts skip them and only check the
+        partitions and load the indexes. Every step is timed as a startup phase.
+        """
         cls.__logger.info("Initializing all database tables...")
-        cls.init_ev_with_stations_table()
-        cls.init_stations_table()
+        applied = cls.__applied_migrations()
+        skipped = 0
+        for step, version in cls.__INIT_STEPS:
+            if version is not None and applied.get(step) == version:
+                skipped += 1
+                continue
+            with Startup.phase(step):
+                done = getattr(cls, step)()
+            if version is not None and done:
+                cls.__record_migration(step, version)
+        if skipped:
+            cls.__logger.info(f"Skipped {skipped} schema migrations already applied")
+        cls.__record_write()
+        for step in cls.__LOAD_STEPS:
+            with Startup.phase(step):
+                getattr(cls, step)()
+
+    @classmethod
+    def __applied_migrations(cls) -> dict:
+        """Creates schema_migrations if needed and returns the version of every step
+        applied in the current schema mode"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to read the schema migrations")
+            return {}
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        name TEXT NOT NULL,
+                        schema_mode TEXT NOT NULL,
+                        version INTEGER NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                        PRIMARY KEY (name, schema_mode)
+                    );
+                    SELECT name, version FROM schema_migrations WHERE schema_mode = %s;
+                """,
+                    (cls.__schema_mode,),
+                )
+                applied = dict(cur.fetchall())
+                conn.commit()
+                return applied
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error reading the schema migrations: {e}")
+            return {}
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def __record_migration(cls, name: str, version: int):
+        """Records a one-time step of init_db as applied in the current schema mode"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error(f"Could not get DB connection to record the migration {name}")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO schema_migrations (name, schema_mode, version) VALUES (%s, %s, %s)
+                    ON CONFLICT (name, schema_mode)
+                    DO UPDATE SET version = EXCLUDED.version, applied_at = now();
+                """,
+                    (name, cls.__schema_mode, version),
+                )
+                conn.commit()
+                cls.__logger.info(f"Applied the schema migration {name} (version {version})")
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error recording the migration {name}: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def ping(cls) -> bool:
+        """Checks that the primary answers a query, used by the readiness probe"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+                cur.fetchone()
+            conn.rollback()
+            return True
+        except Exception as e:
+            cls.__logger.error(f"Database ping failed: {e}")
+            return False
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def wait_until_ready(cls, timeout=None) -> bool:
+        """Waits for the primary to accept connections, retrying with a growing delay
+
+        Args:
+            timeout (float, optional): Seconds to wait at most, DB_STARTUP_TIMEOUT
+                                       (60 by default) if not given
+
+        Returns:
+            bool: True if the database answered before the timeout
+        """
+        if timeout is None:
+            timeout = float(os.getenv("DB_STARTUP_TIMEOUT", "60"))
+        deadline = time.monotonic() + timeout
+        delay = 0.25
+        while True:
+            if cls.ping():
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            cls.__logger.info(f"Database is not ready, retrying in {delay:.2f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 5)
 
     @classmethod
     def init_ev_with_stations_table(cls):
         """Initializes the ev_with_stations table from the original CSV"""
+        if cls.__schema_mode == "compact":
+            cls.__init_compact_schema()
+        else:
+            cls.__partition_wide_table()
+
         if not cls.__db_is_empty("ev_with_stations"):
             cls.__logger.info("Table ev_with_stations is not empty")
-            return
+            return True
         cls.__logger.info(
             "Table ev_with_stations is empty. Initializing database from CSV..."
         )
@@ -157,9 +440,17 @@ class Database:
                     f"{name} {ctype}" for name, ctype in zip(column_names, column_types)
                 ]
 
-                create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(column_definitions)});"
+                # In compact mode the CSV is staged in a temporary table with the wide
+                # layout and then moved into the compact tables in a few set-based inserts
+                copy_table = table_name
+                create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(column_definitions)}) {partitioning.PARTITION_BY};"
+                if cls.__schema_mode == "compact":
+                    copy_table = "ev_with_stations_staging"
+                    create_table_sql = f"CREATE TEMP TABLE {copy_table} ({', '.join(column_definitions)}) ON COMMIT DROP;"
                 cur.execute(create_table_sql)
-                cls.__logger.info(f"Table '{table_name}' created")
+                if cls.__schema_mode != "compact":
+                    cls.__create_wide_partitioning(cur)
+                cls.__logger.info(f"Table '{copy_table}' created")
 
                 with open(csv_path, "r", encoding="utf-8-sig") as f:
                     csv_content_str = f.read().splitlines(True)[1:]
@@ -170,13 +461,18 @@ class Database:
 
                 # 4. Use the COPY command for high-performance bulk insertion
                 cur.execute("SET datestyle = 'DMY';")
-                copy_sql = f"COPY {table_name} FROM STDIN WITH (FORMAT CSV, DELIMITER ';', HEADER FALSE, NULL '')"
+                copy_sql = f"COPY {copy_table} FROM STDIN WITH (FORMAT CSV, DELIMITER ';', HEADER FALSE, NULL '')"
                 cur.copy_expert(sql=copy_sql, file=string_io_file)
 
+                if cls.__schema_mode == "compact":
+                    cur.execute(compact_schema.bulk_load_sql(copy_table))
+
                 conn.commit()
+                cls.__bump_table_version(table_name)
                 cls.__logger.info(
                     f"Successfully loaded data from '{csv_path}' into '{table_name}'"
                 )
+                return True
 
         except Exception as e:
             if conn:
@@ -187,12 +483,487 @@ class Database:
             if conn:
                 cls.__release_db_connection(conn)
 
+    @classmethod
+    def __init_compact_schema(cls):
+        """
+        Creates the compact tables and the ev_with_stations view, converting an
+        existing wide ev_with_stations table or an unpartitioned ev_sessions table
+        if there is one
+        """
+        conn = None
+        try:
+            conn = cls.__get_db_connection()
+            if not conn:
+                cls.__logger.error("Could not get DB connection to create the compact schema")
+                return
+
+            with conn.cursor() as cur:
+                from_wide = cls.__relkind(cur, "ev_with_stations") in ("r", "p")
+                if from_wide:
+                    cur.execute("ALTER TABLE ev_with_stations RENAME TO ev_with_stations_wide;")
+
+                # Compact tables created before partitioning are moved to a partitioned one
+                from_unpartitioned = cls.__relkind(cur, "ev_sessions") == "r"
+                if from_unpartitioned:
+                    cur.execute("DROP VIEW IF EXISTS ev_with_stations;")
+                    cur.execute("ALTER TABLE ev_sessions RENAME TO ev_sessions_unpartitioned;")
+                    cur.execute("DROP INDEX IF EXISTS ev_sessions_user_key_idx, ev_sessions_station_key_idx;")
+
+                cur.execute(compact_schema.CREATE_SCHEMA_SQL)
+
+                if from_wide:
+                    cls.__logger.info("Converting ev_with_stations to the compact schema...")
+                    cur.execute(compact_schema.bulk_load_sql("ev_with_stations_wide"))
+                    cur.execute("DROP TABLE ev_with_stations_wide;")
+                if from_unpartitioned:
+                    cls.__logger.info("Partitioning ev_sessions...")
+                    cur.execute("INSERT INTO ev_sessions SELECT * FROM ev_sessions_unpartitioned ORDER BY ctid;")
+                    cur.execute("DROP TABLE ev_sessions_unpartitioned;")
+
+                conn.commit()
+                if from_wide or from_unpartitioned:
+                    cls.__bump_table_version("ev_with_stations")
+                cls.__logger.info("Compact schema of ev_with_stations is ready")
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            cls.__logger.error(f"Error creating the compact schema: {e}")
+            raise e
+        finally:
+            if conn:
+                cls.__release_db_connection(conn)
+
+    @classmethod
+    def __partition_wide_table(cls):
+        """Converts an ev_with_stations table created before partitioning to a partitioned one"""
+        conn = None
+        try:
+            conn = cls.__get_db_connection()
+            if not conn:
+                cls.__logger.error("Could not get DB connection to partition ev_with_stations")
+                return
+
+            with conn.cursor() as cur:
+                if cls.__relkind(cur, "ev_with_stations") != "r":
+                    return
+
+                cls.__logger.info("Partitioning ev_with_stations...")
+                cur.execute("ALTER TABLE ev_with_stations RENAME TO ev_with_stations_unpartitioned;")
+                cur.execute(
+                    "CREATE TABLE ev_with_stations (LIKE ev_with_stations_unpartitioned) "
+                    f"{partitioning.PARTITION_BY};"
+                )
+                cls.__create_wide_partitioning(cur)
+                cur.execute(
+                    "INSERT INTO ev_with_stations SELECT * FROM ev_with_stations_unpartitioned ORDER BY ctid;"
+                )
+                cur.execute("DROP TABLE ev_with_stations_unpartitioned;")
+                conn.commit()
+                cls.__bump_table_version("ev_with_stations")
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            cls.__logger.error(f"Error partitioning ev_with_stations: {e}")
+            raise e
+        finally:
+            if conn:
+                cls.__release_db_connection(conn)
+
+    @classmethod
+    def __create_wide_partitioning(cls, cur):
+        """Creates the default partition and the indexes of the wide ev_with_stations table"""
+        cur.execute(partitioning.partitioned_table_sql("ev_with_stations"))
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS ev_with_stations_user_start_idx "
+            "ON ev_with_stations (user_id, charging_start_time);"
+        )
+
+    @staticmethod
+    def __relkind(cur, table_name):
+        """Returns the kind of a relation ('r' table, 'p' partitioned table, 'v' view), None if missing"""
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table_name,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    @classmethod
+    def init_partitions(cls):
+        """
+        Creates the monthly partitions of the sessions found in the default
+        partition (e.g. after a CSV load or a conversion) and records the
+        months that have a partition
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to initialize the partitions")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                if cls.__relkind(cur, cls.__sessions_table) != "p":
+                    cls.__logger.warning(f"Table {cls.__sessions_table} is not partitioned")
+                    return
+
+                cur.execute(partitioning.default_partition_months_sql(cls.__sessions_table))
+                months = [row[0] for row in cur.fetchall()]
+                for month in months:
+                    cur.execute(
+                        "SELECT ev_ensure_month_partition(%s, %s);", (cls.__sessions_table, month)
+                    )
+                conn.commit()
+
+                cur.execute(partitioning.PARTITIONS_SQL, (cls.__sessions_table,))
+                cls.__partition_months = {
+                    month
+                    for month in (partitioning.month_of_partition(row[0]) for row in cur.fetchall())
+                    if month is not None
+                }
+                cls.__logger.info(
+                    f"Table {cls.__sessions_table} has {len(cls.__partition_months)} monthly partitions"
+                )
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error initializing the partitions of {cls.__sessions_table}: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def init_summary_table(cls):
+        """Creates ev_daily_summary, where the retention job rolls up old sessions, and
+        ev_compaction_cutoff, holding the cutoff of the last compaction"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to create the summary table")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ev_daily_summary (
+                        day DATE NOT NULL,
+                        user_id TEXT,
+                        charging_station_id TEXT,
+                        sessions INTEGER NOT NULL,
+                        energy_consumed_kwh DOUBLE PRECISION,
+                        charging_duration_hours DOUBLE PRECISION,
+                        charging_cost_eur DOUBLE PRECISION,
+                        distance_driven_since_last_charge_km DOUBLE PRECISION,
+                        UNIQUE NULLS NOT DISTINCT (day, user_id, charging_station_id)
+                    );
+                    CREATE INDEX IF NOT EXISTS ev_daily_summary_user_day_idx
+                    ON ev_daily_summary (user_id, day);
+                    CREATE TABLE IF NOT EXISTS ev_compaction_cutoff (
+                        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+                        cutoff TIMESTAMP NOT NULL
+                    );
+                """
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error creating the summary table: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def init_ingested_keys_table(cls):
+        """Creates ingested_keys, holding the key and start time of every session
+        ingested from MQTT, until the retention job compacts the session"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to create the ingested keys table")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ingested_keys (
+                        session_key BYTEA PRIMARY KEY,
+                        ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    );
+                    ALTER TABLE ingested_keys ADD COLUMN IF NOT EXISTS charging_start_time TIMESTAMP;
+                    CREATE INDEX IF NOT EXISTS ingested_keys_start_idx
+                    ON ingested_keys (charging_start_time);
+                """
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error creating the ingested keys table: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def init_sketches_table(cls):
+        """Creates ev_sketches, holding the checkpoints of the StreamingStats sketches"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to create the sketches table")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ev_sketches (
+                        name TEXT PRIMARY KEY,
+                        state BYTEA NOT NULL,
+                        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    );
+                """
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error creating the sketches table: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def init_anomalies_table(cls):
+        """Creates ev_anomalies, holding the anomalies found by AnomalyDetector"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to create the anomalies table")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ev_anomalies (
+                        id BIGSERIAL PRIMARY KEY,
+                        detected_at TIMESTAMPTZ NOT NULL,
+                        user_id TEXT,
+                        charging_station_id TEXT,
+                        charging_start_time TEXT,
+                        kind TEXT NOT NULL,
+                        scope TEXT,
+                        metric TEXT,
+                        value DOUBLE PRECISION,
+                        expected DOUBLE PRECISION,
+                        score DOUBLE PRECISION
+                    );
+                    CREATE INDEX IF NOT EXISTS ev_anomalies_kind_idx ON ev_anomalies (kind, id);
+                """
+                )
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error creating the anomalies table: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def compact_sessions(cls, cutoff: datetime.datetime, archive_dir: str):
+        """
+        Archives the sessions started before cutoff to a gzip CSV file, rolls them
+        up into ev_daily_summary and deletes them and their ingested keys, dropping
+        the monthly partitions that end before cutoff. The cutoff is recorded in
+        ev_compaction_cutoff, so older sessions are no longer ingested. Ingestion
+        waits while it runs.
+
+        Args:
+            cutoff (datetime.datetime): Sessions started before it are compacted
+            archive_dir (str): Directory of the archive files
+
+        Returns:
+            dict: The number of compacted sessions and of ingested keys pruned and,
+                  if any sessions, of summary rows written, the archive path and the
+                  dropped partitions
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to compact sessions")
+            return {"error": "Could not get DB connection"}
+
+        archive_path = None
+        try:
+            with conn.cursor() as cur:
+                # Blocks inserts (not reads) so nothing lands between the archive and the delete
+                cur.execute(f"LOCK TABLE {cls.__sessions_table} IN SHARE ROW EXCLUSIVE MODE;")
+
+                # The keys of compacted sessions are dropped with them, so ingested_keys
+                # stays as large as the retained sessions. Keys stored before the start
+                # time was recorded go once they were ingested before cutoff. Sessions
+                # started before the cutoff are rejected on ingest from now on, so a
+                # replay never adds them to the summary twice
+                cur.execute(
+                    """
+                    INSERT INTO ev_compaction_cutoff (cutoff) VALUES (%s)
+                    ON CONFLICT (id) DO UPDATE SET cutoff = GREATEST(ev_compaction_cutoff.cutoff, EXCLUDED.cutoff);
+                """,
+                    (cutoff,),
+                )
+                cur.execute(
+                    """
+                    DELETE FROM ingested_keys
+                    WHERE charging_start_time < %s OR (charging_start_time IS NULL AND ingested_at < %s);
+                """,
+                    (cutoff, cutoff),
+                )
+                pruned_keys = cur.rowcount
+
+                cur.execute(
+                    "SELECT COUNT(*) FROM ev_with_stations WHERE charging_start_time < %s;", (cutoff,)
+                )
+                sessions = cur.fetchone()[0]
+                if sessions == 0:
+                    conn.commit()
+                    return {"sessions": 0, "pruned_keys": pruned_keys}
+
+                os.makedirs(archive_dir, exist_ok=True)
+                archive_path = os.path.join(
+                    archive_dir,
+                    f"ev_with_stations_before_{cutoff:%Y%m%d}_{datetime.datetime.now():%Y%m%dT%H%M%S}.csv.gz",
+                )
+                copy_sql = cur.mogrify(
+                    "COPY (SELECT * FROM ev_with_stations WHERE charging_start_time < %s "
+                    "ORDER BY charging_start_time) TO STDOUT WITH (FORMAT CSV, HEADER TRUE)",
+                    (cutoff,),
+                ).decode()
+                with gzip.open(archive_path + ".tmp", "wt", encoding="utf-8", newline="") as f:
+                    cur.copy_expert(copy_sql, f)
+                os.replace(archive_path + ".tmp", archive_path)
+
+                cur.execute(
+                    """
+                    INSERT INTO ev_daily_summary AS d (
+                        day, user_id, charging_station_id, sessions, energy_consumed_kwh,
+                        charging_duration_hours, charging_cost_eur, distance_driven_since_last_charge_km
+                    )
+                    SELECT
+                        charging_start_time::DATE, user_id, charging_station_id, COUNT(*),
+                        SUM(energy_consumed_kwh), SUM(charging_duration_hours),
+                        SUM(charging_cost_eur), SUM(distance_driven_since_last_charge_km)
+                    FROM ev_with_stations
+                    WHERE charging_start_time < %s
+                    GROUP BY 1, 2, 3
+                    ON CONFLICT (day, user_id, charging_station_id) DO UPDATE SET
+                        sessions = d.sessions + EXCLUDED.sessions,
+                        energy_consumed_kwh = COALESCE(d.energy_consumed_kwh, 0) + COALESCE(EXCLUDED.energy_consumed_kwh, 0),
+                        charging_duration_hours = COALESCE(d.charging_duration_hours, 0) + COALESCE(EXCLUDED.charging_duration_hours, 0),
+                        charging_cost_eur = COALESCE(d.charging_cost_eur, 0) + COALESCE(EXCLUDED.charging_cost_eur, 0),
+                        distance_driven_since_last_charge_km = COALESCE(d.distance_driven_since_last_charge_km, 0)
+                            + COALESCE(EXCLUDED.distance_driven_since_last_charge_km, 0);
+                """,
+                    (cutoff,),
+                )
+                summary_rows = cur.rowcount
+
+                # Whole months are dropped, what is left before cutoff is deleted
+                dropped = sorted(
+                    month for month in cls.__partition_months
+                    if partitioning.next_month(month) <= cutoff.date()
+                )
+                for month in dropped:
+                    cur.execute(f"DROP TABLE IF EXISTS {cls.__sessions_table}_p{month:%Y%m};")
+                cur.execute(
+                    f"DELETE FROM {cls.__sessions_table} WHERE charging_start_time < %s;", (cutoff,)
+                )
+
+                conn.commit()
+                lsn = cls.__record_write()
+                cls.__partition_months.difference_update(dropped)
+                cls.__bump_table_version("ev_with_stations", lsn)
+                return {
+                    "sessions": sessions,
+                    "pruned_keys": pruned_keys,
+                    "summary_rows": summary_rows,
+                    "archive": archive_path,
+                    "dropped_partitions": [f"{month:%Y-%m}" for month in dropped],
+                }
+        except Exception as e:
+            conn.rollback()
+            # The rows are still in the table, so the archive would hold them twice
+            for path in (archive_path, archive_path and archive_path + ".tmp"):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            cls.__logger.error(f"Error compacting sessions: {e}", exc_info=True)
+            return {"error": "An error occurred while compacting sessions."}
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def __get_summary(cls, cur, username=None, start=None, end=None):
+        """Returns the daily summary rows of the compacted sessions
+
+        Args:
+            cur: An open cursor
+            username (str): Only the rows of this user, all users if None
+            start (datetime.datetime): Only the days that end after it
+            end (datetime.datetime): Only the days that start before it
+
+        Returns:
+            list[dict]: The summary rows, oldest first
+        """
+        conditions = []
+        params = []
+        if username is not None:
+            conditions.append("user_id = %s")
+            params.append(username)
+        if start is not None:
+            conditions.append("day >= %s::DATE")
+            params.append(start)
+        if end is not None:
+            conditions.append("day < %s")
+            params.append(end)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cur.execute(f"SELECT * FROM ev_daily_summary{where} ORDER BY day, user_id, charging_station_id;", params)
+        headers = [desc[0] for desc in cur.description]
+        return [dict(zip(headers, row)) for row in cur.fetchall()]
+
+    @classmethod
+    def __ensure_partition(cls, cur, start_time):
+        """Creates the partition of the month of a session start time if it is missing
+
+        Returns:
+            datetime.date: The month whose partition was created, None if nothing was done
+        """
+        month = partitioning.month_start(start_time)
+        if month is None or month in cls.__partition_months:
+            return None
+        cur.execute("SELECT ev_ensure_month_partition(%s, %s);", (cls.__sessions_table, month))
+        return month
+
+    @staticmethod
+    def __time_range_clause(start, end, prefix="WHERE", first_param=None):
+        """Builds the filter of a [start, end) charging_start_time range
+
+        Args:
+            start (datetime.datetime): Inclusive lower bound, None for no bound
+            end (datetime.datetime): Exclusive upper bound, None for no bound
+            prefix (str): Keyword placed before the conditions (WHERE or AND)
+            first_param (int): Number of the first $n placeholder for a prepared
+                               statement, %s placeholders are used if None
+
+        Returns:
+            tuple: The SQL fragment (empty if there are no bounds) and its parameters
+        """
+        conditions = []
+        params = []
+        for operator, bound in ((">=", start), ("<", end)):
+            if bound is None:
+                continue
+            placeholder = "%s" if first_param is None else f"${first_param + len(params)}"
+            conditions.append(f"charging_start_time {operator} {placeholder}")
+            params.append(bound)
+        if not conditions:
+            return "", []
+        return f" {prefix} " + " AND ".join(conditions), params
+
     @classmethod
     def init_stations_table(cls):
         """Initializes the charging stations table from the CSV file EV-Stations_with_ids_coords.csv"""
         if not cls.__db_is_empty("stations"):
             cls.__logger.info("Table stations is not empty")
-            return
+            return True
         cls.__logger.info(
             "Table stations is empty. Initializing stations database from CSV..."
         )
@@ -255,9 +1026,11 @@ class Database:
                 cur.copy_expert(sql=copy_sql, file=string_io_file)
 
                 conn.commit()
+                cls.__bump_table_version(table_name)
                 cls.__logger.info(
                     f"Successfully loaded data from '{csv_path}' into '{table_name}'"
                 )
+                return True
 
         except Exception as e:
             if conn:
@@ -269,61 +1042,305 @@ class Database:
                 cls.__release_db_connection(conn)
 
     @classmethod
-    def insert_ev_data(cls, data_dict: dict):
-        """Inserts a new EV charging data record into the ev_with_stations table."""
-        conn = None
+    def init_session_regions(cls):
+        """Adds the region codes of the station to the sessions table and fills them
+        in for the sessions that do not have them yet (e.g. after a CSV load)"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to add the session regions")
+            return
+
+        table = cls.__sessions_table
+        if cls.__schema_mode == "compact":
+            stations_join = (
+                "LEFT JOIN ev_station_keys k ON k.id = e.station_key "
+                "LEFT JOIN stations s ON s.station_id = k.station_id"
+            )
+        else:
+            stations_join = "LEFT JOIN stations s ON s.station_id = e.charging_station_id"
+        regions = list(REGION_COLUMN_TYPES)
         try:
-            conn = cls.__get_db_connection()
-            if not conn:
-                cls.__logger.error("Could not get DB connection to insert EV data")
-                return
+            with conn.cursor() as cur:
+                cur.execute(compact_schema.add_region_columns_sql(table))
+                cur.execute(
+                    f"""
+                    SELECT EXISTS (
+                        SELECT FROM {table} e {stations_join}
+                        WHERE e.coddistrito IS NULL AND s.coddistrito IS NOT NULL
+                    );
+                """
+                )
+                if not cur.fetchone()[0]:
+                    conn.commit()
+                    return True
+
+                cur.execute(
+                    """
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_name = %s AND column_name <> ALL(%s)
+                    ORDER BY ordinal_position;
+                """,
+                    (table, regions),
+                )
+                columns = [f'"{row[0]}"' for row in cur.fetchall()]
+
+                # Every session without codes is moved rather than updated, in physical
+                # order, so unordered scans still return the sessions in load order
+                cur.execute(
+                    f"""
+                    WITH moved AS (
+                        DELETE FROM {table} WHERE coddistrito IS NULL
+                        RETURNING ctid AS row_position, {", ".join(columns)}
+                    )
+                    INSERT INTO {table} ({", ".join(columns + regions)})
+                    SELECT {", ".join(f"e.{column}" for column in columns)},
+                        {", ".join(f"s.{column}::{REGION_COLUMN_TYPES[column]}" for column in regions)}
+                    FROM moved e {stations_join}
+                    ORDER BY e.row_position;
+                """
+                )
+                cls.__logger.info(f"Added the region codes to {cur.rowcount} sessions")
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error adding the region codes to the sessions: {e}")
+        finally:
+            cls.__release_db_connection(conn)
 
+    @classmethod
+    def init_timeseries_table(cls):
+        """Creates ev_hourly_usage, holding the hourly series of TimeSeries, and
+        backfills it from the sessions if it is empty"""
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to create the hourly usage table")
+            return
+
+        scopes = ", ".join(
+            f"('{scope}', e.\"{column}\"::text)" if column else f"('{scope}', '')"
+            for scope, column in SERIES_SCOPES.items()
+        )
+        try:
             with conn.cursor() as cur:
-                # Sanitize keys from the input dict to match DB columns
-                def sanitize_key(key):
-                    return key.lower().replace(" ", "_").replace("(", "").replace(")", "").replace("-", "_").replace("/", "_per_").replace("%", "_percent").replace("__", "_").replace("\ufeff", "")
+                cur.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS ev_hourly_usage (
+                        scope TEXT NOT NULL,
+                        series_key TEXT NOT NULL,
+                        hour TIMESTAMP NOT NULL,
+                        occupancy DOUBLE PRECISION NOT NULL DEFAULT 0,
+                        energy_kwh DOUBLE PRECISION NOT NULL DEFAULT 0,
+                        sessions INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (scope, series_key, hour)
+                    );
+                    SELECT EXISTS (SELECT FROM ev_hourly_usage);
+                """
+                )
+                if cur.fetchone()[0]:
+                    conn.commit()
+                    return True
 
-                sanitized_data = {sanitize_key(k): v for k, v in data_dict.items()}
+                # Same split as timeseries.split_session: each hour gets the fraction of
+                # it the session was charging and the same fraction of its energy
+                cur.execute(
+                    f"""
+                    WITH spans AS (
+                        SELECT e.*, EXTRACT(EPOCH FROM charging_start_time)::float8 / 3600 AS start_hours,
+                            LEAST(
+                                EXTRACT(EPOCH FROM CASE
+                                    WHEN charging_end_time > charging_start_time THEN charging_end_time
+                                    WHEN charging_duration_hours > 0
+                                        THEN charging_start_time + charging_duration_hours * INTERVAL '1 hour'
+                                    ELSE charging_start_time
+                                END)::float8 / 3600,
+                                EXTRACT(EPOCH FROM charging_start_time)::float8 / 3600 + {MAX_SESSION_HOURS}
+                            ) AS end_hours
+                        FROM ev_with_stations e
+                        WHERE charging_start_time IS NOT NULL
+                    )
+                    INSERT INTO ev_hourly_usage (scope, series_key, hour, occupancy, energy_kwh, sessions)
+                    SELECT k.scope, k.series_key, TIMESTAMP 'epoch' + h.hour * INTERVAL '1 hour',
+                        SUM(o.occupancy),
+                        SUM(CASE
+                            WHEN e.end_hours > e.start_hours
+                                THEN COALESCE(e.energy_consumed_kwh, 0) * o.occupancy / (e.end_hours - e.start_hours)
+                            WHEN h.hour = floor(e.start_hours) THEN COALESCE(e.energy_consumed_kwh, 0)
+                            ELSE 0
+                        END),
+                        COUNT(*) FILTER (WHERE h.hour = floor(e.start_hours))
+                    FROM spans e
+                    CROSS JOIN LATERAL generate_series(
+                        floor(e.start_hours)::bigint,
+                        GREATEST(floor(e.start_hours), ceil(e.end_hours) - 1)::bigint
+                    ) AS h (hour)
+                    CROSS JOIN LATERAL (
+                        SELECT GREATEST(LEAST(e.end_hours, h.hour + 1) - GREATEST(e.start_hours, h.hour), 0)
+                    ) AS o (occupancy)
+                    CROSS JOIN LATERAL (VALUES {scopes}) AS k (scope, series_key)
+                    WHERE k.series_key IS NOT NULL
+                    GROUP BY 1, 2, 3;
+                """
+                )
+                if cur.rowcount:
+                    cls.__logger.info(f"Backfilled {cur.rowcount} hourly usage rows from the sessions")
+                conn.commit()
+                return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error creating the hourly usage table: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def insert_ev_data(cls, data_dict: dict):
+        """Inserts a new EV charging data record into the ev_with_stations table."""
+        cls.insert_ev_data_batch([data_dict])
 
-                # Get the list of columns from the database to ensure we only insert valid data
-                db_columns = cls.get_headers()
-                
-                # Filter the sanitized data to only include keys that are actual columns
-                data_to_insert = {k: v for k, v in sanitized_data.items() if k in db_columns}
+    @classmethod
+    def insert_ev_data_batch(cls, records: list) -> bool:
+        """Inserts a batch of EV charging records into ev_with_stations in one transaction
+
+        Records without valid columns or with an unknown station are discarded.
+        Duplicated sessions (same session key) are skipped: recent ones in memory by
+        RecentKeys, older ones by the unique ingested_keys table, in the same
+        statement as the insert. Sessions started before the last compaction cutoff
+        were already rolled up into ev_daily_summary, so they count as duplicates
+        too. If the batch is rejected because of its data, the records are retried
+        one by one and only the failing ones are discarded.
+
+        Args:
+            records (list[dict]): The records, as received from MQTT
+
+        Returns:
+            bool: True if the batch was handled, False if the database could not be
+                  reached and the batch should be retried later
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to insert EV data")
+            return False
 
+        try:
+            with conn.cursor() as cur:
+                conn.execute_prepared(cur, cls.__COLUMN_TYPES_SQL)
+                column_types = dict(cur.fetchall())
+            if not column_types:
+                return False
+
+            batch = {}
+            duplicates = 0
+            for record in records:
+                data_to_insert = sanitize_record(record, column_types)
+                # The region codes come from the station, never from the message
+                for column in REGION_COLUMN_TYPES:
+                    data_to_insert.pop(column, None)
+                station_id = data_to_insert.get("charging_station_id")
                 if not data_to_insert:
                     cls.__logger.warning("No valid columns found in data to insert.")
-                    return
+                    continue
+                if StationRegistry.is_loaded() and not StationRegistry.contains(station_id):
+                    cls.__logger.warning(f"Unknown charging station {station_id}, record discarded.")
+                    continue
+
+                # Keyed before the region codes are added, like the sessions ingested before them
+                key = session_key(data_to_insert)
+                if key in batch or RecentKeys.contains(key):
+                    duplicates += 1
+                    continue
+                regions = StationRegistry.region_codes_of(station_id)
+                batch[key] = {**data_to_insert, **dict(zip(REGION_COLUMNS.values(), regions))}
+            if not batch:
+                if duplicates:
+                    cls.__logger.info(f"Skipped {duplicates} duplicated EV data records.")
+                return True
+
+            # The key is recorded and the session inserted in one statement, only
+            # sessions whose key was not in ingested_keys yet and that started after
+            # the last compaction cutoff (their key was pruned) are inserted. Every
+            # column is passed as one array, so the statement has the same
+            # parameters for any batch size and is only prepared once
+            columns = list(column_types)
+            quoted_columns = ", ".join(f'"{column}"' for column in columns)
+            array_params = ", ".join(f"${i}" for i in range(1, len(columns) + 2))
+            sql = f"""
+                WITH batch (session_key, {quoted_columns}) AS (
+                    SELECT * FROM unnest({array_params})
+                ),
+                new_keys AS (
+                    INSERT INTO ingested_keys (session_key, charging_start_time)
+                    SELECT session_key, charging_start_time::timestamp FROM batch
+                    WHERE charging_start_time IS NULL OR charging_start_time::timestamp >= (
+                        SELECT COALESCE(MAX(cutoff), '-infinity') FROM ev_compaction_cutoff
+                    )
+                    ON CONFLICT DO NOTHING
+                    RETURNING session_key
+                ),
+                inserted AS (
+                    INSERT INTO ev_with_stations ({quoted_columns})
+                    SELECT {quoted_columns} FROM batch
+                    WHERE session_key IN (SELECT session_key FROM new_keys)
+                )
+                SELECT session_key FROM new_keys
+            """
+            types = ("bytea[]", *(f"{column_types[column]}[]" for column in columns))
+            keys = list(batch)
 
-                # Construct the INSERT statement dynamically and safely
-                columns = ", ".join([f'"{k}"' for k in data_to_insert.keys()])
-                placeholders = ", ".join(["%s"] * len(data_to_insert))
-                
-                sql = f"INSERT INTO ev_with_stations ({columns}) VALUES ({placeholders});"
-                values = list(data_to_insert.values())
-
-                # Debugging logs
-                cls.__logger.info(f"Executing SQL: {sql}")
-                cls.__logger.info(f"With values: {values}")
-                
-                cur.execute(sql, values)
-                conn.commit()
-                cls.__logger.info("Successfully inserted new EV data record.")
+            def insert(keys):
+                params = (keys, *([batch[key].get(column) for key in keys] for column in columns))
+                conn.execute_prepared(cur, sql, params, types)
+                return cur.fetchall()
 
+            with conn.cursor() as cur:
+                new_partitions = {
+                    month for month in
+                    (cls.__ensure_partition(cur, record.get("charging_start_time")) for record in batch.values())
+                    if month
+                }
+                try:
+                    cur.execute("SAVEPOINT batch;")
+                    inserted_keys = insert(keys)
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    cls.__logger.warning(f"Batch of {len(keys)} records rejected ({e}), inserting one by one")
+                    cur.execute("ROLLBACK TO SAVEPOINT batch;")
+                    inserted_keys = []
+                    for key in keys:
+                        try:
+                            cur.execute("SAVEPOINT record;")
+                            inserted_keys += insert([key])
+                        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT record;")
+                            cls.__logger.error(f"EV data record discarded: {e}")
+
+            conn.commit()
+            lsn = cls.__record_write()
+            inserted_keys = [bytes(row[0]) for row in inserted_keys]
+            RecentKeys.add_all(inserted_keys)
+            cls.__partition_months.update(new_partitions)
+            cls.__bump_table_version("ev_with_stations", lsn)
+            for key in inserted_keys:
+                cls.__notify_insert(batch[key])
+
+            duplicates += len(keys) - len(inserted_keys)
+            cls.__logger.info(
+                f"Inserted a batch of {len(inserted_keys)} EV data records"
+                + (f", skipped {duplicates} duplicated or invalid." if duplicates else ".")
+            )
+            return True
         except Exception as e:
-            if conn:
-                conn.rollback()
-            cls.__logger.error(f"Error inserting EV data into database: {e}", exc_info=True)
+            conn.rollback()
+            cls.__logger.error(f"Error inserting a batch of EV data into database: {e}")
+            return False
         finally:
-            if conn:
-                cls.__release_db_connection(conn)
+            cls.__release_db_connection(conn)
 
     @classmethod
-    def get_info_by_username(cls, username: str):
+    def get_info_by_username(cls, username: str, start=None, end=None):
         """
-        Returns all information from the ev_with_stations table for a specific user
+        Returns all information from the ev_with_stations table for a specific user,
+        optionally only the sessions started in [start, end)
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error(
                 f"Could not get DB connection to fetch info for user {username}"
@@ -332,10 +1349,13 @@ class Database:
 
         try:
             with conn.cursor() as cur:
-                headers = cls.get_headers()
-                cur.execute(
-                    "SELECT * FROM ev_with_stations WHERE user_id = %s;", (username,)
+                time_range, params = cls.__time_range_clause(start, end, "AND", first_param=2)
+                conn.execute_prepared(
+                    cur,
+                    f"SELECT {cls.__public_select()} FROM ev_with_stations WHERE user_id = $1{time_range}",
+                    (username, *params),
                 )
+                headers = [desc[0] for desc in cur.description]
                 rows = cur.fetchall()
 
                 # Filter out the user_id header
@@ -350,7 +1370,12 @@ class Database:
                             row_dict[header] = row[i]
                     data.append(row_dict)
 
-                return {"headers": filtered_headers, "data": data}
+                result = {"headers": filtered_headers, "data": data}
+                # Sessions compacted by the retention job are only available per day
+                summary = cls.__get_summary(cur, username, start, end)
+                if summary:
+                    result["summary"] = summary
+                return result
         except Exception as e:
             cls.__logger.error(
                 f"Error fetching info for user {username} from database: {e}"
@@ -364,7 +1389,7 @@ class Database:
         """
         Retorna os nomes das colunas da tabela ev_with_stations
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error("Could not get DB connection to fetch headers")
             return ()
@@ -372,7 +1397,9 @@ class Database:
         try:
             with conn.cursor() as cur:
                 cur.execute("SELECT * FROM ev_with_stations LIMIT 0;")
-                headers = tuple([desc[0] for desc in cur.description])
+                headers = tuple(
+                    [desc[0] for desc in cur.description if desc[0] not in REGION_COLUMN_TYPES]
+                )
 
                 return headers
         except Exception as e:
@@ -381,12 +1408,21 @@ class Database:
         finally:
             cls.__release_db_connection(conn)
 
+    @classmethod
+    def __public_select(cls) -> str:
+        """Returns the select list of the read routes, every column but the region codes"""
+        if not cls.__public_columns:
+            cls.__public_columns = cls.get_headers()
+        if not cls.__public_columns:
+            return "*"
+        return ", ".join(f'"{column}"' for column in cls.__public_columns)
+
     @classmethod
     def get_stations(cls):
         """
         Returns all stations with ID, latitude, and longitude
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error("Could not get DB connection to fetch stations")
             return []
@@ -416,13 +1452,465 @@ class Database:
         finally:
             cls.__release_db_connection(conn)
 
+    @classmethod
+    def load_station_registry(cls):
+        """Loads the stations table into the in-memory StationRegistry"""
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the station registry")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    'SELECT "station_id", "latitude", "longitude", "coddistrito", "coddistritoconcelho", '
+                    '"coddistritoconcelhofreguesia", "potência_máxima_admissível_kw" FROM stations;'
+                )
+                StationRegistry.load(cur.fetchall())
+        except Exception as e:
+            cls.__logger.error(f"Error loading the station registry from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_visited_stations(cls):
+        """Builds the in-memory VisitedStations bitmaps from ev_with_stations"""
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load visited stations")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT user_id, charging_station_id FROM ev_with_stations
+                    UNION
+                    SELECT user_id, charging_station_id FROM ev_daily_summary;
+                """
+                )
+                VisitedStations.load(cur.fetchall())
+        except Exception as e:
+            cls.__logger.error(f"Error loading visited stations from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def get_numeric_columns(cls):
+        """
+        Returns the names of the numeric columns of the ev_with_stations table
+        """
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to fetch numeric columns")
+            return []
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT column_name FROM information_schema.columns
+                    WHERE table_name = 'ev_with_stations'
+                    AND data_type IN ('real', 'double precision', 'integer', 'smallint', 'bigint', 'numeric')
+                    AND column_name <> ALL(%s)
+                    ORDER BY ordinal_position;
+                """,
+                    (list(REGION_COLUMN_TYPES),),
+                )
+                return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            cls.__logger.error(f"Error fetching numeric columns from database: {e}")
+            return []
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_feature_store(cls):
+        """Loads the numeric columns of ev_with_stations into the in-memory FeatureStore"""
+        columns = cls.get_numeric_columns()
+        if not columns:
+            cls.__logger.error("No numeric columns found, feature store not loaded")
+            return
+
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the feature store")
+            return
+
+        def fetch_chunks():
+            # Server-side cursor, so the whole table is never held as Python rows.
+            # Casting through text keeps the same decimal values psycopg2 returns for REAL
+            select_list = ", ".join(f'COALESCE("{column}"::text::float8, \'NaN\')' for column in columns)
+            with conn.cursor(name="feature_store_load") as cur:
+                cur.itersize = FeatureStore.CHUNK_ROWS
+                cur.execute(f"SELECT {select_list} FROM ev_with_stations;")
+                while True:
+                    rows = cur.fetchmany(FeatureStore.CHUNK_ROWS)
+                    if not rows:
+                        break
+                    yield rows
+
+        try:
+            # Row count and per-column counts and sums, checked against the on-disk copy
+            stamp_list = ", ".join(
+                f'COUNT("{column}"), COALESCE(SUM("{column}"::text::float8), 0)' for column in columns
+            )
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*), {stamp_list} FROM ev_with_stations;")
+                row = cur.fetchone()
+            row_count = row[0]
+            stamp = {
+                column: (row[1 + 2 * i], row[2 + 2 * i]) for i, column in enumerate(columns)
+            }
+            FeatureStore.load(columns, row_count, fetch_chunks, stamp)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error loading the feature store from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_streaming_stats(cls):
+        """Restores the StreamingStats sketches from their checkpoint, or rebuilds them
+        from ev_with_stations and ev_daily_summary if there is none"""
+        # From the primary, a lagging replica could miss the last checkpoint
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the sketches")
+            return
+
+        def fetch_sessions():
+            columns = ["user_id", "charging_station_id", *QUANTILE_METRICS]
+            select_list = ", ".join(f'"{column}"' for column in columns)
+            with conn.cursor(name="sketches_load") as cur:
+                cur.itersize = FeatureStore.CHUNK_ROWS
+                cur.execute(f"SELECT {select_list} FROM ev_with_stations;")
+                for row in cur:
+                    yield dict(zip(columns, row))
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT name, state FROM ev_sketches;")
+                rows = cur.fetchall()
+            if not StreamingStats.restore(rows):
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT user_id, charging_station_id, sessions, energy_consumed_kwh
+                        FROM ev_daily_summary;
+                    """
+                    )
+                    summaries = cur.fetchall()
+                StreamingStats.build(fetch_sessions(), summaries)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error loading the sketches from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def save_sketches(cls, rows: list) -> bool:
+        """Upserts checkpoint rows of the StreamingStats sketches
+
+        Args:
+            rows (list[tuple]): (name, state) rows, see StreamingStats.checkpoint_rows
+
+        Returns:
+            bool: True if the rows were written
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to checkpoint the sketches")
+            return False
+
+        try:
+            with conn.cursor() as cur:
+                conn.execute_prepared(
+                    cur,
+                    """
+                    INSERT INTO ev_sketches (name, state)
+                    SELECT * FROM unnest($1, $2)
+                    ON CONFLICT (name) DO UPDATE
+                    SET state = EXCLUDED.state, updated_at = now();
+                """,
+                    ([name for name, _ in rows], [psycopg2.Binary(state) for _, state in rows]),
+                    ("text[]", "bytea[]"),
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error checkpointing the sketches: {e}")
+            return False
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_anomaly_stats(cls):
+        """Seeds the AnomalyDetector statistics with the count, mean and variance of
+        every metric per user, vehicle model and station, in one scan of ev_with_stations"""
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the anomaly statistics")
+            return
+
+        scopes = ", ".join(f"('{scope}', e.\"{column}\")" for scope, column in STAT_SCOPES.items())
+        metrics = ", ".join(f"('{metric}', e.\"{metric}\"::float8)" for metric in STAT_METRICS)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT s.scope, s.value, m.metric, COUNT(m.x), AVG(m.x), VAR_POP(m.x)
+                    FROM ev_with_stations e
+                    CROSS JOIN LATERAL (VALUES {scopes}) AS s (scope, value)
+                    CROSS JOIN LATERAL (VALUES {metrics}) AS m (metric, x)
+                    WHERE s.value IS NOT NULL AND m.x >= 0
+                    GROUP BY 1, 2, 3;
+                """
+                )
+                AnomalyDetector.load(cur.fetchall())
+        except Exception as e:
+            cls.__logger.error(f"Error loading the anomaly statistics from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def insert_anomalies(cls, anomalies: list) -> bool:
+        """Inserts anomalies found by AnomalyDetector into ev_anomalies
+
+        Args:
+            anomalies (list[dict]): The anomalies, keyed by column name
+
+        Returns:
+            bool: True if they were written
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to insert anomalies")
+            return False
+
+        columns = ANOMALY_COLUMNS[1:]
+        types = ("timestamptz[]", "text[]", "text[]", "text[]", "text[]", "text[]", "text[]",
+                 "float8[]", "float8[]", "float8[]")
+        try:
+            with conn.cursor() as cur:
+                conn.execute_prepared(
+                    cur,
+                    f"""
+                    INSERT INTO ev_anomalies ({", ".join(columns)})
+                    SELECT * FROM unnest({", ".join(f"${i}" for i in range(1, len(columns) + 1))});
+                """,
+                    tuple([anomaly[column] for anomaly in anomalies] for column in columns),
+                    types,
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error inserting anomalies into database: {e}")
+            return False
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def get_anomalies(cls, limit: int, kind=None, station_id=None, user_id=None):
+        """Returns the latest anomalies, newest first
+
+        Args:
+            limit (int): Maximum number of anomalies
+            kind (str, optional): Only anomalies of this kind
+            station_id (str, optional): Only anomalies of this station
+            user_id (str, optional): Only anomalies of this user
+
+        Returns:
+            list[dict]: The anomalies, keyed by column name
+        """
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to fetch anomalies")
+            return []
+
+        filters = {"kind": kind, "charging_station_id": station_id, "user_id": user_id}
+        conditions = [f"{column} = %s" for column, value in filters.items() if value is not None]
+        params = [value for value in filters.values() if value is not None]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"SELECT {', '.join(ANOMALY_COLUMNS)} FROM ev_anomalies {where} ORDER BY id DESC LIMIT %s;",
+                    (*params, limit),
+                )
+                rows = cur.fetchall()
+            return [
+                {
+                    **dict(zip(ANOMALY_COLUMNS, row)),
+                    "detected_at": row[1].isoformat(timespec="seconds"),
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            cls.__logger.error(f"Error fetching anomalies from database: {e}")
+            return []
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_region_stats(cls):
+        """Builds the RegionStats rollups from the region codes of the sessions and
+        the daily summary of the compacted ones"""
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the region statistics")
+            return
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT DISTINCT coddistrito, distrito, coddistritoconcelho, concelho,
+                        coddistritoconcelhofreguesia, freguesia
+                    FROM stations;
+                """
+                )
+                names = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT coddistrito, coddistritoconcelho, coddistritoconcelhofreguesia, user_id,
+                        COUNT(*), SUM(energy_consumed_kwh), SUM(charging_cost_eur)
+                    FROM ev_with_stations
+                    WHERE coddistrito IS NOT NULL
+                    GROUP BY 1, 2, 3, 4;
+                """
+                )
+                sessions = cur.fetchall()
+                cur.execute(
+                    """
+                    SELECT charging_station_id, user_id, SUM(sessions),
+                        SUM(energy_consumed_kwh), SUM(charging_cost_eur)
+                    FROM ev_daily_summary
+                    GROUP BY 1, 2;
+                """
+                )
+                summaries = cur.fetchall()
+            RegionStats.load(names, sessions, summaries, StationRegistry.region_codes_of)
+        except Exception as e:
+            cls.__logger.error(f"Error loading the region statistics from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def load_timeseries(cls):
+        """Loads the hourly series of ev_hourly_usage into TimeSeries"""
+        # From the primary, a lagging replica could miss the last flush
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to load the time series")
+            return
+
+        try:
+            with conn.cursor(name="timeseries_load") as cur:
+                cur.itersize = FeatureStore.CHUNK_ROWS
+                cur.execute(
+                    """
+                    SELECT scope, series_key, (EXTRACT(EPOCH FROM hour) / 3600)::bigint,
+                        occupancy, energy_kwh, sessions
+                    FROM ev_hourly_usage
+                    ORDER BY scope, series_key, hour;
+                """
+                )
+                TimeSeries.load(cur)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error loading the time series from database: {e}")
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def add_hourly_usage(cls, rows: list) -> bool:
+        """Adds hourly values of TimeSeries to ev_hourly_usage
+
+        The values are added to the stored ones, so several processors can write
+        the same hours.
+
+        Args:
+            rows (list[tuple]): (scope, key, hour, occupancy, energy, sessions) rows,
+                                see TimeSeries.pending_rows
+
+        Returns:
+            bool: True if the rows were written
+        """
+        conn = cls.__get_db_connection()
+        if not conn:
+            cls.__logger.error("Could not get DB connection to write the hourly usage")
+            return False
+
+        try:
+            with conn.cursor() as cur:
+                conn.execute_prepared(
+                    cur,
+                    """
+                    INSERT INTO ev_hourly_usage AS u (scope, series_key, hour, occupancy, energy_kwh, sessions)
+                    SELECT scope, series_key, TIMESTAMP 'epoch' + hour * INTERVAL '1 hour',
+                        occupancy, energy_kwh, sessions
+                    FROM unnest($1, $2, $3, $4, $5, $6) AS r (scope, series_key, hour, occupancy, energy_kwh, sessions)
+                    ON CONFLICT (scope, series_key, hour) DO UPDATE
+                    SET occupancy = u.occupancy + EXCLUDED.occupancy,
+                        energy_kwh = u.energy_kwh + EXCLUDED.energy_kwh,
+                        sessions = u.sessions + EXCLUDED.sessions;
+                """,
+                    tuple(list(column) for column in zip(*rows)),
+                    ("text[]", "text[]", "int8[]", "float8[]", "float8[]", "int4[]"),
+                )
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            cls.__logger.error(f"Error writing the hourly usage: {e}")
+            return False
+        finally:
+            cls.__release_db_connection(conn)
+
+    @classmethod
+    def get_visited_station_ids(cls, username: str):
+        """
+        Returns the IDs of the stations already visited by a user
+        """
+        conn = cls.__get_db_connection(read_only=True)
+        if not conn:
+            cls.__logger.error(
+                f"Could not get DB connection to fetch visited stations for user {username}"
+            )
+            return []
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT charging_station_id FROM ev_with_stations WHERE user_id = %s
+                    UNION
+                    SELECT charging_station_id FROM ev_daily_summary WHERE user_id = %s;
+                """,
+                    (username, username),
+                )
+                return [row[0] for row in cur.fetchall()]
+        except Exception as e:
+            cls.__logger.error(
+                f"Error fetching visited stations for user {username} from database: {e}"
+            )
+            return []
+        finally:
+            cls.__release_db_connection(conn)
+
     @classmethod
     def get_stations_for_user(cls, username: str):
         """
         Returns all stations with a boolean indicating
         whether the user has already visited that station
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error("Could not get DB connection to fetch stations for user")
             return []
@@ -430,14 +1918,15 @@ class Database:
         try:
             with conn.cursor() as cur:
                 # Get all stations (without spatial limitation)
-                cur.execute(
+                conn.execute_prepared(
+                    cur,
                     """
                     SELECT
                         s."station_id",
                         s."latitude",
                         s."longitude"
                     FROM stations s
-                """
+                """,
                 )
 
                 rows = cur.fetchall()
@@ -458,15 +1947,22 @@ class Database:
                     # Get the stations visited by the user
                     station_ids = [station["station_id"] for station in stations]
                     if station_ids:  # Only proceed if there are station IDs
-                        placeholders = ",".join(["%s"] * len(station_ids))
-                        cur.execute(
-                            f"""
+                        # The IDs are passed as one array, so the statement is the
+                        # same whatever the number of stations
+                        conn.execute_prepared(
+                            cur,
+                            """
                             SELECT DISTINCT e.charging_station_id
-                            FROM ev_with_stations e
-                            WHERE e.user_id = %s
-                            AND e.charging_station_id IN ({placeholders})
+                            FROM (
+                                SELECT user_id, charging_station_id FROM ev_with_stations
+                                UNION ALL
+                                SELECT user_id, charging_station_id FROM ev_daily_summary
+                            ) e
+                            WHERE e.user_id = $1
+                            AND e.charging_station_id = ANY($2)
                         """,
-                            [username] + station_ids,
+                            (username, station_ids),
+                            ("text", "text[]"),
                         )
 
                         visited_station_ids = [row[0] for row in cur.fetchall()]
@@ -493,7 +1989,7 @@ class Database:
         """
         Returns a list of all unique users from the ev_with_stations table
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error("Could not get DB connection to fetch all users")
             return []
@@ -501,7 +1997,11 @@ class Database:
         try:
             with conn.cursor() as cur:
                 cur.execute(
-                    "SELECT DISTINCT user_id FROM ev_with_stations WHERE user_id IS NOT NULL;"
+                    """
+                    SELECT user_id FROM ev_with_stations WHERE user_id IS NOT NULL
+                    UNION
+                    SELECT user_id FROM ev_daily_summary WHERE user_id IS NOT NULL;
+                """
                 )
                 rows = cur.fetchall()
 
@@ -517,11 +2017,12 @@ class Database:
             cls.__release_db_connection(conn)
 
     @classmethod
-    def get_all_users_info(cls):
+    def get_all_users_info(cls, start=None, end=None):
         """
-        Returns all information for all users from the ev_with_stations table
+        Returns all information for all users from the ev_with_stations table,
+        optionally only the sessions started in [start, end)
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error("Could not get DB connection to fetch all users info")
             return {}
@@ -530,7 +2031,8 @@ class Database:
             with conn.cursor() as cur:
                 headers = cls.get_headers()
 
-                cur.execute("SELECT * FROM ev_with_stations;")
+                time_range, params = cls.__time_range_clause(start, end)
+                cur.execute(f"SELECT {cls.__public_select()} FROM ev_with_stations{time_range};", params)
                 rows = cur.fetchall()
 
                 # Convert rows to list of dictionaries
@@ -541,7 +2043,12 @@ class Database:
                         row_dict[header] = row[i]
                     data.append(row_dict)
 
-                return {"headers": list(headers), "data": data}
+                result = {"headers": list(headers), "data": data}
+                # Sessions compacted by the retention job are only available per day
+                summary = cls.__get_summary(cur, None, start, end)
+                if summary:
+                    result["summary"] = summary
+                return result
         except Exception as e:
             cls.__logger.error(f"Error fetching all users info from database: {e}")
             return {}
@@ -549,11 +2056,15 @@ class Database:
             cls.__release_db_connection(conn)
 
     @classmethod
-    def get_values_for_features(cls, feat1: str, feat2: str):
+    def get_values_for_features(cls, feat1: str, feat2: str, start=None, end=None):
         """
-        Returns the values for two specific features from the ev_with_stations table
+        Returns the values for two specific features from the ev_with_stations table,
+        optionally only for the sessions started in [start, end)
+
+        The values are returned column by column, with timestamps as epoch seconds,
+        along with the kind of each feature (numeric, timestamp or categorical)
         """
-        conn = cls.__get_db_connection()
+        conn = cls.__get_db_connection(read_only=True)
         if not conn:
             cls.__logger.error(
                 f"Could not get DB connection to fetch values for features {feat1}, {feat2}"
@@ -561,29 +2072,34 @@ class Database:
             return {"error": "Could not get DB connection"}
 
         try:
-            headers = cls.get_headers()
-            if feat1 not in headers or feat2 not in headers:
-                cls.__logger.error(f"Invalid features requested: {feat1}, {feat2}")
-                # It might be better to return a more specific error
-                invalid_features = []
-                if feat1 not in headers:
-                    invalid_features.append(feat1)
-                if feat2 not in headers:
-                    invalid_features.append(feat2)
-                return {
-                    "error": f"Invalid feature(s): {', '.join(invalid_features)}. Please use /get_headers to see available features."
+            with conn.cursor() as cur:
+                conn.execute_prepared(cur, cls.__COLUMN_TYPES_SQL)
+                data_types = {
+                    column: data_type for column, data_type in cur.fetchall()
+                    if column not in REGION_COLUMN_TYPES
                 }
 
-            with conn.cursor() as cur:
+                invalid_features = [feat for feat in (feat1, feat2) if feat not in data_types]
+                if invalid_features:
+                    cls.__logger.error(f"Invalid features requested: {feat1}, {feat2}")
+                    return {
+                        "error": f"Invalid feature(s): {', '.join(invalid_features)}. Please use /get_headers to see available features."
+                    }
+
+                kinds = {feat: column_kind(data_types[feat]) for feat in (feat1, feat2)}
+                # Timestamps are converted by Postgres, so no value needs a per-row conversion
+                selected = [
+                    f'EXTRACT(EPOCH FROM "{feat}")::float8' if kinds[feat] == "timestamp" else f'"{feat}"'
+                    for feat in (feat1, feat2)
+                ]
                 # Safely construct the query since we've validated the column names
-                query = f'SELECT "{feat1}", "{feat2}" FROM ev_with_stations;'
-                cur.execute(query)
+                time_range, params = cls.__time_range_clause(start, end, first_param=1)
+                query = f"SELECT {', '.join(selected)} FROM ev_with_stations{time_range}"
+                conn.execute_prepared(cur, query, params)
                 rows = cur.fetchall()
 
-                # Convert rows to list of dictionaries
-                data = [{feat1: row[0], feat2: row[1]} for row in rows]
-
-                return {"data": data}
+                columns = [list(column) for column in zip(*rows)] or [[], []]
+                return {"columns": columns, "kinds": kinds}
         except Exception as e:
             cls.__logger.error(
                 f"Error fetching values for features {feat1}, {feat2} from database: {e}"
@@ -593,4 +2109,28 @@ class Database:
             cls.__release_db_connection(conn)
 
 
-Database.init_db()
+# Columns of ev_anomalies, in the order they are read
+ANOMALY_COLUMNS = (
+    "id", "detected_at", "user_id", "charging_station_id", "charging_start_time",
+    "kind", "scope", "metric", "value", "expected", "score",
+)
+
+
+def sanitize_key(key: str) -> str:
+    """Converts a CSV/MQTT field name to the name of its column"""
+    return key.lower().replace(" ", "_").replace("(", "").replace(")", "").replace("-", "_").replace("/", "_per_").replace("%", "_percent").replace("__", "_").replace("\ufeff", "")
+
+
+def sanitize_record(data_dict: dict, db_columns) -> dict:
+    """Renames the fields of a record to column names and drops the unknown ones"""
+    sanitized_data = {sanitize_key(k): v for k, v in data_dict.items()}
+    return {k: v for k, v in sanitized_data.items() if k in db_columns}
+
+
+def column_kind(data_type: str) -> str:
+    """Maps a Postgres data type to the feature kind understood by the ML service"""
+    if data_type.startswith("timestamp") or data_type == "date":
+        return "timestamp"
+    if data_type in ("real", "double precision", "integer", "smallint", "bigint", "numeric"):
+        return "numeric"
+    return "categorical"
@@ -0,0 +1,63 @@
+import threading
+import hashlib
+import time
+import json
+import os
+
+
+def session_key(record: dict) -> bytes:
+    """
+    Returns the identity of an ingested session: a 16-byte hash of its column
+    values, so a redelivered or replayed message gets the same key whatever
+    the order of its fields.
+
+    Args:
+        record (dict): The record keyed by column name
+    """
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).digest()
+
+
+class RecentKeys:
+    """
+    A static class that remembers the keys of the recently ingested sessions,
+    so duplicates arriving close together (QoS 1 redeliveries, a publisher
+    restart) are dropped without reaching the database.
+
+    The keys are kept in two generations of exact sets that rotate every
+    DEDUP_WINDOW_SECONDS or when the current one holds DEDUP_MAX_KEYS keys, so
+    a key is remembered for one to two windows and memory stays bounded. Unlike
+    a Bloom filter it has no false positives, so no new session is ever dropped;
+    older duplicates are caught by the unique ingested_keys table instead.
+    """
+
+    WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "3600"))
+    MAX_KEYS = int(os.getenv("DEDUP_MAX_KEYS", "500000"))
+
+    __current = set()
+    __previous = set()
+    __rotated_at = time.monotonic()
+    __lock = threading.Lock()
+
+    @classmethod
+    def contains(cls, key: bytes) -> bool:
+        """Checks if a session key was ingested recently"""
+        with cls.__lock:
+            cls.__maybe_rotate()
+            return key in cls.__current or key in cls.__previous
+
+    @classmethod
+    def add_all(cls, keys):
+        """Remembers the keys of sessions committed to the database"""
+        with cls.__lock:
+            cls.__maybe_rotate()
+            cls.__current.update(keys)
+
+    @classmethod
+    def __maybe_rotate(cls):
+        """Starts a new generation when the current one is too old or too large (lock held)"""
+        now = time.monotonic()
+        if now - cls.__rotated_at >= cls.WINDOW_SECONDS or len(cls.__current) >= cls.MAX_KEYS:
+            cls.__previous = cls.__current
+            cls.__current = set()
+            cls.__rotated_at = now
@@ -0,0 +1,260 @@
+from conversions import to_float
+import numpy as np
+import threading
+import logging
+import shutil
+import json
+import uuid
+import os
+
+
+class FeatureStore:
+    """
+    A static class that keeps a columnar in-memory copy of the numeric columns
+    of ev_with_stations.
+
+    Every column is a float64 NumPy array (missing values are NaN) that grows in
+    whole chunks as the ingestion path appends records, so any feature pair can
+    be sliced without copies. If FEATURE_STORE_DIR is set, the arrays are
+    memory-mapped files in that directory and are reused after a restart when
+    their row count and per-column counts and sums still match the table,
+    instead of reloading from Postgres.
+
+    Every load from the database writes a new generation of files in its own
+    directory and then switches meta.json to it, so arrays handed out by
+    get_columns keep mapping the files they were read from.
+    """
+
+    CHUNK_ROWS = 65536
+
+    __columns = ()
+    __arrays = {}
+    __size = 0
+    __capacity = 0
+    __version = 0
+    __directory = os.getenv("FEATURE_STORE_DIR")
+    __generation = None
+    __loaded = False
+    __lock = threading.Lock()
+    __logger = logging.getLogger("feature-store")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, columns: list, row_count: int, fetch_chunks, stamp=None):
+        """Loads the store, from disk if possible, otherwise from the database
+
+        Args:
+            columns (list[str]): Names of the numeric columns
+            row_count (int): Number of rows currently in the table
+            fetch_chunks (callable): Returns an iterable of row chunks (lists of
+                                     tuples ordered as columns), only called if
+                                     the on-disk copy can not be used
+            stamp (dict, optional): Number of non-missing values and their sum per
+                                    column in the table. The on-disk copy is only
+                                    reused if it has the same, never without it
+        """
+        with cls.__lock:
+            cls.__columns = tuple(columns)
+            if stamp is not None and cls.__open_from_disk(row_count, stamp):
+                cls.__logger.info(f"Feature store reused {row_count} rows from disk")
+            else:
+                cls.__allocate(max(row_count, 1))
+                cls.__size = 0
+                for chunk in fetch_chunks():
+                    if not chunk:
+                        continue
+                    block = np.asarray(chunk, dtype=np.float64).reshape(len(chunk), len(columns))
+                    cls.__ensure_capacity(cls.__size + len(block))
+                    for i, column in enumerate(cls.__columns):
+                        cls.__arrays[column][cls.__size : cls.__size + len(block)] = block[:, i]
+                    cls.__size += len(block)
+                cls.__flush_meta()
+                cls.__remove_stale_generations()
+                cls.__logger.info(f"Feature store loaded {cls.__size} rows from database")
+            cls.__version += 1
+            cls.__loaded = True
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the store holds the table data"""
+        return cls.__loaded
+
+    @classmethod
+    def has_columns(cls, *names) -> bool:
+        """Checks if all the given columns are kept in the store"""
+        return cls.__loaded and all(name in cls.__arrays for name in names)
+
+    @classmethod
+    def get_version(cls) -> int:
+        """Returns a number that changes every time the store data changes"""
+        return cls.__version
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Appends a newly inserted session to the store"""
+        if not cls.__loaded:
+            return
+
+        with cls.__lock:
+            cls.__ensure_capacity(cls.__size + 1)
+            for column in cls.__columns:
+                value = to_float(record.get(column))
+                cls.__arrays[column][cls.__size] = np.nan if value is None else value
+            cls.__size += 1
+            cls.__version += 1
+            if cls.__directory and cls.__size % 256 == 0:
+                cls.__flush_meta()
+
+    @classmethod
+    def get_columns(cls, *names) -> tuple:
+        """Returns read-only views of the given columns
+
+        The views are not copied, they stay valid (as a snapshot) even if the
+        store grows afterwards.
+
+        Args:
+            *names (str): Names of the columns
+
+        Returns:
+            tuple[np.ndarray]: One array per requested column
+        """
+        with cls.__lock:
+            size = cls.__size
+            views = tuple(cls.__arrays[name][:size] for name in names)
+        for view in views:
+            view.flags.writeable = False
+        return views
+
+    @classmethod
+    def flush(cls):
+        """Writes the memory-mapped arrays and the row count to disk"""
+        if not cls.__directory or not cls.__loaded:
+            return
+        with cls.__lock:
+            cls.__flush_meta()
+
+    @classmethod
+    def __allocate(cls, capacity: int):
+        """Creates empty arrays able to hold the given number of rows, in the files
+        of a new generation if the store is on disk"""
+        capacity = -(-capacity // cls.CHUNK_ROWS) * cls.CHUNK_ROWS
+        if cls.__directory:
+            cls.__generation = uuid.uuid4().hex
+            os.makedirs(os.path.join(cls.__directory, cls.__generation))
+            cls.__arrays = {
+                column: cls.__map_file(column, capacity, "w+") for column in cls.__columns
+            }
+        else:
+            cls.__arrays = {
+                column: np.full(capacity, np.nan, dtype=np.float64) for column in cls.__columns
+            }
+        cls.__capacity = capacity
+
+    @classmethod
+    def __ensure_capacity(cls, needed: int):
+        """Grows every array by whole chunks until it can hold the needed rows"""
+        if needed <= cls.__capacity:
+            return
+
+        capacity = max(needed, cls.__capacity + cls.__capacity // 2)
+        capacity = -(-capacity // cls.CHUNK_ROWS) * cls.CHUNK_ROWS
+        for column in cls.__columns:
+            if cls.__directory:
+                cls.__arrays[column].flush()
+                with open(cls.__column_path(column, cls.__generation), "r+b") as f:
+                    f.truncate(capacity * 8)
+                grown = cls.__map_file(column, capacity, "r+")
+            else:
+                grown = np.full(capacity, np.nan, dtype=np.float64)
+                grown[: cls.__size] = cls.__arrays[column][: cls.__size]
+            cls.__arrays[column] = grown
+        cls.__capacity = capacity
+
+    @classmethod
+    def __open_from_disk(cls, row_count: int, stamp: dict) -> bool:
+        """Maps the arrays saved by a previous run if they match the table"""
+        if not cls.__directory:
+            return False
+
+        try:
+            with open(cls.__meta_path(), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if meta.get("columns") != list(cls.__columns) or meta.get("size") != row_count:
+            return False
+
+        try:
+            capacity = meta["capacity"]
+            generation = meta["generation"]
+            arrays = {
+                column: np.memmap(cls.__column_path(column, generation), dtype=np.float64, mode="r+",
+                                  shape=(capacity,))
+                for column in cls.__columns
+            }
+        except (OSError, ValueError, KeyError) as e:
+            cls.__logger.warning(f"Could not map the feature store files: {e}")
+            return False
+
+        # The row count alone does not tell if rows were changed or replaced
+        for column in cls.__columns:
+            values = arrays[column][:row_count]
+            valid = ~np.isnan(values)
+            count, total = stamp.get(column, (None, None))
+            if int(np.count_nonzero(valid)) != count or not np.isclose(
+                float(values[valid].sum()), total or 0.0, rtol=1e-9, atol=1e-6
+            ):
+                cls.__logger.info(f"Feature store files do not match the table (column {column})")
+                return False
+
+        cls.__arrays = arrays
+        cls.__generation = generation
+        cls.__capacity = capacity
+        cls.__size = row_count
+        return True
+
+    @classmethod
+    def __flush_meta(cls):
+        """Persists the arrays and then the metadata describing them"""
+        if not cls.__directory:
+            return
+        for array in cls.__arrays.values():
+            array.flush()
+
+        meta = {"columns": list(cls.__columns), "size": cls.__size, "capacity": cls.__capacity,
+                "generation": cls.__generation}
+        tmp_path = cls.__meta_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, cls.__meta_path())
+
+    @classmethod
+    def __remove_stale_generations(cls):
+        """Deletes the files of the previous generations (and of the unversioned
+        layout), arrays still mapping them stay valid until they are released"""
+        if not cls.__directory:
+            return
+        for name in os.listdir(cls.__directory):
+            path = os.path.join(cls.__directory, name)
+            try:
+                if os.path.isdir(path) and name != cls.__generation:
+                    shutil.rmtree(path)
+                elif name.endswith(".f64"):
+                    os.remove(path)
+            except OSError as e:
+                cls.__logger.warning(f"Could not remove the stale feature store file {path}: {e}")
+
+    @classmethod
+    def __map_file(cls, column: str, capacity: int, mode: str) -> np.memmap:
+        """Memory-maps the file of a column in the current generation"""
+        return np.memmap(cls.__column_path(column, cls.__generation), dtype=np.float64, mode=mode,
+                         shape=(capacity,))
+
+    @classmethod
+    def __column_path(cls, column: str, generation: str) -> str:
+        return os.path.join(cls.__directory, generation, f"{column}.f64")
+
+    @classmethod
+    def __meta_path(cls) -> str:
+        return os.path.join(cls.__directory, "meta.json")
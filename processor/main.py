@@ -2,6 +2,15 @@ import os
 import logging
 from subscriber import start_mqtt_client
 from database import Database
+from visited_stations import VisitedStations
+from feature_store import FeatureStore
+from streaming_stats import StreamingStats
+from anomaly_detector import AnomalyDetector
+from regions import RegionStats
+from timeseries import TimeSeries
+from retention import RetentionJob
+from spool import Spool
+from startup import Startup
 from app import app
 
 
@@ -15,18 +24,63 @@ __logger.setLevel(logging.INFO)
 
 __logger.info("Starting processor application...")
 
-# Start MQTT client
-mqtt_client = start_mqtt_client()
-if mqtt_client:
-    __logger.info("MQTT client started successfully")
-else:
-    __logger.error("Failed to start MQTT client")
+# Keep the in-memory indexes up to date with the ingested sessions
+Database.add_insert_listener(VisitedStations.on_insert)
+Database.add_insert_listener(FeatureStore.on_insert)
+Database.add_insert_listener(StreamingStats.on_insert)
+Database.add_insert_listener(AnomalyDetector.on_insert)
+Database.add_insert_listener(RegionStats.on_insert)
+Database.add_insert_listener(TimeSeries.on_insert)
+
+# Incoming messages are spooled to disk until the drainer inserts them
+Spool.open()
+
+# Handle of the MQTT client, set once the database is ready
+mqtt_client = None
+
+
+def start_processor():
+    """Initializes the database, then starts ingesting and the background jobs
+
+    Run by Startup in the background, so /healthz answers right away and /readyz
+    once this is done. Raises if the database is not ready, to be retried.
+    """
+    global mqtt_client
+
+    with Startup.phase("wait_for_db"):
+        if not Database.wait_until_ready():
+            raise RuntimeError("Database is not accepting connections")
 
-# Initialize the database
-try:
     Database.init_db()
     __logger.info("Database initialized successfully")
-except Exception as e:
-    __logger.error(f"Error initializing database: {e}")
 
-__logger.info("Processor application started")
+    # Messages are only consumed once the tables they are inserted into exist
+    with Startup.phase("mqtt"):
+        mqtt_client = start_mqtt_client()
+    if mqtt_client:
+        __logger.info("MQTT client started successfully")
+    else:
+        __logger.error("Failed to start MQTT client")
+
+    # Replay the spooled messages into the database in batches
+    Spool.start_drainer(Database.insert_ev_data_batch)
+
+    # Checkpoint the analytics sketches to the database periodically
+    StreamingStats.start_checkpoints(Database.save_sketches)
+
+    # Write the detected anomalies to the database and publish them as alerts
+    AnomalyDetector.start(
+        Database.insert_anomalies,
+        (lambda topic, payload: mqtt_client.publish(topic, payload)) if mqtt_client else None,
+    )
+
+    # Add the hourly values of the ingested sessions to the pre-bucketed series
+    TimeSeries.start(Database.add_hourly_usage)
+
+    # Compact old sessions in the background (only if RETENTION_DAYS is set)
+    RetentionJob.start()
+
+    __logger.info("Processor application started")
+
+
+Startup.start(start_processor)
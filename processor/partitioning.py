@@ -0,0 +1,101 @@
+"""
+SQL of the monthly range partitioning of the sessions table.
+
+The sessions table (ev_with_stations, or ev_sessions in compact mode) is
+partitioned by charging_start_time, one partition per month named
+<table>_pYYYYMM, plus a default partition for sessions without a start time
+or in a month whose partition does not exist yet. Partitions are created on
+demand by ev_ensure_month_partition, which moves the rows of that month out of
+the default partition before attaching the new one.
+"""
+
+import datetime
+
+ENSURE_PARTITION_FUNCTION_SQL = """
+CREATE OR REPLACE FUNCTION ev_ensure_month_partition(parent TEXT, month_start DATE)
+RETURNS VOID AS $$
+DECLARE
+    partition_name TEXT := parent || '_p' || to_char(month_start, 'YYYYMM');
+    month_end DATE := (month_start + INTERVAL '1 month')::DATE;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- Concurrent inserts in the same new month create the partition only once
+    PERFORM pg_advisory_xact_lock(hashtext(partition_name));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   partition_name, parent);
+    EXECUTE format('WITH moved AS (DELETE FROM %I WHERE charging_start_time >= %L '
+                   'AND charging_start_time < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                   parent || '_default', month_start, month_end, partition_name);
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   parent, partition_name, month_start, month_end);
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+# Clause that makes a CREATE TABLE statement create the partitioned table
+PARTITION_BY = "PARTITION BY RANGE (charging_start_time)"
+
+# Lists the partitions of a table (parameter: the table name)
+PARTITIONS_SQL = """
+SELECT c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = to_regclass(%s);
+"""
+
+
+def partitioned_table_sql(table):
+    """
+    Returns the SQL creating the default partition and the BRIN index of a
+    partitioned sessions table, along with ev_ensure_month_partition.
+    """
+    return f"""
+{ENSURE_PARTITION_FUNCTION_SQL}
+CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT;
+CREATE INDEX IF NOT EXISTS {table}_start_brin_idx ON {table} USING BRIN (charging_start_time);
+"""
+
+
+def default_partition_months_sql(table):
+    """Returns the SQL listing the months that only have rows in the default partition"""
+    return f"""
+SELECT DISTINCT date_trunc('month', charging_start_time)::DATE
+FROM {table}_default
+WHERE charging_start_time IS NOT NULL
+ORDER BY 1;
+"""
+
+
+def month_of_partition(partition_name):
+    """Returns the first day of the month of a <table>_pYYYYMM partition, None for others"""
+    _, _, suffix = partition_name.rpartition("_p")
+    try:
+        return datetime.date(int(suffix[:4]), int(suffix[4:6]), 1) if len(suffix) == 6 else None
+    except ValueError:
+        return None
+
+
+def month_start(value):
+    """
+    Returns the first day of the month of a session start time, None if it is
+    missing or not an ISO timestamp (the row then lands in the default partition)
+    """
+    if value is None:
+        return None
+    if not isinstance(value, datetime.datetime):
+        try:
+            value = datetime.datetime.fromisoformat(str(value))
+        except ValueError:
+            return None
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month):
+    """Returns the first day of the month after the given one"""
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
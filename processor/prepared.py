@@ -0,0 +1,78 @@
+import collections
+import hashlib
+import psycopg2.extensions
+
+
+class PreparedConnection(psycopg2.extensions.connection):
+    """
+    A database connection that prepares its statements server-side.
+
+    Used as the connection_factory of the pool: a statement run through
+    execute_prepared is parsed and planned by Postgres once per connection
+    (PREPARE) and then only executed by name (EXECUTE). The statements prepared
+    on the session are remembered on the connection object itself, so the
+    cache survives the pool's checkout/return cycles and is dropped with the
+    connection if the pool discards it.
+
+    Statements are named after a hash of their SQL, so a query built at call
+    time (a column list, an optional time range) gets one statement per shape.
+    The least recently used ones are deallocated past MAX_STATEMENTS.
+    """
+
+    MAX_STATEMENTS = 128
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Statement name -> (SQL, parameter types), least recently used first
+        self.__prepared = collections.OrderedDict()
+        self.prepare_count = 0
+        self.execute_count = 0
+
+    def execute_prepared(self, cur, sql: str, params=(), types=None, prefix=""):
+        """Executes a statement, preparing it on this connection the first time
+
+        Args:
+            cur: A cursor of this connection
+            sql (str): The statement, with $1, $2, ... placeholders
+            params (tuple): The parameter values
+            types (tuple[str]): The parameter types, needed when Postgres cannot
+                                infer them or the values need an explicit cast
+                                (e.g. text arrays to timestamp arrays)
+            prefix (str): Placed before EXECUTE, e.g. to EXPLAIN the statement
+        """
+        name = statement_name(sql, types)
+        if name in self.__prepared:
+            self.__prepared.move_to_end(name)
+        else:
+            if len(self.__prepared) >= self.MAX_STATEMENTS:
+                evicted, _ = self.__prepared.popitem(last=False)
+                cur.execute(f"DEALLOCATE {evicted};")
+            type_list = f" ({', '.join(types)})" if types else ""
+            cur.execute(f"PREPARE {name}{type_list} AS {sql}")
+            # Prepared statements outlive the transaction, even if it is rolled back
+            self.__prepared[name] = (sql, types)
+            self.prepare_count += 1
+
+        self.execute_count += 1
+        if not params:
+            cur.execute(f"{prefix}EXECUTE {name};")
+            return
+        if types:
+            placeholders = ", ".join(f"%s::{type_name}" for type_name in types)
+        else:
+            placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"{prefix}EXECUTE {name} ({placeholders});", params)
+
+    def prepared_sql(self, name: str):
+        """Returns the (SQL, parameter types) a statement was prepared from, None if unknown"""
+        return self.__prepared.get(name)
+
+    def prepared_statements(self) -> int:
+        """Returns how many statements are prepared on this connection"""
+        return len(self.__prepared)
+
+
+def statement_name(sql: str, types=None) -> str:
+    """Returns the name under which a statement is prepared"""
+    digest = hashlib.blake2b(f"{sql}\0{types}".encode("utf-8"), digest_size=8).hexdigest()
+    return f"ev_stmt_{digest}"
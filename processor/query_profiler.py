@@ -0,0 +1,214 @@
+import psycopg2.extensions
+import collections
+import threading
+import datetime
+import logging
+import queue
+import time
+import sys
+import re
+import os
+
+
+class ProfilingCursor(psycopg2.extensions.cursor):
+    """A cursor that reports the duration of every statement it executes to QueryProfiler"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            QueryProfiler.record(self.connection, query, vars, time.perf_counter() - start)
+
+
+class QueryProfiler:
+    """
+    A static class that keeps the timing of the queries run through ProfilingCursor.
+
+    Every statement is attributed to the method of the source file given to
+    configure (the Database method that ran it) and aggregated per method and
+    per statement: calls, total, mean and max time. Statements slower than
+    DB_SLOW_QUERY_MS are logged and their plan is captured by a background
+    thread on another connection, with EXPLAIN (ANALYZE, BUFFERS) for SELECTs
+    and a plain EXPLAIN for writes, into a ring buffer of the last
+    DB_EXPLAIN_BUFFER slow statements.
+    """
+
+    SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+    EXPLAIN_BUFFER = int(os.getenv("DB_EXPLAIN_BUFFER", "50"))
+    # A statement is explained at most once per interval
+    EXPLAIN_INTERVAL_SECONDS = 60.0
+    MAX_STATEMENT_CHARS = 500
+
+    __source_file = None
+    __get_connection = None
+    __release_connection = None
+    __stats = {}
+    __slow = collections.deque(maxlen=EXPLAIN_BUFFER)
+    __last_explained = {}
+    __pending = queue.Queue(maxsize=100)
+    __worker = None
+    __lock = threading.Lock()
+    __logger = logging.getLogger("query-profiler")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def configure(cls, source_file: str, get_connection, release_connection):
+        """Sets where queries are attributed and how slow statements are explained
+
+        Args:
+            source_file (str): File whose functions the queries are attributed to
+            get_connection (callable): Returns a connection to run EXPLAIN on, None if unavailable
+            release_connection (callable): Gives that connection back
+        """
+        cls.__source_file = source_file
+        cls.__get_connection = get_connection
+        cls.__release_connection = release_connection
+
+    @classmethod
+    def record(cls, conn, query, params, duration: float):
+        """Accounts a statement run by a ProfilingCursor"""
+        if isinstance(query, bytes):
+            query = query.decode("utf-8", "replace")
+        else:
+            query = str(query)
+
+        # Prepared statements are accounted (and explained) as the SQL they were prepared from
+        prepared = None
+        if query.startswith("EXECUTE ") and hasattr(conn, "prepared_sql"):
+            prepared = conn.prepared_sql(query[len("EXECUTE "):].split(" ", 1)[0].rstrip(";"))
+        sql = prepared[0] if prepared else query
+
+        method = cls.__calling_method()
+        statement = normalize_statement(sql)[: cls.MAX_STATEMENT_CHARS]
+        duration_ms = duration * 1000
+        with cls.__lock:
+            stats = cls.__stats.get((method, statement))
+            if stats is None:
+                stats = cls.__stats[(method, statement)] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += duration_ms
+            stats[2] = max(stats[2], duration_ms)
+
+        if duration_ms >= cls.SLOW_QUERY_MS:
+            cls.__logger.warning(f"Slow query in {method} ({duration_ms:.0f} ms): {statement[:200]}")
+            cls.__queue_explain(method, statement, sql, params, prepared, duration_ms)
+
+    @classmethod
+    def report(cls, limit: int = 20) -> dict:
+        """Returns the top methods and statements by total time and the captured slow plans"""
+        with cls.__lock:
+            stats = [(method, statement, *values) for (method, statement), values in cls.__stats.items()]
+            slow = list(cls.__slow)
+
+        methods = {}
+        for method, _, calls, total, longest in stats:
+            entry = methods.setdefault(method, {"method": method, "calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["calls"] += calls
+            entry["total_ms"] += total
+            entry["max_ms"] = max(entry["max_ms"], longest)
+        for entry in methods.values():
+            entry["mean_ms"] = entry["total_ms"] / entry["calls"]
+
+        statements = [
+            {
+                "method": method,
+                "statement": statement,
+                "calls": calls,
+                "total_ms": total,
+                "mean_ms": total / calls,
+                "max_ms": longest,
+            }
+            for method, statement, calls, total, longest in stats
+        ]
+        by_total = lambda entry: entry["total_ms"]
+        return {
+            "slow_query_ms": cls.SLOW_QUERY_MS,
+            "methods": sorted(methods.values(), key=by_total, reverse=True)[:limit],
+            "statements": sorted(statements, key=by_total, reverse=True)[:limit],
+            "slow_queries": slow[::-1][:limit],
+        }
+
+    @classmethod
+    def reset(cls):
+        """Forgets the timings and captured plans"""
+        with cls.__lock:
+            cls.__stats.clear()
+            cls.__slow.clear()
+            cls.__last_explained.clear()
+
+    @classmethod
+    def __calling_method(cls) -> str:
+        """Returns the name of the innermost function of the source file in the call stack"""
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_code.co_filename == cls.__source_file:
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return "<unknown>"
+
+    @classmethod
+    def __queue_explain(cls, method, statement, sql, params, prepared, duration_ms):
+        """Hands a slow statement to the explain thread, unless it was explained recently"""
+        if cls.__get_connection is None or threading.current_thread() is cls.__worker:
+            return
+        now = time.monotonic()
+        with cls.__lock:
+            if now - cls.__last_explained.get(statement, -cls.EXPLAIN_INTERVAL_SECONDS) < cls.EXPLAIN_INTERVAL_SECONDS:
+                return
+            cls.__last_explained[statement] = now
+            if cls.__worker is None:
+                cls.__worker = threading.Thread(target=cls.__run_explains, name="query-explain", daemon=True)
+                cls.__worker.start()
+        try:
+            cls.__pending.put_nowait((method, statement, sql, params, prepared, duration_ms))
+        except queue.Full:
+            pass
+
+    @classmethod
+    def __run_explains(cls):
+        while True:
+            method, statement, sql, params, prepared, duration_ms = cls.__pending.get()
+            entry = {
+                "method": method,
+                "statement": statement,
+                "duration_ms": duration_ms,
+                "captured_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+            # ANALYZE runs the statement again, so writes are only planned
+            options = "(ANALYZE, BUFFERS) " if is_select(sql) else ""
+            entry["analyzed"] = bool(options)
+            entry["plan"] = cls.__explain(f"EXPLAIN {options}", sql, params, prepared)
+            with cls.__lock:
+                cls.__slow.append(entry)
+
+    @classmethod
+    def __explain(cls, prefix, sql, params, prepared):
+        """Runs EXPLAIN for a statement and returns the plan as text"""
+        conn = cls.__get_connection()
+        if not conn:
+            return "No connection available to explain the statement"
+        try:
+            # A plain cursor, so the EXPLAIN itself is not profiled
+            with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+                if prepared:
+                    conn.execute_prepared(cur, sql, params, prepared[1], prefix=prefix)
+                else:
+                    cur.execute(prefix + sql, params)
+                return "\n".join(row[0] for row in cur.fetchall())
+        except Exception as e:
+            return f"Could not explain the statement: {e}"
+        finally:
+            conn.rollback()
+            cls.__release_connection(conn)
+
+
+def normalize_statement(sql: str) -> str:
+    """Collapses whitespace and lists of placeholders, so the same query is accounted once"""
+    sql = " ".join(sql.split())
+    return re.sub(r"%s(\s*,\s*%s)+", "%s, ...", sql)
+
+
+def is_select(sql: str) -> bool:
+    """Checks if a statement is a plain SELECT, which EXPLAIN ANALYZE can run safely"""
+    return sql.lstrip().split(None, 1)[0].upper() == "SELECT" if sql.strip() else False
@@ -0,0 +1,174 @@
+from conversions import to_float
+import threading
+import logging
+
+
+REGION_LEVELS = ("district", "municipality", "parish")
+
+# Column of the region code of each level, the same in stations and in the sessions
+REGION_COLUMNS = {
+    "district": "coddistrito",
+    "municipality": "coddistritoconcelho",
+    "parish": "coddistritoconcelhofreguesia",
+}
+
+# SQL type of the region code columns added to the sessions
+REGION_COLUMN_TYPES = {"coddistrito": "SMALLINT", "coddistritoconcelho": "SMALLINT", "coddistritoconcelhofreguesia": "TEXT"}
+
+
+def parent_code(level: str, code):
+    """Returns the code of the region containing a municipality or parish, None for a district
+
+    Municipality codes are the district code followed by two digits and parish
+    codes the municipality code followed by two characters (e.g. 8 > 815 > 81504).
+    """
+    try:
+        if level == "municipality":
+            return int(code) // 100
+        if level == "parish":
+            return int(str(code)[:-2])
+    except ValueError:
+        pass
+    return None
+
+
+class RegionStats:
+    """
+    A static class that keeps per-region rollups of the sessions: number of
+    sessions, energy, cost and distinct users of every district, municipality
+    and parish.
+
+    The sessions carry the region codes of their station (denormalised at
+    ingest from StationRegistry), so the rollups are built at startup with one
+    GROUP BY over the sessions, without joining the stations, and then updated
+    by the insert listener. Every region of the stations table is listed, with
+    zeros if it has no sessions, so the responses can color a whole map.
+    """
+
+    # level -> {code: name}
+    __names = {level: {} for level in REGION_LEVELS}
+    # level -> {code: [sessions, energy, cost, set of users]}
+    __rollups = {level: {} for level in REGION_LEVELS}
+    __version = 0
+    __loaded = False
+    __lock = threading.Lock()
+    __logger = logging.getLogger("region-stats")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, names: list, sessions: list, summaries: list, station_regions):
+        """Builds the rollups
+
+        Args:
+            names (list[tuple]): (district code, district, municipality code,
+                                 municipality, parish code, parish) rows of stations
+            sessions (list[tuple]): (district, municipality, parish, user_id, sessions,
+                                    energy, cost) rows, grouped by region and user
+            summaries (list[tuple]): (charging_station_id, user_id, sessions, energy,
+                                     cost) rows of the compacted sessions
+            station_regions (callable): Returns the (district, municipality, parish)
+                                        codes of a station
+        """
+        region_names = {level: {} for level in REGION_LEVELS}
+        for district, district_name, municipality, municipality_name, parish, parish_name in names:
+            for level, code, name in zip(
+                REGION_LEVELS,
+                (district, municipality, parish),
+                (district_name, municipality_name, parish_name),
+            ):
+                if code is not None:
+                    region_names[level].setdefault(code, name)
+
+        rollups = {level: {} for level in REGION_LEVELS}
+        for *codes, user_id, session_count, energy, cost in sessions:
+            cls.__add(rollups, codes, user_id, session_count, energy, cost)
+        for station_id, user_id, session_count, energy, cost in summaries:
+            cls.__add(rollups, station_regions(station_id), user_id, session_count, energy, cost)
+
+        with cls.__lock:
+            cls.__names = region_names
+            cls.__rollups = rollups
+            cls.__version += 1
+            cls.__loaded = True
+        cls.__logger.info(
+            "Region rollups built for "
+            + ", ".join(f"{len(rollups[level])} {level}s" for level in REGION_LEVELS)
+        )
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Insert listener, adds an ingested session to the rollups of its regions"""
+        if not cls.__loaded:
+            return
+        codes = [record.get(REGION_COLUMNS[level]) for level in REGION_LEVELS]
+        with cls.__lock:
+            cls.__add(
+                cls.__rollups,
+                codes,
+                record.get("user_id"),
+                1,
+                to_float(record.get("energy_consumed_kwh")),
+                to_float(record.get("charging_cost_eur")),
+            )
+            cls.__version += 1
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the rollups cover the stored sessions"""
+        return cls.__loaded
+
+    @classmethod
+    def get_version(cls) -> int:
+        """Returns a number that changes every time the rollups change"""
+        return cls.__version
+
+    @classmethod
+    def stats(cls, level: str, parent=None) -> list:
+        """Returns the rollups of every region of a level, ordered by code
+
+        Args:
+            level (str): "district", "municipality" or "parish"
+            parent (int, optional): Only the regions inside this district (for
+                                    municipalities) or municipality (for parishes)
+
+        Returns:
+            list[dict]: code, name, parent, sessions, energy_kwh, cost_eur and
+                        distinct_users of each region
+        """
+        with cls.__lock:
+            names = cls.__names[level]
+            rollups = cls.__rollups[level]
+            codes = sorted(set(names) | set(rollups))
+            regions = []
+            for code in codes:
+                region_parent = parent_code(level, code)
+                if parent is not None and region_parent != parent:
+                    continue
+                session_count, energy, cost, users = rollups.get(code) or (0, 0.0, 0.0, ())
+                regions.append(
+                    {
+                        "code": code,
+                        "name": names.get(code),
+                        "parent": region_parent,
+                        "sessions": session_count,
+                        "energy_kwh": energy,
+                        "cost_eur": cost,
+                        "distinct_users": len(users),
+                    }
+                )
+            return regions
+
+    @staticmethod
+    def __add(rollups: dict, codes, user_id, session_count, energy, cost):
+        for level, code in zip(REGION_LEVELS, codes):
+            if code is None:
+                continue
+            rollup = rollups[level].get(code)
+            if rollup is None:
+                rollup = rollups[level][code] = [0, 0.0, 0.0, set()]
+            rollup[0] += session_count
+            rollup[1] += energy or 0.0
+            rollup[2] += cost or 0.0
+            if user_id is not None:
+                rollup[3].add(user_id)
+
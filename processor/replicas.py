@@ -0,0 +1,213 @@
+from prepared import PreparedConnection
+from psycopg2 import pool
+import threading
+import itertools
+import time
+import logging
+import psycopg2
+import os
+
+
+class Replica:
+    """A read endpoint, with its own connection pool and last known replay position"""
+
+    def __init__(self, host: str, port: str):
+        self.host = host
+        self.port = port
+        self.pool = None
+        # WAL position replayed by the replica at the last check, None while unknown
+        self.replay_lsn = None
+        self.lag_bytes = None
+        self.healthy = False
+        self.checked = False
+
+    def __repr__(self):
+        return f"{self.host}:{self.port}"
+
+
+class ReplicaSet:
+    """
+    A static class that routes read queries to the read endpoints listed in
+    DB_READ_HOSTS (comma separated host[:port], usually streaming replicas).
+
+    Every DB_REPLICA_CHECK_SECONDS a monitor thread reads the WAL position of the
+    primary and the position replayed by each replica. A replica is used for
+    reads only while it is reachable and less than DB_MAX_REPLICA_LAG_BYTES
+    behind the primary, only once it has replayed the position the caller
+    requires (e.g. the last write behind a cached version), and, for a thread
+    that wrote to the primary, only once it has replayed that write
+    (read-your-writes). When no replica qualifies the caller falls back to the
+    primary.
+    """
+
+    MAX_LAG_BYTES = int(os.getenv("DB_MAX_REPLICA_LAG_BYTES", str(1024 * 1024)))
+    CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "2"))
+    POOL_MAX = int(os.getenv("DB_READ_POOL_MAX", "10"))
+
+    __replicas = []
+    __round_robin = itertools.count()
+    __last_writes = threading.local()
+    __primary_lsn = None
+    __monitor = None
+    __logger = logging.getLogger("replicas")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def configure(cls, hosts: str, connect_kwargs: dict, primary_lsn):
+        """Registers the read endpoints and starts the monitor thread
+
+        Args:
+            hosts (str): Comma separated host[:port] list, no replicas if empty
+            connect_kwargs (dict): user, password and database of the connections
+            primary_lsn (callable): Returns the current WAL position of the primary, None if unknown
+        """
+        if cls.__monitor is not None:
+            return
+        for entry in filter(None, (entry.strip() for entry in (hosts or "").split(","))):
+            host, _, port = entry.partition(":")
+            cls.__replicas.append(Replica(host, port or "5432"))
+        if not cls.__replicas:
+            return
+
+        cls.__monitor = threading.Thread(
+            target=cls.__run_monitor, args=(connect_kwargs, primary_lsn), name="replica-monitor", daemon=True
+        )
+        cls.__monitor.start()
+        cls.__logger.info(f"Reads are routed to replicas {cls.__replicas} when they are up to date")
+
+    @classmethod
+    def enabled(cls) -> bool:
+        """Checks if read endpoints are configured"""
+        return bool(cls.__replicas)
+
+    @classmethod
+    def record_write(cls, lsn: int):
+        """Remembers the WAL position of a write of the calling thread, so its next
+        reads only go to replicas that replayed it"""
+        if lsn is not None:
+            cls.__last_writes.lsn = max(lsn, getattr(cls.__last_writes, "lsn", 0))
+
+    @classmethod
+    def getconn(cls, min_lsn=0):
+        """Gets a connection from an eligible replica
+
+        Args:
+            min_lsn (int, optional): WAL position the replica must have replayed
+
+        Returns:
+            PreparedConnection: A connection with a .replica attribute, None if the
+                                read has to go to the primary
+        """
+        min_lsn = max(min_lsn, getattr(cls.__last_writes, "lsn", 0))
+        eligible = [
+            replica for replica in cls.__replicas
+            if replica.healthy
+            and replica.lag_bytes is not None and replica.lag_bytes <= cls.MAX_LAG_BYTES
+            and replica.replay_lsn >= min_lsn
+        ]
+        if not eligible:
+            return None
+
+        replica = eligible[next(cls.__round_robin) % len(eligible)]
+        # The monitor replaces the pool of a replica that went down
+        replica_pool = replica.pool
+        if replica_pool is None:
+            return None
+        try:
+            conn = replica_pool.getconn()
+        except (pool.PoolError, psycopg2.Error) as e:
+            replica.healthy = False
+            cls.__logger.warning(f"Replica {replica} unavailable, reading from the primary: {e}")
+            return None
+        conn.replica = replica
+        conn.replica_pool = replica_pool
+        return conn
+
+    @staticmethod
+    def putconn(conn):
+        """Returns a connection obtained with getconn to its replica's pool"""
+        try:
+            conn.replica_pool.putconn(conn)
+        except pool.PoolError:
+            # The pool was closed in the meantime
+            conn.close()
+
+    @classmethod
+    def status(cls) -> list:
+        """Returns the state of each replica, as last seen by the monitor"""
+        return [
+            {
+                "host": replica.host,
+                "port": replica.port,
+                "healthy": replica.healthy,
+                "lag_bytes": replica.lag_bytes,
+            }
+            for replica in cls.__replicas
+        ]
+
+    @classmethod
+    def __run_monitor(cls, connect_kwargs, primary_lsn):
+        while True:
+            # Read before the replicas, so the lag is never underestimated
+            cls.__primary_lsn = primary_lsn()
+            for replica in cls.__replicas:
+                cls.__check(replica, connect_kwargs)
+            time.sleep(cls.CHECK_SECONDS)
+
+    @classmethod
+    def __check(cls, replica: Replica, connect_kwargs: dict):
+        """Refreshes the replay position and lag of a replica"""
+        conn = None
+        try:
+            if replica.pool is None:
+                replica.pool = pool.ThreadedConnectionPool(
+                    1,
+                    cls.POOL_MAX,
+                    host=replica.host,
+                    port=replica.port,
+                    connection_factory=PreparedConnection,
+                    **connect_kwargs,
+                )
+            conn = replica.pool.getconn()
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_is_in_recovery(), pg_last_wal_replay_lsn()::text;")
+                in_recovery, replay_lsn = cur.fetchone()
+            conn.rollback()
+        except Exception as e:
+            if replica.healthy:
+                cls.__logger.warning(f"Replica {replica} is unreachable: {e}")
+            replica.healthy = False
+            replica.checked = True
+            if replica.pool is not None:
+                # Pooled connections do not survive a restart of the replica
+                replica.pool.closeall()
+                replica.pool = None
+            return
+        finally:
+            if conn is not None and replica.pool is not None:
+                replica.pool.putconn(conn)
+
+        if not in_recovery or replay_lsn is None:
+            # Not a standby, its data cannot be assumed to follow the primary
+            if replica.healthy or not replica.checked:
+                cls.__logger.warning(f"Read endpoint {replica} is not a replica, not used for reads")
+            replica.healthy = False
+            replica.checked = True
+            return
+
+        replica.replay_lsn = parse_lsn(replay_lsn)
+        replica.lag_bytes = (
+            max(cls.__primary_lsn - replica.replay_lsn, 0) if cls.__primary_lsn is not None else None
+        )
+        if not replica.healthy:
+            cls.__logger.info(f"Replica {replica} is reachable, {replica.lag_bytes} bytes behind")
+        replica.healthy = True
+        replica.checked = True
+
+
+def parse_lsn(lsn: str):
+    """Converts a Postgres LSN ('16/B374D848') to an integer, None stays None"""
+    if lsn is None:
+        return None
+    high, _, low = lsn.partition("/")
+    return (int(high, 16) << 32) | int(low, 16)
@@ -0,0 +1,79 @@
+from database import Database
+import datetime
+import threading
+import logging
+import os
+
+
+class RetentionJob:
+    """
+    A static class that runs the retention of raw sessions in the background.
+
+    Once per RETENTION_INTERVAL_HOURS, the sessions that started more than
+    RETENTION_DAYS days ago are archived to a gzip CSV file in ARCHIVE_DIR,
+    rolled up into per-user/station/day rows of ev_daily_summary and deleted
+    from the hot table (whole monthly partitions are dropped). The job is
+    disabled unless RETENTION_DAYS is set.
+    """
+
+    __retention_days = int(os.getenv("RETENTION_DAYS", "0") or 0)
+    __interval_hours = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+    __archive_dir = os.getenv("ARCHIVE_DIR", "archive")
+    __thread = None
+    __stop_event = threading.Event()
+    __logger = logging.getLogger("retention")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def start(cls):
+        """Starts the background job, if retention is enabled"""
+        if cls.__retention_days <= 0:
+            cls.__logger.info("Retention is disabled (RETENTION_DAYS not set)")
+            return
+        if cls.__thread is not None:
+            return
+
+        cls.__thread = threading.Thread(target=cls.__run, name="retention", daemon=True)
+        cls.__thread.start()
+        cls.__logger.info(
+            f"Retention started: sessions older than {cls.__retention_days} days are "
+            f"compacted every {cls.__interval_hours} hours"
+        )
+
+    @classmethod
+    def stop(cls):
+        """Stops the background job after the current run"""
+        cls.__stop_event.set()
+
+    @classmethod
+    def run_once(cls):
+        """Compacts the sessions older than the retention period
+
+        Returns:
+            dict: What was compacted, see Database.compact_sessions
+        """
+        cutoff = datetime.datetime.combine(
+            datetime.date.today() - datetime.timedelta(days=cls.__retention_days),
+            datetime.time.min,
+        )
+        result = Database.compact_sessions(cutoff, cls.__archive_dir)
+        if result.get("sessions"):
+            cls.__logger.info(
+                f"Compacted {result['sessions']} sessions started before {cutoff:%Y-%m-%d} "
+                f"into {result['summary_rows']} summary rows, archived to {result['archive']}, "
+                f"pruned {result['pruned_keys']} ingested keys"
+            )
+            # The in-memory columns no longer match the table
+            Database.load_feature_store()
+        elif result.get("pruned_keys"):
+            cls.__logger.info(f"Pruned {result['pruned_keys']} ingested keys of sessions before {cutoff:%Y-%m-%d}")
+        return result
+
+    @classmethod
+    def __run(cls):
+        while not cls.__stop_event.is_set():
+            try:
+                cls.run_once()
+            except Exception as e:
+                cls.__logger.error(f"Retention run failed: {e}", exc_info=True)
+            cls.__stop_event.wait(cls.__interval_hours * 3600)
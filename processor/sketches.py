@@ -0,0 +1,253 @@
+"""
+Mergeable streaming sketches, used by StreamingStats.
+
+Every sketch has add, merge, estimate methods and a to_state/from_state pair
+returning plain JSON-compatible values for the Postgres checkpoints.
+"""
+
+import hashlib
+import base64
+import random
+import math
+import numpy as np
+
+
+def hash64(value) -> int:
+    """Returns a 64-bit hash of a value, stable across processes (unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """
+    Distinct count estimator with 2^precision one-byte registers.
+
+    The standard error is 1.04 / sqrt(2^precision): 3.3% with 1 KB (precision
+    10), 0.8% with 16 KB (precision 14). Small cardinalities use linear
+    counting, so a few dozen users are counted almost exactly.
+    """
+
+    def __init__(self, precision: int = 10):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, value):
+        hashed = hash64(value)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_state(self):
+        return base64.b64encode(self.registers.tobytes()).decode("ascii")
+
+    @classmethod
+    def from_state(cls, state) -> "HyperLogLog":
+        registers = np.frombuffer(base64.b64decode(state), dtype=np.uint8).copy()
+        sketch = cls(int(math.log2(len(registers))))
+        sketch.registers = registers
+        return sketch
+
+
+class KllSketch:
+    """
+    Quantile sketch (Karnin, Lang and Liberty), keeping O(k log n) values.
+
+    Level h holds values standing for 2^h inputs each. When the sketch is full,
+    the lowest full level is sorted and every other value (random offset) is
+    promoted to the next level. The rank error is about 1.7 / k (under 1% for
+    k = 200). The exact minimum and maximum are kept besides.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def add(self, value):
+        if value is None or value != value:
+            return
+        value = float(value)
+        self.levels[0].append(value)
+        self.count += 1
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if self.__size() >= self.__max_size():
+            self.__compress()
+
+    def merge(self, other: "KllSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, values in enumerate(other.levels):
+            self.levels[level].extend(values)
+        self.count += other.count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        while self.__size() >= self.__max_size():
+            self.__compress()
+
+    def quantiles(self, fractions) -> list:
+        """Returns the estimated values at the given fractions (0 to 1), None if empty"""
+        if not self.count:
+            return [None for _ in fractions]
+        weighted = sorted(
+            (value, 1 << level) for level, values in enumerate(self.levels) for value in values
+        )
+        values = np.array([value for value, _ in weighted])
+        cumulative = np.cumsum([weight for _, weight in weighted])
+        total = cumulative[-1]
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.minimum)
+            elif fraction >= 1:
+                results.append(self.maximum)
+            else:
+                position = int(np.searchsorted(cumulative, fraction * total))
+                results.append(float(values[min(position, len(values) - 1)]))
+        return results
+
+    def __capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return int(math.ceil((2 / 3) ** depth * self.k)) + 1
+
+    def __max_size(self) -> int:
+        return sum(self.__capacity(level) for level in range(len(self.levels)))
+
+    def __size(self) -> int:
+        return sum(len(values) for values in self.levels)
+
+    def __compress(self):
+        for level in range(len(self.levels)):
+            if len(self.levels[level]) >= self.__capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                values = sorted(self.levels[level])
+                # An odd value out stays on its level
+                kept = [values.pop()] if len(values) % 2 else []
+                self.levels[level + 1].extend(values[random.randint(0, 1) :: 2])
+                self.levels[level] = kept
+                if self.__size() < self.__max_size():
+                    break
+
+    def to_state(self):
+        return {
+            "k": self.k,
+            "count": self.count,
+            "min": self.minimum if self.count else None,
+            "max": self.maximum if self.count else None,
+            "levels": self.levels,
+        }
+
+    @classmethod
+    def from_state(cls, state) -> "KllSketch":
+        sketch = cls(state["k"])
+        sketch.levels = [list(values) for values in state["levels"]] or [[]]
+        sketch.count = state["count"]
+        if sketch.count:
+            sketch.minimum, sketch.maximum = state["min"], state["max"]
+        return sketch
+
+
+class CountMinSketch:
+    """
+    Frequency (or weight) estimator over an unbounded set of keys.
+
+    depth rows of width counters; a key adds its weight to one counter per row
+    and is estimated by the smallest of them, so estimates never undercount and
+    overcount by at most 2 / width of the total weight with probability
+    1 - 2^-depth.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        self.table = np.zeros((depth, width), dtype=np.float64)
+
+    def __columns(self, key) -> np.ndarray:
+        digest = hashlib.blake2b(str(key).encode("utf-8"), digest_size=4 * len(self.table)).digest()
+        return np.frombuffer(digest, dtype=np.uint32) % self.table.shape[1]
+
+    def add(self, key, weight: float = 1.0):
+        self.table[np.arange(len(self.table)), self.__columns(key)] += weight
+
+    def merge(self, other: "CountMinSketch"):
+        self.table += other.table
+
+    def estimate(self, key) -> float:
+        return float(self.table[np.arange(len(self.table)), self.__columns(key)].min())
+
+    def to_state(self):
+        return {
+            "depth": self.table.shape[0],
+            "width": self.table.shape[1],
+            "table": base64.b64encode(self.table.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_state(cls, state) -> "CountMinSketch":
+        sketch = cls(state["width"], state["depth"])
+        table = np.frombuffer(base64.b64decode(state["table"]), dtype=np.float64)
+        sketch.table = table.reshape(state["depth"], state["width"]).copy()
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Heavy hitters (Metwally et al.) with a fixed number of counters.
+
+    A key that is not tracked replaces the one with the smallest count and
+    inherits it as its error, so any key heavier than total / capacity is
+    always tracked and its count overestimates by at most its error.
+    """
+
+    def __init__(self, capacity: int = 128):
+        self.capacity = capacity
+        # key -> [count, error]
+        self.counters = {}
+
+    def add(self, key, weight: float = 1.0):
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [weight, 0]
+        else:
+            smallest = min(self.counters, key=lambda tracked: self.counters[tracked][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[key] = [floor + weight, floor]
+
+    def merge(self, other: "SpaceSaving"):
+        for key, (count, error) in other.counters.items():
+            counter = self.counters.setdefault(key, [0, 0])
+            counter[0] += count
+            counter[1] += error
+        if len(self.counters) > self.capacity:
+            kept = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+            self.counters = dict(kept[: self.capacity])
+
+    def top(self, limit: int) -> list:
+        """Returns the heaviest (key, count, error) tuples, heaviest first"""
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(key, count, error) for key, (count, error) in ranked[:limit]]
+
+    def to_state(self):
+        return {"capacity": self.capacity, "counters": self.counters}
+
+    @classmethod
+    def from_state(cls, state) -> "SpaceSaving":
+        sketch = cls(state["capacity"])
+        sketch.counters = {key: list(counter) for key, counter in state["counters"].items()}
+        return sketch
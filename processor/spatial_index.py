@@ -0,0 +1,139 @@
+from scipy.spatial import cKDTree
+from station_registry import StationRegistry
+import numpy as np
+import threading
+import logging
+
+# Mean Earth radius (IUGG), in kilometres
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vectors(latitudes, longitudes) -> np.ndarray:
+    """Converts coordinates in degrees to points on the unit sphere
+
+    Args:
+        latitudes (array-like): Latitudes in degrees
+        longitudes (array-like): Longitudes in degrees
+
+    Returns:
+        np.ndarray: Array of shape (n, 3) with the x, y, z coordinates
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Converts straight-line distances on the unit sphere to great-circle kilometres"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+def km_to_chord(distance_km: float) -> float:
+    """Converts a great-circle distance in kilometres to a distance on the unit sphere"""
+    angle = min(distance_km / EARTH_RADIUS_KM, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+class SpatialIndex:
+    """
+    A static class that answers nearest-station and radius queries.
+
+    Stations are projected onto the unit sphere and indexed with a KD-tree, where
+    the euclidean (chord) distance is monotonic with the great-circle distance,
+    so results are exact haversine distances. The tree is built once from the
+    StationRegistry and rebuilt only if the registry is reloaded.
+    """
+
+    __tree = None
+    __positions = np.empty(0, dtype=np.int64)
+    __registry_ids = None
+    __lock = threading.Lock()
+    __logger = logging.getLogger("spatial-index")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def __get_tree(cls):
+        """Returns the KD-tree, building it if the registry changed since the last build"""
+        ids = StationRegistry.get_ids()
+        if cls.__tree is not None and cls.__registry_ids is ids:
+            return cls.__tree
+
+        with cls.__lock:
+            if cls.__tree is None or cls.__registry_ids is not ids:
+                latitudes, longitudes = StationRegistry.get_coordinates()
+                valid = ~(np.isnan(latitudes) | np.isnan(longitudes))
+                cls.__positions = np.flatnonzero(valid)
+                cls.__tree = cKDTree(to_unit_vectors(latitudes[valid], longitudes[valid]))
+                cls.__registry_ids = ids
+                cls.__logger.info(f"Spatial index built over {len(cls.__positions)} stations")
+        return cls.__tree
+
+    @classmethod
+    def nearest(cls, latitudes, longitudes, k: int) -> list:
+        """Finds the k nearest stations to each point
+
+        Args:
+            latitudes (array-like): Latitudes of the query points, in degrees
+            longitudes (array-like): Longitudes of the query points, in degrees
+            k (int): Number of stations to return per point
+
+        Returns:
+            list[list[dict]]: For each point, the stations ordered by distance
+        """
+        tree = cls.__get_tree()
+        k = min(k, tree.n)
+        if k == 0:
+            return [[] for _ in range(len(latitudes))]
+
+        chords, indices = tree.query(to_unit_vectors(latitudes, longitudes), k=k)
+        chords = chords.reshape(len(latitudes), k)
+        indices = indices.reshape(len(latitudes), k)
+        return [
+            cls.__to_stations(cls.__positions[point_indices], chord_to_km(point_chords))
+            for point_chords, point_indices in zip(chords, indices)
+        ]
+
+    @classmethod
+    def within(cls, latitudes, longitudes, radius_km: float, limit: int = None) -> list:
+        """Finds the stations within a radius of each point
+
+        Args:
+            latitudes (array-like): Latitudes of the query points, in degrees
+            longitudes (array-like): Longitudes of the query points, in degrees
+            radius_km (float): Search radius in kilometres
+            limit (int, optional): Maximum number of stations per point (closest first)
+
+        Returns:
+            list[list[dict]]: For each point, the stations ordered by distance
+        """
+        tree = cls.__get_tree()
+        points = to_unit_vectors(latitudes, longitudes)
+        neighbours = tree.query_ball_point(points, r=km_to_chord(radius_km))
+
+        results = []
+        for point, point_indices in zip(points, neighbours):
+            point_indices = np.asarray(point_indices, dtype=np.int64)
+            distances = chord_to_km(
+                np.linalg.norm(tree.data[point_indices] - point, axis=1)
+            )
+            order = np.argsort(distances, kind="stable")[:limit]
+            results.append(
+                cls.__to_stations(cls.__positions[point_indices[order]], distances[order])
+            )
+        return results
+
+    @classmethod
+    def __to_stations(cls, positions: np.ndarray, distances: np.ndarray) -> list:
+        """Builds the response entries for the given registry positions"""
+        ids = StationRegistry.get_ids()
+        latitudes, longitudes = StationRegistry.get_coordinates()
+        return [
+            {
+                "station_id": ids[position],
+                "latitude": float(latitudes[position]),
+                "longitude": float(longitudes[position]),
+                "distance_km": round(float(distance), 4),
+            }
+            for position, distance in zip(positions.tolist(), distances.tolist())
+        ]
@@ -0,0 +1,229 @@
+import threading
+import logging
+import json
+import os
+
+
+class Spool:
+    """
+    A static class that keeps the ingested records in an append-only,
+    segment-rotated log on the local disk, so that receiving a message never
+    waits for the database.
+
+    The subscriber appends one JSON line per record to the active segment
+    (segment-<number>.log). A drainer thread reads the records back in batches
+    from the last checkpoint, hands them to a sink (Database.insert_ev_data_batch)
+    and only advances the checkpoint once the sink has committed them, retrying
+    with backoff while the database is down. Segments that were fully drained
+    are deleted.
+
+    Records are flushed to the OS on every append and fsynced when a segment is
+    rotated and before each batch is drained, so a crash of the processor loses
+    nothing that was acknowledged.
+    """
+
+    SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+    BATCH_SIZE = int(os.getenv("SPOOL_BATCH_SIZE", "500"))
+    MAX_BACKOFF_SECONDS = 30.0
+
+    __directory = os.getenv("SPOOL_DIR", "spool")
+    __segment = None
+    __segment_number = 0
+    __lock = threading.Lock()
+    __has_data = threading.Event()
+    __stop_event = threading.Event()
+    __drainer = None
+    __logger = logging.getLogger("spool")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def open(cls):
+        """Opens a new active segment after the ones left by previous runs"""
+        with cls.__lock:
+            if cls.__segment is not None:
+                return
+            os.makedirs(cls.__directory, exist_ok=True)
+            segments = cls.__list_segments()
+            # Segments of a previous run are never appended to, a torn last line stays behind
+            cls.__segment_number = segments[-1] + 1 if segments else 1
+            cls.__segment = open(cls.__segment_path(cls.__segment_number), "ab")
+            if segments:
+                cls.__has_data.set()
+                cls.__logger.info(f"Found {len(segments)} spool segments to drain")
+
+    @classmethod
+    def append(cls, record: dict):
+        """Appends a record to the spool
+
+        Args:
+            record (dict): The ingested record, as received
+
+        Raises:
+            OSError: If the record could not be written
+        """
+        line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        rotated = None
+        with cls.__lock:
+            if cls.__segment is None:
+                raise OSError("Spool is not open")
+            cls.__segment.write(line)
+            cls.__segment.flush()
+            if cls.__segment.tell() >= cls.SEGMENT_BYTES:
+                rotated = cls.__rotate()
+        if rotated is not None:
+            # Synced outside the lock, so other appends do not wait for the disk
+            os.fsync(rotated.fileno())
+            rotated.close()
+        cls.__has_data.set()
+
+    @classmethod
+    def start_drainer(cls, sink):
+        """Starts the thread that replays the spool into the sink
+
+        Args:
+            sink (callable): Receives a list of records and returns True once they
+                             are committed, False if they should be retried later
+        """
+        if cls.__drainer is not None:
+            return
+        cls.open()
+        cls.__drainer = threading.Thread(target=cls.__drain, args=(sink,), name="spool-drainer", daemon=True)
+        cls.__drainer.start()
+
+    @classmethod
+    def stop(cls):
+        """Stops the drainer and syncs the active segment to disk"""
+        cls.__stop_event.set()
+        cls.__has_data.set()
+        with cls.__lock:
+            if cls.__segment is not None:
+                cls.__segment.flush()
+                os.fsync(cls.__segment.fileno())
+
+    @classmethod
+    def __rotate(cls):
+        """Opens the next segment (lock held)
+
+        Returns:
+            The previous segment, flushed, for the caller to sync and close
+        """
+        previous = cls.__segment
+        previous.flush()
+        cls.__segment_number += 1
+        cls.__segment = open(cls.__segment_path(cls.__segment_number), "ab")
+        return previous
+
+    @classmethod
+    def __drain(cls, sink):
+        """Drainer loop: reads batches from the checkpoint and commits them to the sink"""
+        segment, offset = cls.__read_checkpoint()
+        backoff = 1.0
+        while not cls.__stop_event.is_set():
+            # Appends are flushed under the lock, the sync of the active segment
+            # goes through a duplicate of its descriptor so it does not hold the lock
+            with cls.__lock:
+                active = cls.__segment_number
+                descriptor = os.dup(cls.__segment.fileno())
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+            segments = [number for number in cls.__list_segments() if number >= segment]
+            if not segments:
+                segment, offset = active, 0
+                continue
+            if segment < segments[0]:
+                segment, offset = segments[0], 0
+
+            records, next_offset, complete = cls.__read_batch(segment, offset)
+            if records:
+                try:
+                    committed = sink(records)
+                except Exception as e:
+                    cls.__logger.error(f"Spool sink failed: {e}", exc_info=True)
+                    committed = False
+                if not committed:
+                    cls.__logger.warning(f"Could not drain {len(records)} records, retrying in {backoff:.0f}s")
+                    cls.__stop_event.wait(backoff)
+                    backoff = min(backoff * 2, cls.MAX_BACKOFF_SECONDS)
+                    continue
+                backoff = 1.0
+                offset = next_offset
+                cls.__write_checkpoint(segment, offset)
+                continue
+
+            if complete and segment < active:
+                # Fully drained and no longer written to
+                os.remove(cls.__segment_path(segment))
+                segment, offset = segment + 1, 0
+                cls.__write_checkpoint(segment, offset)
+                continue
+
+            cls.__has_data.clear()
+            cls.__has_data.wait(1.0)
+
+    @classmethod
+    def __read_batch(cls, segment: int, offset: int) -> tuple:
+        """Reads up to BATCH_SIZE complete records of a segment from an offset
+
+        Returns:
+            tuple: (records, offset after them, whether the end of the segment was reached)
+        """
+        records = []
+        try:
+            with open(cls.__segment_path(segment), "rb") as f:
+                f.seek(offset)
+                while len(records) < cls.BATCH_SIZE:
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        # End of the segment, or a line still being written
+                        return records, offset, True
+                    offset += len(line)
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        cls.__logger.error(f"Skipping corrupted spool record in segment {segment}")
+        except FileNotFoundError:
+            return [], offset, True
+        return records, offset, False
+
+    @classmethod
+    def __read_checkpoint(cls) -> tuple:
+        """Returns the (segment, offset) of the first record not committed yet"""
+        try:
+            with open(cls.__checkpoint_path(), "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            return int(checkpoint["segment"]), int(checkpoint["offset"])
+        except (OSError, ValueError, KeyError):
+            return 0, 0
+
+    @classmethod
+    def __write_checkpoint(cls, segment: int, offset: int):
+        """Atomically replaces the checkpoint"""
+        tmp_path = cls.__checkpoint_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"segment": segment, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, cls.__checkpoint_path())
+
+    @classmethod
+    def __list_segments(cls) -> list:
+        """Returns the numbers of the segments on disk, in order"""
+        numbers = []
+        for name in os.listdir(cls.__directory):
+            if name.startswith("segment-") and name.endswith(".log"):
+                try:
+                    numbers.append(int(name[len("segment-") : -len(".log")]))
+                except ValueError:
+                    continue
+        return sorted(numbers)
+
+    @classmethod
+    def __segment_path(cls, number: int) -> str:
+        return os.path.join(cls.__directory, f"segment-{number:012d}.log")
+
+    @classmethod
+    def __checkpoint_path(cls) -> str:
+        return os.path.join(cls.__directory, "checkpoint.json")
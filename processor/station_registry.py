@@ -0,0 +1,177 @@
+import numpy as np
+import threading
+import logging
+import json
+
+
+class StationRegistry:
+    """
+    A static class that keeps the charging stations in memory as parallel arrays.
+
+    The stations table never changes after bootstrap, so it is loaded once at
+    startup and station lookups, station responses and ingest validation are
+    answered from here instead of querying the database.
+    """
+
+    __ids = np.empty(0, dtype=object)
+    __latitudes = np.empty(0, dtype=np.float64)
+    __longitudes = np.empty(0, dtype=np.float64)
+    __district_codes = np.empty(0, dtype=np.int16)
+    __municipality_codes = np.empty(0, dtype=np.int16)
+    __parish_codes = np.empty(0, dtype=object)
+    __max_power_kw = np.empty(0, dtype=np.float64)
+    __index = {}
+
+    # Pre-serialised responses, built once when the registry is loaded
+    __stations_json = b"[]"
+    __station_fragments = []
+
+    __loaded = False
+    __lock = threading.Lock()
+    __logger = logging.getLogger("station-registry")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, rows: list):
+        """Loads the registry from the stations table rows
+
+        Args:
+            rows (list[tuple]): Rows with station_id, latitude, longitude,
+                                district code, municipality code, parish code
+                                and maximum admissible power in kW
+        """
+        rows = [row for row in rows if row[0] is not None]
+        size = len(rows)
+
+        ids = np.empty(size, dtype=object)
+        latitudes = np.empty(size, dtype=np.float64)
+        longitudes = np.empty(size, dtype=np.float64)
+        district_codes = np.full(size, -1, dtype=np.int16)
+        municipality_codes = np.full(size, -1, dtype=np.int16)
+        parish_codes = np.full(size, None, dtype=object)
+        max_power_kw = np.full(size, np.nan, dtype=np.float64)
+        index = {}
+
+        for i, (station_id, latitude, longitude, district, municipality, parish, max_power) in enumerate(rows):
+            ids[i] = station_id
+            latitudes[i] = latitude if latitude is not None else np.nan
+            longitudes[i] = longitude if longitude is not None else np.nan
+            if district is not None:
+                district_codes[i] = district
+            if municipality is not None:
+                municipality_codes[i] = municipality
+            parish_codes[i] = parish
+            if max_power is not None:
+                max_power_kw[i] = max_power
+            index[station_id] = i
+
+        # Same layout as the JSON encoder of Flask (sorted keys), with "visited" as the last key
+        fragments = [
+            (
+                station_id,
+                (
+                    '{"latitude": '
+                    + json.dumps(latitude)
+                    + ', "longitude": '
+                    + json.dumps(longitude)
+                    + ', "station_id": '
+                    + json.dumps(station_id)
+                ).encode("utf-8"),
+            )
+            for station_id, latitude, longitude, *_ in rows
+        ]
+        stations_json = b"[" + b", ".join(fragment + b"}" for _, fragment in fragments) + b"]"
+
+        with cls.__lock:
+            cls.__ids = ids
+            cls.__latitudes = latitudes
+            cls.__longitudes = longitudes
+            cls.__district_codes = district_codes
+            cls.__municipality_codes = municipality_codes
+            cls.__parish_codes = parish_codes
+            cls.__max_power_kw = max_power_kw
+            cls.__index = index
+            cls.__station_fragments = fragments
+            cls.__stations_json = stations_json
+            cls.__loaded = size > 0
+
+        cls.__logger.info(f"Loaded {size} stations into the registry")
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the registry holds the stations"""
+        return cls.__loaded
+
+    @classmethod
+    def size(cls) -> int:
+        """Returns the number of stations in the registry"""
+        return len(cls.__ids)
+
+    @classmethod
+    def contains(cls, station_id) -> bool:
+        """Checks if a station exists"""
+        return station_id in cls.__index
+
+    @classmethod
+    def index_of(cls, station_id):
+        """Returns the position of a station in the registry arrays, None if unknown"""
+        return cls.__index.get(station_id)
+
+    @classmethod
+    def get_ids(cls) -> np.ndarray:
+        """Returns the station IDs, ordered by registry position"""
+        return cls.__ids
+
+    @classmethod
+    def get_coordinates(cls) -> tuple:
+        """Returns the latitude and longitude arrays, ordered by registry position"""
+        return cls.__latitudes, cls.__longitudes
+
+    @classmethod
+    def get_region_codes(cls) -> tuple:
+        """Returns the district and municipality code arrays (-1 if unknown)"""
+        return cls.__district_codes, cls.__municipality_codes
+
+    @classmethod
+    def region_codes_of(cls, station_id) -> tuple:
+        """Returns the district, municipality and parish codes of a station (None if unknown)"""
+        position = cls.__index.get(station_id)
+        if position is None:
+            return None, None, None
+        district = int(cls.__district_codes[position])
+        municipality = int(cls.__municipality_codes[position])
+        return (
+            district if district >= 0 else None,
+            municipality if municipality >= 0 else None,
+            cls.__parish_codes[position],
+        )
+
+    @classmethod
+    def max_power_of(cls, station_id):
+        """Returns the maximum admissible power of a station in kW, None if unknown"""
+        position = cls.__index.get(station_id)
+        if position is None or np.isnan(cls.__max_power_kw[position]):
+            return None
+        return float(cls.__max_power_kw[position])
+
+    @classmethod
+    def stations_json(cls) -> bytes:
+        """Returns the JSON list of all stations with ID, latitude and longitude"""
+        return cls.__stations_json
+
+    @classmethod
+    def stations_for_user_json(cls, visited_ids) -> bytes:
+        """Returns the JSON list of all stations with their visit status
+
+        Args:
+            visited_ids (Iterable[str]): IDs of the stations visited by the user
+
+        Returns:
+            bytes: JSON list of stations with ID, latitude, longitude and visited
+        """
+        visited = set(visited_ids)
+        parts = [
+            fragment + (b', "visited": true}' if station_id in visited else b', "visited": false}')
+            for station_id, fragment in cls.__station_fragments
+        ]
+        return b"[" + b", ".join(parts) + b"]"
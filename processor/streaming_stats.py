@@ -0,0 +1,322 @@
+from sketches import HyperLogLog, KllSketch, CountMinSketch, SpaceSaving
+from station_registry import StationRegistry
+from conversions import to_float
+import threading
+import logging
+import json
+import zlib
+import os
+
+
+# Session columns summarised by quantile sketches
+QUANTILE_METRICS = ("charging_duration_hours", "energy_consumed_kwh", "charging_cost_eur")
+
+REGION_LEVELS = ("district", "municipality")
+
+
+class SketchGroup:
+    """The sketches of one station, region or of the whole history"""
+
+    def __init__(self, precision: int, k: int = None):
+        self.sessions = 0
+        self.energy_kwh = 0.0
+        self.users = HyperLogLog(precision)
+        # No quantiles for regions, only for stations and the whole history
+        self.quantiles = {metric: KllSketch(k) for metric in QUANTILE_METRICS} if k else {}
+
+    def add(self, user_id, sessions: int, energy, values: dict = None):
+        self.sessions += sessions
+        self.energy_kwh += energy or 0.0
+        if user_id is not None:
+            self.users.add(user_id)
+        for metric, sketch in self.quantiles.items():
+            sketch.add(values.get(metric) if values else None)
+
+    def summary(self, fractions: list) -> dict:
+        result = {
+            "sessions": self.sessions,
+            "energy_kwh": self.energy_kwh,
+            "distinct_users": self.users.estimate(),
+        }
+        if self.quantiles:
+            result["quantiles"] = {
+                metric: dict(zip((str(fraction) for fraction in fractions), sketch.quantiles(fractions)))
+                for metric, sketch in self.quantiles.items()
+            }
+        return result
+
+    def to_state(self):
+        return {
+            "sessions": self.sessions,
+            "energy_kwh": self.energy_kwh,
+            "users": self.users.to_state(),
+            "quantiles": {metric: sketch.to_state() for metric, sketch in self.quantiles.items()},
+        }
+
+    @classmethod
+    def from_state(cls, state) -> "SketchGroup":
+        group = cls(0)
+        group.sessions = state["sessions"]
+        group.energy_kwh = state["energy_kwh"]
+        group.users = HyperLogLog.from_state(state["users"])
+        group.quantiles = {metric: KllSketch.from_state(sketch) for metric, sketch in state["quantiles"].items()}
+        return group
+
+
+class StreamingStats:
+    """
+    A static class that keeps approximate analytics of every ingested session
+    in mergeable sketches of fixed size, so they are answered in constant time
+    however long the history is:
+
+    - per station, region (district and municipality) and overall: sessions,
+      energy and distinct users (HyperLogLog);
+    - per station and overall: duration, energy and cost quantiles (KLL);
+    - the top stations by energy and by sessions (Space-Saving) and sessions
+      and energy per user (Count-Min).
+
+    The sketches are updated by the insert listener and checkpointed to the
+    ev_sketches table every SKETCH_CHECKPOINT_SECONDS (only the groups that
+    changed) and at shutdown. Without a checkpoint they are rebuilt from the
+    sessions and the daily summary; sessions compacted by the retention job
+    stay in the sketches.
+    """
+
+    STATION_PRECISION = 10
+    GLOBAL_PRECISION = 14
+    STATION_K = 100
+    GLOBAL_K = 200
+    CHECKPOINT_SECONDS = float(os.getenv("SKETCH_CHECKPOINT_SECONDS", "60"))
+
+    __groups = {}
+    __heavy = None
+    __dirty = set()
+    __loaded = False
+    __thread = None
+    __stop_event = threading.Event()
+    __lock = threading.Lock()
+    __logger = logging.getLogger("streaming-stats")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def restore(cls, rows: list) -> bool:
+        """Restores the sketches from the checkpoint rows
+
+        Args:
+            rows (list[tuple]): (name, state) rows of ev_sketches
+
+        Returns:
+            bool: False if there is no checkpoint, so the sketches have to be rebuilt
+        """
+        if not rows:
+            return False
+        groups, heavy = {}, None
+        for name, state in rows:
+            state = json.loads(zlib.decompress(bytes(state)))
+            if name == "heavy":
+                heavy = {key: cls.__heavy_sketch(key).from_state(value) for key, value in state.items()}
+            else:
+                groups[name] = SketchGroup.from_state(state)
+        with cls.__lock:
+            cls.__groups = groups
+            cls.__heavy = heavy or cls.__new_heavy()
+            cls.__dirty = set()
+            cls.__loaded = True
+        cls.__logger.info(f"Restored {len(rows)} sketch groups from the checkpoint")
+        return True
+
+    @classmethod
+    def build(cls, sessions, summaries):
+        """Rebuilds the sketches from the stored history
+
+        Args:
+            sessions (iterable[dict]): Session records, as given to the insert listeners
+            summaries (iterable[tuple]): (user_id, charging_station_id, sessions, energy)
+                                         rows of the sessions compacted into ev_daily_summary
+        """
+        with cls.__lock:
+            cls.__groups = {}
+            cls.__heavy = cls.__new_heavy()
+            count = 0
+            for record in sessions:
+                cls.__add(record.get("user_id"), record.get("charging_station_id"), 1,
+                          to_float(record.get("energy_consumed_kwh")), record)
+                count += 1
+            for user_id, station_id, session_count, energy in summaries:
+                cls.__add(user_id, station_id, session_count, to_float(energy), None)
+                count += session_count
+            # Everything is written by the first checkpoint
+            cls.__dirty = set(cls.__groups) | {"heavy"}
+            cls.__loaded = True
+        cls.__logger.info(f"Built the sketches from {count} sessions")
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Insert listener, adds an ingested session to the sketches"""
+        if not cls.__loaded:
+            return
+        with cls.__lock:
+            cls.__add(record.get("user_id"), record.get("charging_station_id"), 1,
+                      to_float(record.get("energy_consumed_kwh")), record)
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the sketches cover the stored history"""
+        return cls.__loaded
+
+    @classmethod
+    def station(cls, station_id, fractions: list):
+        """Returns the estimates of a station, None if it has no sessions"""
+        with cls.__lock:
+            group = cls.__groups.get(f"station:{station_id}")
+            return group.summary(fractions) if group else None
+
+    @classmethod
+    def region(cls, level: str, code: int):
+        """Returns the estimates of a district or municipality, None if it has no sessions"""
+        with cls.__lock:
+            group = cls.__groups.get(f"{level}:{code}")
+            return group.summary([]) if group else None
+
+    @classmethod
+    def overall(cls, fractions: list) -> dict:
+        """Returns the estimates over every session"""
+        with cls.__lock:
+            group = cls.__groups.get("global")
+            return (group or SketchGroup(cls.GLOBAL_PRECISION, cls.GLOBAL_K)).summary(fractions)
+
+    @classmethod
+    def user(cls, user_id) -> dict:
+        """Returns the estimated sessions and energy of a user (never underestimated)"""
+        with cls.__lock:
+            return {
+                "sessions": round(cls.__heavy["user_sessions"].estimate(user_id)),
+                "energy_kwh": cls.__heavy["user_energy"].estimate(user_id),
+            }
+
+    @classmethod
+    def top_stations(cls, by: str, limit: int) -> list:
+        """Returns the heaviest stations by "energy" or "sessions"
+
+        Each entry has the estimated value and its maximum overestimation.
+        """
+        with cls.__lock:
+            top = cls.__heavy[f"stations_by_{by}"].top(limit)
+        return [{"station_id": station_id, by: value, "error": error} for station_id, value, error in top]
+
+    @classmethod
+    def checkpoint_rows(cls) -> list:
+        """Serialises the groups that changed since the last checkpoint
+
+        The groups are marked clean, so a failed save has to give them back to
+        mark_dirty.
+
+        Returns:
+            list[tuple]: (name, state) rows for ev_sketches
+        """
+        with cls.__lock:
+            rows = [
+                (name, zlib.compress(json.dumps(cls.__state(name)).encode("utf-8")))
+                for name in cls.__dirty
+            ]
+            cls.__dirty = set()
+        return rows
+
+    @classmethod
+    def mark_dirty(cls, names):
+        """Marks groups as changed, to be written by the next checkpoint"""
+        with cls.__lock:
+            cls.__dirty.update(names)
+
+    @classmethod
+    def start_checkpoints(cls, save):
+        """Starts the thread that checkpoints the sketches periodically
+
+        Args:
+            save (callable): Writes a list of checkpoint rows, returns True on success
+        """
+        if cls.__thread is not None:
+            return
+        cls.__thread = threading.Thread(target=cls.__run, args=(save,), name="sketch-checkpoint", daemon=True)
+        cls.__thread.start()
+
+    @classmethod
+    def checkpoint(cls, save) -> bool:
+        """Writes the changed groups with save, keeping them dirty if it fails"""
+        if not cls.__loaded:
+            return True
+        rows = cls.checkpoint_rows()
+        if not rows:
+            return True
+        if save(rows):
+            return True
+        cls.mark_dirty(name for name, _ in rows)
+        return False
+
+    @classmethod
+    def stop(cls, save):
+        """Stops the checkpoint thread and writes a last checkpoint"""
+        cls.__stop_event.set()
+        cls.checkpoint(save)
+
+    @classmethod
+    def __run(cls, save):
+        while not cls.__stop_event.wait(cls.CHECKPOINT_SECONDS):
+            try:
+                cls.checkpoint(save)
+            except Exception as e:
+                cls.__logger.error(f"Sketch checkpoint failed: {e}", exc_info=True)
+
+    @classmethod
+    def __add(cls, user_id, station_id, sessions: int, energy, values):
+        """Adds sessions to every group they belong to, the lock must be held"""
+        names = ["global"]
+        if station_id is not None:
+            names.append(f"station:{station_id}")
+            position = StationRegistry.index_of(station_id)
+            if position is not None:
+                for level, codes in zip(REGION_LEVELS, StationRegistry.get_region_codes()):
+                    if codes[position] >= 0:
+                        names.append(f"{level}:{int(codes[position])}")
+
+        for name in names:
+            group = cls.__groups.get(name)
+            if group is None:
+                group = cls.__groups[name] = cls.__new_group(name)
+            group.add(user_id, sessions, energy, values)
+        cls.__dirty.update(names)
+
+        if station_id is not None:
+            cls.__heavy["stations_by_sessions"].add(station_id, sessions)
+            if energy:
+                cls.__heavy["stations_by_energy"].add(station_id, energy)
+        if user_id is not None:
+            cls.__heavy["user_sessions"].add(user_id, sessions)
+            if energy:
+                cls.__heavy["user_energy"].add(user_id, energy)
+        cls.__dirty.add("heavy")
+
+    @classmethod
+    def __new_group(cls, name: str) -> SketchGroup:
+        if name == "global":
+            return SketchGroup(cls.GLOBAL_PRECISION, cls.GLOBAL_K)
+        if name.startswith("station:"):
+            return SketchGroup(cls.STATION_PRECISION, cls.STATION_K)
+        return SketchGroup(cls.STATION_PRECISION)
+
+    @staticmethod
+    def __heavy_sketch(key: str):
+        return SpaceSaving if key.startswith("stations_by_") else CountMinSketch
+
+    @classmethod
+    def __new_heavy(cls) -> dict:
+        return {
+            key: cls.__heavy_sketch(key)()
+            for key in ("stations_by_energy", "stations_by_sessions", "user_sessions", "user_energy")
+        }
+
+    @classmethod
+    def __state(cls, name: str):
+        if name == "heavy":
+            return {key: sketch.to_state() for key, sketch in cls.__heavy.items()}
+        return cls.__groups[name].to_state()
@@ -3,6 +3,7 @@ import logging
 import os
 import json
 from database import Database
+from spool import Spool
 
 
 __logger = logging.getLogger("mqtt-subscriber")
@@ -45,8 +46,13 @@ def start_mqtt_client():
             ev_data = message_dict.get("data")
 
             if ev_data and isinstance(ev_data, dict):
-                # Call the class method to insert the data
-                Database.insert_ev_data(ev_data)
+                # Spooled to disk and inserted in batches by the drainer, so a slow
+                # or unavailable database never blocks the network thread
+                try:
+                    Spool.append(ev_data)
+                except OSError as e:
+                    __logger.error(f"Could not spool message, inserting directly: {e}")
+                    Database.insert_ev_data(ev_data)
             else:
                 __logger.warning("No 'data' field found in message or it's not a dictionary.")
 
@@ -0,0 +1,417 @@
+from regions import REGION_LEVELS, REGION_COLUMNS
+from conversions import to_float
+import numpy as np
+import threading
+import datetime
+import logging
+import math
+import os
+
+
+# Hourly values kept for every series, in the order of HourlySeries.values
+SERIES_METRICS = ("occupancy", "energy_kwh", "sessions")
+
+# Scopes of the series and the record column of their key ("all" has a single series)
+SERIES_SCOPES = {
+    "all": None,
+    "station": "charging_station_id",
+    "user": "user_id",
+    **{level: REGION_COLUMNS[level] for level in REGION_LEVELS},
+}
+
+DOWNSAMPLING_METHODS = ("lttb", "minmax")
+
+# Sessions are spread over at most this many hours, longer ones are bad data
+MAX_SESSION_HOURS = 168
+
+# Formats of the start and end times sent by the publisher, besides ISO 8601
+TIMESTAMP_FORMATS = ("%d/%m/%y %H:%M", "%d/%m/%Y %H:%M", "%d/%m/%Y %H:%M:%S")
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def parse_timestamp(value):
+    """Returns a record timestamp as a naive datetime, None if it is missing or invalid"""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    value = str(value)
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+    return None
+
+
+def hours_since_epoch(value: datetime.datetime) -> float:
+    """Returns a datetime as hours since 1970-01-01, aware datetimes are taken in UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH).total_seconds() / 3600
+
+
+def split_session(start, end, duration, energy):
+    """Spreads a session over the hours it was charging
+
+    The session lasts from start to end, or for duration hours if end is missing
+    or not after start, capped at MAX_SESSION_HOURS. Each hour gets the fraction
+    of the hour the session was charging in it and the same fraction of the
+    session's energy. Database.init_timeseries_table does the same in SQL.
+
+    Returns:
+        tuple: (first hour, occupancy per hour, energy per hour), hours since the
+               epoch, None if the start time is missing or invalid
+    """
+    start = parse_timestamp(start)
+    if start is None:
+        return None
+    end = parse_timestamp(end)
+    if end is None or end <= start:
+        duration = to_float(duration)
+        end = start + datetime.timedelta(hours=duration) if duration and duration > 0 else start
+    start_hours = hours_since_epoch(start)
+    end_hours = min(hours_since_epoch(end), start_hours + MAX_SESSION_HOURS)
+
+    first = math.floor(start_hours)
+    hours = np.arange(first, max(first, math.ceil(end_hours) - 1) + 1)
+    occupancy = np.clip(np.minimum(end_hours, hours + 1) - np.maximum(start_hours, hours), 0, None)
+    energy = to_float(energy) or 0.0
+    if end_hours > start_hours:
+        energy_share = energy * occupancy / (end_hours - start_hours)
+    else:
+        energy_share = np.zeros(len(hours))
+        energy_share[0] = energy
+    return first, occupancy, energy_share
+
+
+def lttb(values, points: int):
+    """Largest-Triangle-Three-Buckets downsampling of an evenly spaced series
+
+    Keeps the first and last values and, in each of points - 2 buckets, the value
+    forming the largest triangle with the value kept in the previous bucket and
+    the average of the next one, which preserves the visual shape of the series.
+
+    Returns:
+        numpy.ndarray: Indexes of the kept values, in order
+    """
+    count = len(values)
+    if points >= count or points < 3:
+        return np.arange(count)
+    edges = np.append(np.linspace(1, count - 1, points - 1).astype(np.int64), count)
+    kept = np.empty(points, dtype=np.int64)
+    kept[0], kept[-1] = 0, count - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_x = (edges[bucket + 1] + edges[bucket + 2] - 1) / 2
+        next_y = values[edges[bucket + 1] : edges[bucket + 2]].mean()
+        x = np.arange(start, end)
+        areas = np.abs(
+            (previous - next_x) * (values[start:end] - values[previous])
+            - (previous - x) * (next_y - values[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def min_max(values, points: int):
+    """Min/max downsampling: the smallest and largest value of each of points / 2 buckets
+
+    Returns:
+        numpy.ndarray: Indexes of the kept values, in order
+    """
+    count = len(values)
+    if points >= count or points < 2:
+        return np.arange(count)
+    edges = np.linspace(0, count, points // 2 + 1).astype(np.int64)
+    kept = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bucket = values[start:end]
+        low, high = start + int(np.argmin(bucket)), start + int(np.argmax(bucket))
+        kept.extend(sorted({low, high}))
+    return np.array(kept, dtype=np.int64)
+
+
+class HourlySeries:
+    """The hourly values of one scope and key, in arrays indexed by hour"""
+
+    __slots__ = ("origin", "values", "first", "last", "version")
+
+    def __init__(self):
+        # Hour of values[:, 0], the arrays grow in both directions
+        self.origin = 0
+        self.values = np.zeros((len(SERIES_METRICS), 0))
+        # First and last hour with data
+        self.first = None
+        self.last = None
+        self.version = 0
+
+    def add(self, first: int, occupancy, energy, sessions: float):
+        """Adds hourly values starting at the hour first, and sessions started in it"""
+        last = first + len(occupancy) - 1
+        self.reserve(first, last)
+        offset = first - self.origin
+        self.values[0, offset : offset + len(occupancy)] += occupancy
+        self.values[1, offset : offset + len(energy)] += energy
+        self.values[2, offset] += sessions
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+        self.version += 1
+
+    def reserve(self, first: int, last: int):
+        """Grows the arrays to cover the hours first to last, with room to spare"""
+        size = self.values.shape[1]
+        if size and self.origin <= first and last < self.origin + size:
+            return
+        slack = max(size, 24 * 31)
+        origin = min(first, self.origin) if size else first
+        end = max(last + 1, self.origin + size) if size else last + 1
+        if size and first < self.origin:
+            origin -= slack
+        if not size or last >= self.origin + size:
+            end += slack
+        values = np.zeros((len(SERIES_METRICS), end - origin))
+        if size:
+            values[:, self.origin - origin : self.origin - origin + size] = self.values
+        self.origin, self.values = origin, values
+
+    def window(self, metric: int, first: int, last: int):
+        """Returns a copy of the values of a metric from the hour first to last, zeros where unknown"""
+        window = np.zeros(last - first + 1)
+        size = self.values.shape[1]
+        start, end = max(first, self.origin), min(last + 1, self.origin + size)
+        if start < end:
+            window[start - first : end - first] = self.values[metric, start - self.origin : end - self.origin]
+        return window
+
+
+class TimeSeries:
+    """
+    A static class that keeps hourly series of every station, user, region
+    (district, municipality and parish) and of all the sessions: occupancy (the
+    average number of sessions charging during the hour), energy delivered and
+    sessions started.
+
+    The series are pre-bucketed in the ev_hourly_usage table, backfilled from the
+    sessions the first time and kept when the retention job compacts them. They
+    are loaded at startup and updated by the insert listener, which queues the
+    new hourly values for a background thread that adds them to the table every
+    TIMESERIES_FLUSH_SECONDS. Requests read a window of the in-memory arrays and
+    downsample it to a fixed number of points, however long the range is.
+    """
+
+    FLUSH_SECONDS = float(os.getenv("TIMESERIES_FLUSH_SECONDS", "5"))
+
+    # (scope, key) -> HourlySeries
+    __series = {}
+    # (scope, key, hour) -> [occupancy, energy, sessions] not written to the table yet
+    __pending = {}
+    __loaded = False
+    __thread = None
+    __stop_event = threading.Event()
+    __lock = threading.Lock()
+    __logger = logging.getLogger("timeseries")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, rows):
+        """Builds the series from the stored hourly values
+
+        Args:
+            rows (iterable[tuple]): (scope, key, hour, occupancy, energy, sessions)
+                                    rows, hour being hours since the epoch, ordered
+                                    by scope, key and hour
+        """
+        series = {}
+        current, hours, values = None, [], []
+        for scope, key, hour, *hour_values in rows:
+            if (scope, key) != current:
+                if current is not None:
+                    series[current] = cls.__build(hours, values)
+                current, hours, values = (scope, key), [], []
+            hours.append(hour)
+            values.append(hour_values)
+        if current is not None:
+            series[current] = cls.__build(hours, values)
+
+        with cls.__lock:
+            cls.__series = series
+            cls.__loaded = True
+        cls.__logger.info(f"Loaded {len(series)} hourly series")
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Insert listener, adds an ingested session to the series of its station, user and regions"""
+        split = split_session(
+            record.get("charging_start_time"),
+            record.get("charging_end_time"),
+            record.get("charging_duration_hours"),
+            record.get("energy_consumed_kwh"),
+        )
+        if split is None:
+            return
+        first, occupancy, energy = split
+        keys = [("all", "")]
+        for scope, column in SERIES_SCOPES.items():
+            if column is not None and record.get(column) is not None:
+                keys.append((scope, str(record[column])))
+
+        with cls.__lock:
+            for key in keys:
+                if cls.__loaded:
+                    series = cls.__series.get(key)
+                    if series is None:
+                        series = cls.__series[key] = HourlySeries()
+                    series.add(first, occupancy, energy, 1)
+                # Queued even if the series are not loaded, the table must not miss it
+                for offset, values in enumerate(zip(occupancy, energy)):
+                    pending = cls.__pending.setdefault((*key, first + offset), [0.0, 0.0, 0])
+                    pending[0] += float(values[0])
+                    pending[1] += float(values[1])
+                cls.__pending[(*key, first)][2] += 1
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the series cover the stored sessions"""
+        return cls.__loaded
+
+    @classmethod
+    def bounds(cls, scope: str, key: str, start=None, end=None):
+        """Returns the hours of a time range of a series and the version of the series
+
+        Args:
+            scope (str): One of SERIES_SCOPES
+            key (str): Station, user or region code, "" for the "all" scope
+            start (datetime, optional): Start of the range, the first session by default
+            end (datetime, optional): End of the range (exclusive), the last session by default
+
+        Returns:
+            tuple: (first hour, last hour, version), hours since the epoch, the version
+                   changing every time the series changes; None if it has no sessions
+        """
+        with cls.__lock:
+            series = cls.__series.get((scope, key))
+            if series is None:
+                return None
+            first = math.floor(hours_since_epoch(start)) if start else series.first
+            last = math.ceil(hours_since_epoch(end)) - 1 if end else series.last
+            return first, last, series.version
+
+    @classmethod
+    def query(cls, scope: str, key: str, metric: str, first: int, last: int, points=500, method="lttb") -> dict:
+        """Returns the hours first to last of a series, downsampled to at most points values
+
+        Args:
+            scope (str): One of SERIES_SCOPES
+            key (str): Station, user or region code, "" for the "all" scope
+            metric (str): One of SERIES_METRICS
+            first (int): First hour, see bounds
+            last (int): Last hour, see bounds
+            points (int): Maximum number of values returned
+            method (str): "lttb" or "minmax"
+
+        Returns:
+            dict: The range, the number of hours in it, the downsampling used (None
+                  if every hour fits) and the timestamps and values of the kept hours
+        """
+        with cls.__lock:
+            series = cls.__series.get((scope, key))
+            if series is None or last < first:
+                values = np.zeros(0)
+            else:
+                values = series.window(SERIES_METRICS.index(metric), first, last)
+
+        hours = len(values)
+        downsampling = method if hours > points else None
+        if downsampling:
+            kept = (lttb if method == "lttb" else min_max)(values, points)
+        else:
+            kept = np.arange(hours)
+        timestamps = (np.datetime64(first, "h") + kept).astype("datetime64[s]").astype(str)
+        values = values[kept]
+        if metric == "sessions":
+            values = np.rint(values).astype(np.int64)
+        return {
+            "from": str(np.datetime64(first, "h").astype("datetime64[s]")),
+            "to": str(np.datetime64(first + hours, "h").astype("datetime64[s]")),
+            "hours": hours,
+            "downsampling": downsampling,
+            "timestamps": timestamps.tolist(),
+            "values": values.tolist(),
+        }
+
+    @classmethod
+    def pending_rows(cls) -> list:
+        """Takes the hourly values not written to the table yet
+
+        A failed save has to give them back to requeue.
+
+        Returns:
+            list[tuple]: (scope, key, hour, occupancy, energy, sessions) rows, hour
+                         being hours since the epoch
+        """
+        with cls.__lock:
+            pending, cls.__pending = cls.__pending, {}
+        return [(*key, *values) for key, values in pending.items()]
+
+    @classmethod
+    def requeue(cls, rows: list):
+        """Queues rows that could not be written again"""
+        with cls.__lock:
+            for scope, key, hour, occupancy, energy, sessions in rows:
+                pending = cls.__pending.setdefault((scope, key, hour), [0.0, 0.0, 0])
+                pending[0] += occupancy
+                pending[1] += energy
+                pending[2] += sessions
+
+    @classmethod
+    def flush(cls, save) -> bool:
+        """Writes the queued hourly values with save, queueing them again if it fails"""
+        rows = cls.pending_rows()
+        if not rows or save(rows):
+            return True
+        cls.requeue(rows)
+        return False
+
+    @classmethod
+    def start(cls, save):
+        """Starts the thread that adds the queued hourly values to the table
+
+        Args:
+            save (callable): Adds a list of hourly rows to the table, returns True on success
+        """
+        if cls.__thread is not None:
+            return
+        cls.__thread = threading.Thread(target=cls.__run, args=(save,), name="timeseries-writer", daemon=True)
+        cls.__thread.start()
+
+    @classmethod
+    def stop(cls, save):
+        """Stops the writer thread and writes the queued hourly values"""
+        cls.__stop_event.set()
+        if cls.__thread is not None:
+            cls.__thread.join(timeout=5)
+        cls.flush(save)
+
+    @classmethod
+    def __run(cls, save):
+        while not cls.__stop_event.wait(cls.FLUSH_SECONDS):
+            try:
+                cls.flush(save)
+            except Exception as e:
+                cls.__logger.error(f"Time series flush failed: {e}", exc_info=True)
+
+    @staticmethod
+    def __build(hours: list, values: list) -> HourlySeries:
+        hours = np.asarray(hours, dtype=np.int64)
+        series = HourlySeries()
+        series.origin = series.first = int(hours[0])
+        series.last = int(hours[-1])
+        series.values = np.zeros((len(SERIES_METRICS), series.last - series.first + 1))
+        series.values[:, hours - series.origin] = np.asarray(values, dtype=np.float64).T
+        return series
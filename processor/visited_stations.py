@@ -0,0 +1,155 @@
+from station_registry import StationRegistry
+import numpy as np
+import threading
+import logging
+
+
+class VisitedStations:
+    """
+    A static class that keeps, for every user, the set of visited stations.
+
+    Each set is a packed bitmap over the StationRegistry positions (one bit per
+    station, ~4.4 KB for the ~35k Portuguese chargers), built at startup from
+    the sessions table and updated by the ingestion path. Cross-user queries are
+    vectorised OR/AND/sum reductions over the bitmaps.
+    """
+
+    __bitmaps = {}
+    __num_stations = 0
+    __loaded = False
+    __lock = threading.Lock()
+    __logger = logging.getLogger("visited-stations")
+    __logger.setLevel(logging.INFO)
+
+    @classmethod
+    def load(cls, pairs: list):
+        """Builds the bitmaps from the visited (user_id, station_id) pairs
+
+        Args:
+            pairs (list[tuple]): Distinct (user_id, charging_station_id) pairs
+        """
+        if not StationRegistry.is_loaded():
+            cls.__logger.error("Station registry is not loaded, visited stations not built")
+            return
+
+        num_stations = StationRegistry.size()
+        num_bytes = (num_stations + 7) // 8
+        positions_by_user = {}
+        for user_id, station_id in pairs:
+            position = StationRegistry.index_of(station_id)
+            if user_id is not None and position is not None:
+                positions_by_user.setdefault(user_id, []).append(position)
+
+        bitmaps = {}
+        for user_id, positions in positions_by_user.items():
+            bits = np.zeros(num_bytes * 8, dtype=np.uint8)
+            bits[positions] = 1
+            bitmaps[user_id] = np.packbits(bits, bitorder="little")
+
+        with cls.__lock:
+            cls.__bitmaps = bitmaps
+            cls.__num_stations = num_stations
+            cls.__loaded = True
+
+        cls.__logger.info(f"Loaded visited stations for {len(bitmaps)} users")
+
+    @classmethod
+    def is_loaded(cls) -> bool:
+        """Returns whether the visited stations were built"""
+        return cls.__loaded
+
+    @classmethod
+    def on_insert(cls, record: dict):
+        """Marks the station of a newly inserted session as visited by its user"""
+        cls.add(record.get("user_id"), record.get("charging_station_id"))
+
+    @classmethod
+    def add(cls, user_id, station_id):
+        """Marks a station as visited by a user"""
+        position = StationRegistry.index_of(station_id)
+        if not cls.__loaded or user_id is None or position is None:
+            return
+
+        with cls.__lock:
+            bitmap = cls.__bitmaps.get(user_id)
+            if bitmap is None:
+                bitmap = np.zeros((cls.__num_stations + 7) // 8, dtype=np.uint8)
+                cls.__bitmaps[user_id] = bitmap
+            bitmap[position >> 3] |= np.uint8(1 << (position & 7))
+
+    @classmethod
+    def has_user(cls, user_id) -> bool:
+        """Checks if a user has visited any station"""
+        return user_id in cls.__bitmaps
+
+    @classmethod
+    def get_users(cls) -> list:
+        """Returns the users with at least one visited station"""
+        return list(cls.__bitmaps.keys())
+
+    @classmethod
+    def visited_ids(cls, user_id) -> list:
+        """Returns the IDs of the stations visited by a user"""
+        bitmap = cls.__bitmaps.get(user_id)
+        if bitmap is None:
+            return []
+        return cls.__to_ids(bitmap)
+
+    @classmethod
+    def visited_by_any(cls, user_ids: list) -> list:
+        """Returns the IDs of the stations visited by at least one of the users"""
+        bitmaps = cls.__get_bitmaps(user_ids)
+        if not bitmaps:
+            return []
+        return cls.__to_ids(np.bitwise_or.reduce(bitmaps))
+
+    @classmethod
+    def visited_by_all(cls, user_ids: list) -> list:
+        """Returns the IDs of the stations visited by every one of the users"""
+        bitmaps = cls.__get_bitmaps(user_ids)
+        if not bitmaps or len(bitmaps) < len(set(user_ids)):
+            return []
+        return cls.__to_ids(np.bitwise_and.reduce(bitmaps))
+
+    @classmethod
+    def most_shared(cls, top: int, user_ids: list = None) -> list:
+        """Returns the stations visited by the largest number of users
+
+        Args:
+            top (int): Number of stations to return
+            user_ids (list[str], optional): Users to consider, all users if None
+
+        Returns:
+            list[dict]: Stations with their ID and number of distinct users
+        """
+        bitmaps = cls.__get_bitmaps(user_ids if user_ids is not None else cls.get_users())
+        if not bitmaps:
+            return []
+
+        counts = np.zeros(cls.__num_stations, dtype=np.int64)
+        for bitmap in bitmaps:
+            counts += np.unpackbits(bitmap, count=cls.__num_stations, bitorder="little")
+
+        top = min(top, int(np.count_nonzero(counts)))
+        positions = np.argsort(-counts, kind="stable")[:top]
+        ids = StationRegistry.get_ids()
+        return [
+            {"station_id": ids[position], "users": int(counts[position])}
+            for position in positions.tolist()
+        ]
+
+    @classmethod
+    def __get_bitmaps(cls, user_ids: list) -> list:
+        """Returns copies of the bitmaps of the known users among user_ids"""
+        with cls.__lock:
+            return [
+                cls.__bitmaps[user_id].copy()
+                for user_id in dict.fromkeys(user_ids)
+                if user_id in cls.__bitmaps
+            ]
+
+    @classmethod
+    def __to_ids(cls, bitmap: np.ndarray) -> list:
+        """Converts a bitmap to the list of station IDs it contains"""
+        bits = np.unpackbits(bitmap, count=cls.__num_stations, bitorder="little")
+        return StationRegistry.get_ids()[np.flatnonzero(bits)].tolist()
@@ -0,0 +1,159 @@
+from flask.json.provider import DefaultJSONProvider
+from flask import Flask
+import numpy as np  # numpy==2.3.5
+import statistics
+import datetime
+import argparse
+import logging
+import random
+import json
+import time
+import sys
+import os
+
+# The serialisation layer is the one shared by the services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from json_provider import FastJSONProvider, passthrough_response, loads  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("benchmark-json")
+logger.setLevel(logging.INFO)
+
+
+def users_info_payload(rows: int) -> dict:
+    """Returns a payload shaped like /get_all_users_info, with datetimes"""
+    start = datetime.datetime(2024, 1, 1)
+    headers = [
+        "user_id", "vehicle_model", "battery_capacity_kwh", "charging_station_id",
+        "charging_start_time", "charging_end_time", "energy_consumed_kwh",
+        "charging_duration_hours", "charging_rate_kw", "charging_cost_eur", "time_of_day",
+        "day_of_week", "state_of_charge_start_percent", "state_of_charge_end_percent",
+        "distance_driven_since_last_charge_km", "temperature_c", "vehicle_age_years",
+    ]
+    data = []
+    for i in range(rows):
+        begin = start + datetime.timedelta(minutes=37 * i)
+        data.append(
+            {
+                "user_id": f"User_{i % 500}",
+                "vehicle_model": random.choice(("BMW i3", "Tesla Model 3", "Nissan Leaf")),
+                "battery_capacity_kwh": random.uniform(40, 100),
+                "charging_station_id": f"PT-EVS{i % 3000:05d}",
+                "charging_start_time": begin,
+                "charging_end_time": begin + datetime.timedelta(minutes=random.randint(10, 300)),
+                "energy_consumed_kwh": random.uniform(5, 80),
+                "charging_duration_hours": random.uniform(0.1, 5),
+                "charging_rate_kw": random.uniform(3, 150),
+                "charging_cost_eur": random.uniform(1, 40),
+                "time_of_day": "Morning",
+                "day_of_week": "Monday",
+                "state_of_charge_start_percent": random.uniform(0, 60),
+                "state_of_charge_end_percent": random.uniform(60, 100),
+                "distance_driven_since_last_charge_km": random.uniform(10, 400),
+                "temperature_c": random.uniform(-5, 35),
+                "vehicle_age_years": random.randint(0, 10),
+            }
+        )
+    return {"headers": headers, "data": data}
+
+
+def stations_payload(rows: int) -> list:
+    """Returns a payload shaped like /get_stations"""
+    return [
+        {"station_id": f"PT-EVS{i:05d}", "latitude": random.uniform(37, 42), "longitude": random.uniform(-9.5, -6)}
+        for i in range(rows)
+    ]
+
+
+def classify_arrays(rows: int) -> dict:
+    """Returns a clustering result as NumPy arrays, like ml.py builds before converting them"""
+    points = np.random.rand(rows, 2)
+    return {
+        "centroids": np.random.rand(4, 2),
+        "points": points,
+        "labels": np.random.randint(0, 4, rows),
+    }
+
+
+def time_runs(run, iterations):
+    """Returns the latency of each run, in ms"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def compare(name, current, fast, iterations):
+    for _ in range(3):
+        current()
+        fast()
+    current_ms = statistics.median(time_runs(current, iterations))
+    fast_ms = statistics.median(time_runs(fast, iterations))
+    logger.info(
+        f"{name:<32} current {current_ms:9.3f} ms | fast {fast_ms:9.3f} ms | "
+        f"{current_ms / fast_ms if fast_ms else float('inf'):6.1f}x"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares Flask's default JSON encoding with the services' serialisation layer"
+    )
+    parser.add_argument("--rows", type=int, default=20000, help="Sessions, stations and points per payload")
+    parser.add_argument("--iterations", type=int, default=20, help="Runs of each case")
+    args = parser.parse_args()
+
+    fast_app = Flask("fast")
+    fast_app.json = FastJSONProvider(fast_app)
+    flask_app = Flask("current")
+    default_provider = DefaultJSONProvider(flask_app)
+
+    users_info = users_info_payload(args.rows)
+    stations = stations_payload(args.rows)
+    arrays = classify_arrays(args.rows)
+    # What the ML service sends back, already converted to lists
+    clustering = {key: value.tolist() for key, value in arrays.items()}
+    upstream_body = fast_app.json.dumps_bytes(clustering)
+
+    logger.info(f"Median of {args.iterations} runs, {args.rows} rows per payload")
+    with fast_app.test_request_context():
+        compare(
+            "encode users info",
+            lambda: default_provider.dumps(users_info).encode("utf-8"),
+            lambda: fast_app.json.dumps_bytes(users_info),
+            args.iterations,
+        )
+        compare(
+            "encode stations",
+            lambda: default_provider.dumps(stations).encode("utf-8"),
+            lambda: fast_app.json.dumps_bytes(stations),
+            args.iterations,
+        )
+        compare(
+            "encode NumPy clustering",
+            lambda: default_provider.dumps({key: value.tolist() for key, value in arrays.items()}),
+            lambda: fast_app.json.dumps_bytes(arrays),
+            args.iterations,
+        )
+        users_info_body = default_provider.dumps(users_info)
+        compare(
+            "decode users info",
+            lambda: json.loads(users_info_body),
+            lambda: loads(users_info_body),
+            args.iterations,
+        )
+        # jsonify(response.json()) against forwarding the upstream bytes
+        compare(
+            "proxy clustering",
+            lambda: default_provider.response(json.loads(upstream_body)).get_data(),
+            lambda: passthrough_response(upstream_body).get_data(),
+            args.iterations,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import psycopg2  # psycopg2-binary==2.9.11
+import statistics
+import argparse
+import logging
+import time
+import os
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("benchmark-statements")
+logger.setLevel(logging.INFO)
+
+
+def hot_queries(cur):
+    """Returns the hot queries of the processor as (name, sql with $n placeholders, params, types)"""
+    cur.execute("SELECT user_id FROM ev_with_stations WHERE user_id IS NOT NULL LIMIT 1;")
+    username = cur.fetchone()[0]
+    cur.execute("SELECT station_id FROM stations;")
+    station_ids = [row[0] for row in cur.fetchall()]
+
+    return [
+        (
+            "user info",
+            "SELECT * FROM ev_with_stations WHERE user_id = $1",
+            (username,),
+            ("text",),
+        ),
+        (
+            "user info, time range",
+            "SELECT * FROM ev_with_stations WHERE user_id = $1 "
+            "AND charging_start_time >= $2 AND charging_start_time < $3",
+            (username, "2024-01-01", "2024-02-01"),
+            ("text", "timestamp", "timestamp"),
+        ),
+        (
+            "visited stations for user",
+            """
+            SELECT DISTINCT e.charging_station_id
+            FROM (
+                SELECT user_id, charging_station_id FROM ev_with_stations
+                UNION ALL
+                SELECT user_id, charging_station_id FROM ev_daily_summary
+            ) e
+            WHERE e.user_id = $1 AND e.charging_station_id = ANY($2)
+            """,
+            (username, station_ids),
+            ("text", "text[]"),
+        ),
+        (
+            "feature fetch",
+            'SELECT "energy_consumed_kwh", EXTRACT(EPOCH FROM "charging_start_time")::float8 '
+            "FROM ev_with_stations",
+            (),
+            (),
+        ),
+        (
+            "column types",
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = 'ev_with_stations' ORDER BY ordinal_position",
+            (),
+            (),
+        ),
+    ]
+
+
+def plan_time(cur, statement):
+    """Returns the planning time in ms reported by EXPLAIN ANALYZE for a statement"""
+    cur.execute(f"EXPLAIN (ANALYZE, SUMMARY) {statement}")
+    for (line,) in cur.fetchall():
+        if line.startswith("Planning Time"):
+            return float(line.split(":")[1].split()[0])
+    return 0.0
+
+
+def time_runs(run, iterations):
+    """Returns the latency of each run, in ms"""
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def benchmark(conn, name, sql, params, types, iterations):
+    cur = conn.cursor()
+    # Explicit casts on both sides, so both plans get the same parameter types
+    if params:
+        cast_sql = sql
+        for i, type_name in reversed(list(enumerate(types, 1))):
+            cast_sql = cast_sql.replace(f"${i}", f"%s::{type_name}")
+        execute_args = f" ({', '.join(f'%s::{type_name}' for type_name in types)})"
+    else:
+        cast_sql = sql
+        execute_args = ""
+
+    def run_plain():
+        cur.execute(cast_sql, params)
+        cur.fetchall()
+
+    statement = "bench_" + name.replace(" ", "_").replace(",", "")
+    type_list = f" ({', '.join(types)})" if types else ""
+    cur.execute(f"PREPARE {statement}{type_list} AS {sql}")
+
+    def run_prepared():
+        cur.execute(f"EXECUTE {statement}{execute_args}", params)
+        cur.fetchall()
+
+    # Warm-up, so the caches and the plan cache are in the same state for both
+    for _ in range(6):
+        run_plain()
+        run_prepared()
+
+    plain = time_runs(run_plain, iterations)
+    prepared = time_runs(run_prepared, iterations)
+    plain_plan = plan_time(cur, cur.mogrify(cast_sql, params).decode())
+    prepared_plan = plan_time(cur, cur.mogrify(f"EXECUTE {statement}{execute_args}", params).decode())
+    cur.execute(f"DEALLOCATE {statement}")
+    conn.rollback()
+
+    logger.info(
+        f"{name:<28} plain {statistics.median(plain):8.3f} ms (plan {plain_plan:7.3f} ms) | "
+        f"prepared {statistics.median(prepared):8.3f} ms (plan {prepared_plan:7.3f} ms) | "
+        f"saved {statistics.median(plain) - statistics.median(prepared):7.3f} ms/query"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the processor's hot queries sent as plain SQL and as prepared statements"
+    )
+    parser.add_argument("--iterations", type=int, default=200, help="Runs of each query and mode")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        database=os.getenv("DB_NAME"),
+    )
+    try:
+        with conn.cursor() as cur:
+            queries = hot_queries(cur)
+        conn.rollback()
+        logger.info(f"Median of {args.iterations} runs per query (plan = EXPLAIN ANALYZE planning time)")
+        for name, sql, params, types in queries:
+            benchmark(conn, name, sql, params, types, args.iterations)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import requests  # requests==2.32.5
+import statistics
+import threading
+import argparse
+import datetime
+import logging
+import random
+import json
+import time
+import csv
+import os
+
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger("loadtest")
+logger.setLevel(logging.INFO)
+
+# Relative weight of each route in the default mix, roughly what a dashboard session does
+DEFAULT_MIX = "index=1,info=4,stations=2,users=2,classify=1"
+
+# Numeric feature pairs used by /classify
+FEATURE_PAIRS = [
+    ("energy_consumed_kwh", "charging_duration_hours"),
+    ("charging_cost_eur", "energy_consumed_kwh"),
+    ("temperature_c", "charging_rate_kw"),
+    ("battery_capacity_kwh", "distance_driven_since_last_charge_km"),
+]
+
+# Time ranges of /get_info, None for the whole history
+TIME_RANGES = [None, None, ("2024-01-01", "2024-02-01"), ("2024-02-01", None)]
+
+
+def relative_path(rel_path):
+    return os.path.join(os.path.dirname(__file__), rel_path)
+
+
+def parse_mix(mix: str) -> dict:
+    """Parses a route mix such as 'info=4,users=1' into {route: weight}"""
+    weights = {}
+    for entry in mix.split(","):
+        route, _, weight = entry.partition("=")
+        if route.strip() not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}, use one of {', '.join(ROUTES)}")
+        weights[route.strip()] = float(weight or 1)
+    return weights
+
+
+class Scenario:
+    """The users and options the requests are drawn from, fetched once from the dashboard"""
+
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        response = requests.get(f"{self.base_url}/get_users", timeout=timeout)
+        response.raise_for_status()
+        self.users = response.json().get("users") or []
+        if not self.users:
+            logger.warning("The dashboard returned no users, per-user routes use ALL_USERS")
+            self.users = ["ALL_USERS"]
+
+    def username(self):
+        # Some requests for all users, as the dashboard's default view
+        return random.choice(self.users + ["ALL_USERS"])
+
+
+def request_index(session, scenario):
+    return session.get(f"{scenario.base_url}/", timeout=scenario.timeout)
+
+
+def request_info(session, scenario):
+    params = {"username": scenario.username()}
+    time_range = random.choice(TIME_RANGES)
+    if time_range:
+        start, end = time_range
+        params["from"] = start
+        if end:
+            params["to"] = end
+    return session.get(f"{scenario.base_url}/get_info", params=params, timeout=scenario.timeout)
+
+
+def request_stations(session, scenario):
+    params = {"username": scenario.username()}
+    return session.get(f"{scenario.base_url}/get_stations", params=params, timeout=scenario.timeout)
+
+
+def request_users(session, scenario):
+    return session.get(f"{scenario.base_url}/get_users", timeout=scenario.timeout)
+
+
+def request_classify(session, scenario):
+    feat1, feat2 = random.choice(FEATURE_PAIRS)
+    payload = {"feat1": feat1, "feat2": feat2, "mode": random.choice(["summary", "sample"])}
+    return session.post(f"{scenario.base_url}/classify", json=payload, timeout=scenario.timeout)
+
+
+ROUTES = {
+    "index": request_index,
+    "info": request_info,
+    "stations": request_stations,
+    "users": request_users,
+    "classify": request_classify,
+}
+
+
+class Results:
+    """Latencies and errors of one stage, per route"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def add(self, route: str, latency_ms: float, ok: bool):
+        with self.lock:
+            self.latencies.setdefault(route, []).append(latency_ms)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        """Returns throughput, latency percentiles and error rate per route and overall"""
+        with self.lock:
+            latencies = {route: sorted(values) for route, values in self.latencies.items()}
+            errors = dict(self.errors)
+        latencies["all"] = sorted(value for values in latencies.values() for value in values)
+        errors["all"] = sum(errors.values())
+
+        summary = {}
+        for route, values in latencies.items():
+            if not values:
+                continue
+            summary[route] = {
+                "requests": len(values),
+                "rps": len(values) / duration,
+                "p50_ms": percentile(values, 50),
+                "p90_ms": percentile(values, 90),
+                "p99_ms": percentile(values, 99),
+                "max_ms": values[-1],
+                "mean_ms": statistics.fmean(values),
+                "error_rate": errors.get(route, 0) / len(values),
+            }
+        return summary
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = max(int(round(percent / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def run_worker(scenario, routes, weights, results, stop_event, think_seconds, etags):
+    """Closed-loop virtual user: sends a request, waits for the answer, thinks, repeats"""
+    session = requests.Session()
+    cached = {}
+    while not stop_event.is_set():
+        route = random.choices(routes, weights)[0]
+        start = time.perf_counter()
+        try:
+            if etags and route in cached:
+                # Behave like a browser revalidating its cached responses
+                session.headers["If-None-Match"] = cached[route]
+            else:
+                session.headers.pop("If-None-Match", None)
+            response = ROUTES[route](session, scenario)
+            ok = response.status_code < 400
+            if etags and response.headers.get("ETag"):
+                cached[route] = response.headers["ETag"]
+        except requests.RequestException:
+            ok = False
+        results.add(route, (time.perf_counter() - start) * 1000, ok)
+        if think_seconds:
+            stop_event.wait(random.expovariate(1 / think_seconds))
+
+
+def run_stage(scenario, weights, concurrency, seconds, think_seconds, etags) -> dict:
+    """Runs a fixed number of virtual users for some time and summarizes their requests"""
+    results = Results()
+    stop_event = threading.Event()
+    routes, route_weights = list(weights), list(weights.values())
+    workers = [
+        threading.Thread(
+            target=run_worker,
+            args=(scenario, routes, route_weights, results, stop_event, think_seconds, etags),
+            daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    stop_event.wait(seconds)
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+    return results.summary(time.perf_counter() - start)
+
+
+class MqttLoad:
+    """Publishes charging sessions at a fixed rate while the HTTP stages run"""
+
+    def __init__(self, host: str, port: int, rate: float, users: list):
+        import paho.mqtt.client as mqtt  # paho-mqtt==1.6.1, only needed for ingest load
+
+        self.rate = rate
+        self.users = [user for user in users if user != "ALL_USERS"] or ["LoadTest_User"]
+        self.records = self.__read_records()
+        self.published = 0
+        self.failed = 0
+        self.stop_event = threading.Event()
+
+        self.client = mqtt.Client("LoadTest")
+        self.client.username_pw_set("idc_user", "sec123")
+        self.client.tls_set(
+            ca_certs=relative_path("certs/ca.crt"),
+            certfile=relative_path("certs/client.crt"),
+            keyfile=relative_path("certs/client.key"),
+        )
+        self.client.tls_insecure_set(True)
+        self.client.connect(host, port)
+        self.client.loop_start()
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+
+    @staticmethod
+    def __read_records() -> list:
+        with open(
+            relative_path("dataset-EV_with_stations_for_online_simulation.csv"), "r", encoding="utf-8-sig"
+        ) as file:
+            records = []
+            for row in csv.DictReader(file, delimiter=";"):
+                for key, value in row.items():
+                    if value and key not in ("Vehicle Model", "Time of Day", "Day of Week", "Charging Station ID"):
+                        try:
+                            row[key] = float(value)
+                        except ValueError:
+                            pass
+                records.append(row)
+            return records
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def __run(self):
+        interval = 1 / self.rate
+        next_send = time.perf_counter()
+        while not self.stop_event.is_set():
+            record = dict(random.choice(self.records))
+            # A user and a start time make every message a new session, so the
+            # processor's deduplication does not drop the replayed CSV rows
+            record["User ID"] = random.choice(self.users)
+            record["Charging Start Time"] = datetime.datetime.now().isoformat()
+            message = json.dumps({"timestamp": time.time(), "data": record})
+            if self.client.publish("idc/ev", message)[0] == 0:
+                self.published += 1
+            else:
+                self.failed += 1
+            next_send += interval
+            self.stop_event.wait(max(next_send - time.perf_counter(), 0))
+
+
+def print_stage(concurrency: int, summary: dict):
+    logger.info(f"--- {concurrency} concurrent users ---")
+    logger.info(
+        f"{'route':<10}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}"
+    )
+    for route in [*ROUTES, "all"]:
+        stats = summary.get(route)
+        if stats:
+            logger.info(
+                f"{route:<10}{stats['requests']:>9}{stats['rps']:>9.1f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p90_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['max_ms']:>9.1f}"
+                f"{stats['error_rate']:>8.1%}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of the dashboard routes, with an optional MQTT ingest load"
+    )
+    parser.add_argument("--base-url", default="http://localhost", help="Dashboard URL")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Route weights, default {DEFAULT_MIX}")
+    parser.add_argument("--ramp", default="1,5,10,25,50",
+                        help="Concurrent users of each stage, comma separated")
+    parser.add_argument("--stage-seconds", type=float, default=30, help="Duration of each stage")
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="Mean think time between the requests of a user (0: closed loop)")
+    parser.add_argument("--etags", action="store_true",
+                        help="Send If-None-Match with the last ETag of each route, like a browser")
+    parser.add_argument("--timeout", type=float, default=30, help="Request timeout in seconds")
+    parser.add_argument("--mqtt-rate", type=float, default=0,
+                        help="Sessions published per second during the test (0: no ingest load)")
+    parser.add_argument("--mqtt-host", default="localhost")
+    parser.add_argument("--mqtt-port", type=int, default=8883)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    scenario = Scenario(args.base_url, args.timeout)
+    logger.info(f"Loaded {len(scenario.users)} users, route mix {args.mix}")
+
+    mqtt_load = None
+    if args.mqtt_rate > 0:
+        mqtt_load = MqttLoad(args.mqtt_host, args.mqtt_port, args.mqtt_rate, scenario.users)
+        mqtt_load.start()
+        logger.info(f"Publishing {args.mqtt_rate} sessions per second to MQTT")
+
+    stages = []
+    try:
+        for concurrency in (int(value) for value in args.ramp.split(",")):
+            summary = run_stage(
+                scenario, args.mix, concurrency, args.stage_seconds, args.think_ms / 1000, args.etags
+            )
+            print_stage(concurrency, summary)
+            stages.append({"concurrency": concurrency, "routes": summary})
+    finally:
+        if mqtt_load:
+            mqtt_load.stop()
+            logger.info(f"Published {mqtt_load.published} sessions, {mqtt_load.failed} failed")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {
+                    "base_url": args.base_url,
+                    "mix": args.mix,
+                    "mqtt_rate": args.mqtt_rate,
+                    "mqtt_published": mqtt_load.published if mqtt_load else 0,
+                    "stages": stages,
+                },
+                file,
+                indent=2,
+            )
+        logger.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()